@@ -1,6 +1,11 @@
-from typing import Dict, Any
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
 
 from app.api.base_client import BaseAPIClient
+from app.auth.revocations import token_revocations
+
+# Background work started by logins and logouts, kept referenced until it finishes
+_background: Set[asyncio.Task] = set()
 
 
 class AuthAPIClient(BaseAPIClient):
@@ -8,20 +13,24 @@ class AuthAPIClient(BaseAPIClient):
     Client for authentication-related API operations
     """
 
-    async def login(self, email: str, password: str) -> Dict[str, Any]:
+    async def login(self, email: str, password: str,
+                    warm_up: Optional[Callable[..., Awaitable[None]]] = None) -> Dict[str, Any]:
         """
         Authenticate user with email and password
 
         Args:
             email: User email
             password: User password
+            warm_up: Function prefetching data for the first pages, given the
+                request, the tokens and the pending user details; run alongside
+                the user details call and left to finish in the background
 
         Returns:
             Authentication response with tokens and user data
         """
         # Use the JSON login endpoint from the FastAPI backend
-        response = await self.http_client.post(
-            "/auth/login/json",
+        response = await self._request(
+            "POST", "/auth/login/json",
             json={"email": email, "password": password}
         )
 
@@ -32,10 +41,26 @@ class AuthAPIClient(BaseAPIClient):
         self.access_token = auth_data["access_token"]
         self.refresh_token = auth_data["refresh_token"]
 
-        # Get user details with the new token
-        headers = {"Authorization": f"Bearer {self.access_token}"}
-        user_response = await self.http_client.get("/users/me", headers=headers)
-        user_data = await self._handle_response(user_response)
+        async def get_user() -> Dict[str, Any]:
+            headers = {"Authorization": f"Bearer {self.access_token}"}
+            user_response = await self._request("GET", "/users/me", headers=headers)
+            return await self._handle_response(user_response)
+
+        # Get user details with the new token, warming up the caches meanwhile
+        user_task = asyncio.ensure_future(get_user())
+        warm_task = asyncio.ensure_future(warm_up(self.request, auth_data, user_task)) if warm_up is not None else None
+        try:
+            user_data = await user_task
+        except Exception:
+            if warm_task is not None:
+                warm_task.cancel()
+            raise
+
+        if warm_task is not None and not warm_task.done():
+            # The redirect doesn't wait for it, the rows land in the caches as they arrive
+            # and pages asking for a collection still being fetched wait for that fetch
+            _background.add(warm_task)
+            warm_task.add_done_callback(_background.discard)
 
         return {
             "tokens": auth_data,
@@ -53,8 +78,8 @@ class AuthAPIClient(BaseAPIClient):
             raise ValueError("No refresh token available")
 
         # We need to use a direct http_client call here to avoid circular refresh attempts
-        response = await self.http_client.post(
-            "/auth/refresh",
+        response = await self._request(
+            "POST", "/auth/refresh",
             json={"refresh_token": self.refresh_token}
         )
 
@@ -72,15 +97,12 @@ class AuthAPIClient(BaseAPIClient):
 
     async def logout(self) -> None:
         """
-        Log out the current user by invalidating the refresh token
+        Log out the current user, revoking the tokens in the background
+
+        Returns straight away, the backend call is queued and retried if it fails.
         """
         if self.access_token:
-            headers = {"Authorization": f"Bearer {self.access_token}"}
-            try:
-                await self.http_client.post("/auth/logout", headers=headers)
-            except Exception:
-                # Ignore errors on logout, we'll clear the session anyway
-                pass
+            token_revocations.submit(self.http_client, self.access_token)
 
         # Clear tokens from client instance
         self.access_token = None
@@ -1,10 +1,20 @@
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 import json
+import time
 
 import httpx
 from starlette.requests import Request
 
 from app.config import settings
+from app.utils.collection_cache import collection_cache
+from app.utils.listing import ListQuery, Page, paginate, paginate_local, row_id
+from app.utils.page_cache import invalidate_user_pages
+from app.utils.server_timing import get_server_timing
+
+# Whether each list endpoint honours skip and limit, for those that send no total or cursor
+_offset_paging: Dict[str, bool] = {}
+# Most rows each list endpoint sent in one response, no cap on the limit is below that
+_largest_response: Dict[str, int] = {}
 
 
 class BaseAPIClient:
@@ -38,6 +48,40 @@ class BaseAPIClient:
 
         return headers
 
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """
+        Send a request to the API and report its duration to Server-Timing
+
+        Args:
+            method: HTTP method
+            path: API endpoint path
+            **kwargs: Extra arguments passed to httpx
+
+        Returns:
+            Raw response from the API
+        """
+        start = time.perf_counter()
+        try:
+            return await self.http_client.request(method, path, **kwargs)
+        finally:
+            if method.upper() != "GET":
+                # Pages cached for this user may no longer match the backend
+                invalidate_user_pages(self.request)
+
+            timing = get_server_timing(self.request)
+            if timing:
+                # Group calls by method and top-level resource, e.g. "api-get-users"
+                url = httpx.URL(str(path))
+                route = url.path
+                if url.is_absolute_url and route.startswith(self.http_client.base_url.path):
+                    route = route[len(self.http_client.base_url.path):]
+                resource = route.strip("/").split("/")[0] or "root"
+                timing.record(
+                    f"api-{method.lower()}-{resource}",
+                    time.perf_counter() - start,
+                    f"{method.upper()} /{resource}",
+                )
+
     async def _handle_response(self, response: httpx.Response, retry_on_auth_error: bool = True) -> Any:
         """
         Handle API response and return JSON data
@@ -85,7 +129,9 @@ class BaseAPIClient:
 
                         # Retry the original request with new token
                         headers = await self._get_headers()
-                        retried_response = await self.http_client.request(
+                        if "if-match" in response.request.headers:
+                            headers["If-Match"] = response.request.headers["if-match"]
+                        retried_response = await self._request(
                             response.request.method,
                             response.request.url,
                             headers=headers,
@@ -116,11 +162,228 @@ class BaseAPIClient:
             API response data
         """
         headers = await self._get_headers()
-        response = await self.http_client.get(path, headers=headers, params=params)
+        response = await self._request("GET", path, headers=headers, params=params)
         return await self._handle_response(response)
 
+    async def get_versioned(self, path: str, params: Optional[Dict[str, Any]] = None) -> Tuple[Any, Optional[str]]:
+        """
+        Send GET request for an entity that is going to be edited
+
+        Args:
+            path: API endpoint path
+            params: Query parameters
+
+        Returns:
+            API response data and its version, to send back as If-Match
+            when saving it (None if the backend doesn't version it)
+        """
+        headers = await self._get_headers()
+        response = await self._request("GET", path, headers=headers, params=params)
+        data = await self._handle_response(response)
+        return data, self._version(response, data)
+
+    @staticmethod
+    def _version(response: httpx.Response, data: Any) -> Optional[str]:
+        """
+        Get the ETag of a response, or one made from the entity's version field
+        """
+        etag = response.headers.get("ETag")
+        if etag:
+            return etag
+        if isinstance(data, dict) and data.get("version") is not None:
+            return f'"{data["version"]}"'
+        return None
+
+    async def get_page(self, path: str, query: ListQuery, params: Optional[Dict[str, Any]] = None,
+                       search_fields: List[str] = ()) -> Page:
+        """
+        Send GET request for one page of a list
+
+        Pages are requested by cursor when the backend advertised one for
+        the previous page, by offset otherwise.
+
+        Args:
+            path: API endpoint path
+            query: Page, sorting, search and filters to request
+            params: Extra query parameters
+            search_fields: Row fields the search matches when the backend doesn't page
+
+        Returns:
+            The requested page with its total row count
+        """
+        headers = await self._get_headers()
+        params = {**query.api_params(), **(params or {})}
+        response = await self._request("GET", path, headers=headers, params=params)
+        data = await self._handle_response(response)
+
+        total = response.headers.get("X-Total-Count")
+        page = paginate(
+            data,
+            query,
+            int(total) if total and total.isdigit() else None,
+            search_fields,
+            next_cursor=self._link_cursor(response, "next"),
+            previous_cursor=self._link_cursor(response, "prev") or self._link_cursor(response, "previous"),
+        )
+        if page.total is None and not page.keyset and isinstance(data, list) and data:
+            if not await self._pages_by_offset(path, query, params, data):
+                # The whole collection on every page
+                return paginate_local(data, query, search_fields)
+        return page
+
+    async def _pages_by_offset(self, path: str, query: ListQuery, params: Dict[str, Any], data: List[Any]) -> bool:
+        """
+        Check whether a list endpoint honours skip and limit
+
+        Without a total or cursor a backend that ignores paging can't be
+        told from one that pages, when the collection happens to fill a
+        page. Another offset is fetched once per endpoint: the same rows
+        there mean the backend sends the whole collection every time.
+
+        Args:
+            path: API endpoint path
+            query: Query the rows were requested with
+            params: Query parameters the rows were requested with
+            data: Rows the backend sent
+
+        Returns:
+            False if the backend ignored the offset
+        """
+        if path not in _offset_paging:
+            other_skip = query.limit if query.skip == 0 else 0
+            response = await self._request(
+                "GET", path, headers=await self._get_headers(), params={**params, "skip": other_skip}
+            )
+            other = await self._handle_response(response)
+            if not isinstance(other, list):
+                return True
+            _offset_paging[path] = [row_id(row) for row in other] != [row_id(row) for row in data]
+        return _offset_paging[path]
+
+    @staticmethod
+    def _link_cursor(response: httpx.Response, rel: str) -> Optional[str]:
+        """
+        Get the cursor of a neighbouring page from the response's Link header
+        """
+        link = response.links.get(rel)
+        if not link or not link.get("url"):
+            return None
+        return httpx.URL(link["url"]).params.get("cursor")
+
+    async def get_entity(self, kind: str, entity_id: str, path: str) -> Any:
+        """
+        Send GET request for an entity, unless it is in the current user's cache
+
+        Args:
+            kind: Entity kind, e.g. "roles"
+            entity_id: Entity ID
+            path: API endpoint path of the entity
+
+        Returns:
+            API response data
+        """
+        entity = collection_cache.entity(self.request, kind, entity_id)
+        if entity is None:
+            entity = await self.get(path)
+            collection_cache.store_entity(self.request, kind, entity)
+        return entity
+
+    async def get_collection(self, kind: str, path: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get every row of a collection, from the current user's cache when possible
+
+        Args:
+            kind: Entity kind, e.g. "roles"
+            path: API endpoint path of the collection
+
+        Returns:
+            Every row, or None if the collection is too large to keep in memory
+        """
+        return await collection_cache.ensure_collection(self.request, kind, lambda: self.fetch_collection(path))
+
+    async def fetch_collection(self, path: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Fetch a whole collection, or None if the backend only sent part of it
+
+        A backend that states no total may have capped the limit it was
+        sent, so the rows after the last one are asked for: nothing there,
+        or the same rows again from a backend that doesn't page, proves the
+        collection is complete. That extra call is skipped once the endpoint
+        is known not to page, or has already sent more rows in one response
+        than it sent now. Limits the backend rejects leave the list to be
+        paged on the backend.
+        """
+        # One row more than can be cached tells a large collection from one that just fits
+        limit = settings.COLLECTION_CACHE_MAX_ITEMS + 1
+        response, data = await self._fetch_rows(path, {"limit": limit})
+        if not isinstance(data, list) or self._link_cursor(response, "next"):
+            return None
+
+        total = response.headers.get("X-Total-Count")
+        if total and total.isdigit():
+            return data if int(total) <= len(data) else None
+        if not data or len(data) >= limit:
+            return data
+        if _offset_paging.get(path) is False or len(data) < _largest_response.get(path, 0):
+            # Not cut by a cap on the limit
+            return data
+
+        _, rest = await self._fetch_rows(path, {"limit": limit, "skip": len(data)})
+        if isinstance(rest, list) and rest and row_id(rest[0]) == row_id(data[0]):
+            _offset_paging[path] = False
+            return data
+        if rest == []:
+            _largest_response[path] = max(_largest_response.get(path, 0), len(data))
+            return data
+        return None
+
+    async def _fetch_rows(self, path: str, params: Dict[str, Any]) -> Tuple[httpx.Response, Any]:
+        """
+        Send GET request for collection rows, with None for a request the backend rejects
+        """
+        headers = await self._get_headers()
+        response = await self._request("GET", path, headers=headers, params=params)
+        try:
+            return response, await self._handle_response(response)
+        except httpx.HTTPStatusError as e:
+            # Not allowed to see the list at all, the list page reports it
+            if e.response.status_code in (401, 403) or e.response.status_code >= 500:
+                raise
+            return response, None
+
+    async def get_cached_page(self, kind: str, path: str, query: ListQuery, search_fields: List[str] = (),
+                              filters: Optional[Dict[str, Callable[[Dict[str, Any], str], bool]]] = None) -> Page:
+        """
+        Get one page of a list from the current user's cached collection
+
+        The whole collection is fetched once and searched, sorted and sliced
+        in memory for every page after that. Lists that are too large to
+        cache, or filtered in ways that can't be done in memory, are paged
+        on the backend.
+
+        Args:
+            kind: Entity kind, e.g. "roles"
+            path: API endpoint path of the collection
+            query: Page, sorting, search and filters to show
+            search_fields: Row fields the free text search matches against
+            filters: Row tests for the filters that can be applied in memory, by filter name
+
+        Returns:
+            The requested page with its total row count
+        """
+        filters = filters or {}
+        if not query.cursor and all(name in filters for name in query.filters):
+            items = await self.get_collection(kind, path)
+            if items is not None:
+                for name, value in query.filters.items():
+                    items = [item for item in items if filters[name](item, value)]
+                return paginate_local(items, query, search_fields)
+
+        return await self.get_page(path, query, search_fields=search_fields)
+
     async def post(self, path: str, data: Optional[Dict[str, Any]] = None,
-                   json_data: Optional[Dict[str, Any]] = None) -> Any:
+                   json_data: Optional[Dict[str, Any]] = None, params: Optional[Dict[str, Any]] = None,
+                   timeout: Optional[float] = None) -> Any:
         """
         Send POST request to the API
 
@@ -128,18 +391,21 @@ class BaseAPIClient:
             path: API endpoint path
             data: Form data
             json_data: JSON data
+            params: Query parameters
+            timeout: Seconds to wait for the API, API_TIMEOUT by default
 
         Returns:
             API response data
         """
         headers = await self._get_headers()
-        response = await self.http_client.post(
-            path, headers=headers, data=data, json=json_data
+        response = await self._request(
+            "POST", path, headers=headers, data=data, json=json_data, params=params,
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
         )
         return await self._handle_response(response)
 
     async def put(self, path: str, data: Optional[Dict[str, Any]] = None,
-                  json_data: Optional[Dict[str, Any]] = None) -> Any:
+                  json_data: Optional[Dict[str, Any]] = None, if_match: Optional[str] = None) -> Any:
         """
         Send PUT request to the API
 
@@ -147,13 +413,17 @@ class BaseAPIClient:
             path: API endpoint path
             data: Form data
             json_data: JSON data
+            if_match: Version the entity was loaded at, the backend answers
+                412 Precondition Failed if it has changed since
 
         Returns:
             API response data
         """
         headers = await self._get_headers()
-        response = await self.http_client.put(
-            path, headers=headers, data=data, json=json_data
+        if if_match:
+            headers["If-Match"] = if_match
+        response = await self._request(
+            "PUT", path, headers=headers, data=data, json=json_data
         )
         return await self._handle_response(response)
 
@@ -168,5 +438,5 @@ class BaseAPIClient:
             API response data
         """
         headers = await self._get_headers()
-        response = await self.http_client.delete(path, headers=headers)
+        response = await self._request("DELETE", path, headers=headers)
         return await self._handle_response(response)
\ No newline at end of file
@@ -1,6 +1,23 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 from app.api.base_client import BaseAPIClient
+from app.utils.collection_cache import collection_cache
+from app.utils.listing import ListQuery, Page
+from app.utils.search_index import search_indexes
+
+
+# Fields a company update replaces, as sent by the edit form
+COMPANY_FIELDS = (
+    "name", "slug", "display_name", "description", "contact_name", "email", "phone", "address",
+    "tax_id", "registration_number", "is_active",
+)
+
+
+def _is_active_filter(company: Dict[str, Any], value: str) -> bool:
+    """
+    Apply the active_only list filter to a cached company
+    """
+    return value.lower() not in ("true", "1", "t") or bool(company.get("is_active"))
 
 
 class CompaniesAPIClient(BaseAPIClient):
@@ -18,11 +35,31 @@ class CompaniesAPIClient(BaseAPIClient):
         Returns:
             List of company dictionaries
         """
-        params = {}
         if active_only:
-            params["active_only"] = "true"
+            return await self.get("/companies/", params={"active_only": "true"})
+
+        companies = await self.get_collection("companies", "/companies/")
+        if companies is None:
+            companies = await self.get("/companies/")
+        return companies
+
+    async def get_companies_page(self, query: ListQuery) -> Page:
+        """
+        Get one page of companies
 
-        return await self.get("/companies/", params=params)
+        Args:
+            query: Page, sorting, search and filters (active_only) to request
+
+        Returns:
+            Page of company dictionaries with the total count
+        """
+        return await self.get_cached_page(
+            "companies",
+            "/companies/",
+            query,
+            search_fields=["name", "display_name", "slug", "email"],
+            filters={"active_only": _is_active_filter},
+        )
 
     async def get_company(self, company_id: str) -> Dict[str, Any]:
         """
@@ -34,7 +71,21 @@ class CompaniesAPIClient(BaseAPIClient):
         Returns:
             Company details
         """
-        return await self.get(f"/companies/{company_id}")
+        return await self.get_entity("companies", company_id, f"/companies/{company_id}")
+
+    async def get_company_for_edit(self, company_id: str) -> Tuple[Dict[str, Any], Optional[str]]:
+        """
+        Get a specific company by ID, with the version to send back when saving it
+
+        Args:
+            company_id: Company ID
+
+        Returns:
+            Company details and version
+        """
+        company, version = await self.get_versioned(f"/companies/{company_id}")
+        collection_cache.store_entity(self.request, "companies", company)
+        return company, version
 
     async def create_company(self, company_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -46,20 +97,51 @@ class CompaniesAPIClient(BaseAPIClient):
         Returns:
             Created company details
         """
-        return await self.post("/companies", json_data=company_data)
+        company = await self.post("/companies", json_data=company_data)
 
-    async def update_company(self, company_id: str, company_data: Dict[str, Any]) -> Dict[str, Any]:
+        # Keep the cached lists and the typeahead search in step
+        collection_cache.upsert("companies", company, self.request)
+        search_indexes.upsert("companies", company, self.request)
+        return company
+
+    async def update_company(self, company_id: str, company_data: Dict[str, Any],
+                             version: Optional[str] = None) -> Dict[str, Any]:
         """
         Update an existing company
 
         Args:
             company_id: Company ID
             company_data: Updated company data
+            version: Version from get_company_for_edit(), to refuse overwriting newer changes
 
         Returns:
             Updated company details
         """
-        return await self.put(f"/companies/{company_id}", json_data=company_data)
+        company = await self.put(f"/companies/{company_id}", json_data=company_data, if_match=version)
+
+        # Keep the cached lists and the typeahead search in step
+        collection_cache.upsert("companies", company, self.request)
+        search_indexes.upsert("companies", company, self.request)
+        return company
+
+    async def set_company_active(self, company_id: str, active: bool) -> Dict[str, Any]:
+        """
+        Activate or deactivate a company, keeping its other fields
+
+        An update replaces the whole company, so the current one is fetched
+        first and sent back with its version.
+
+        Args:
+            company_id: Company ID
+            active: Whether the company is active
+
+        Returns:
+            Updated company details
+        """
+        company, version = await self.get_company_for_edit(company_id)
+        company_data = {field: company.get(field) for field in COMPANY_FIELDS}
+        company_data["is_active"] = active
+        return await self.update_company(company_id, company_data, version=version)
 
     async def delete_company(self, company_id: str) -> Dict[str, Any]:
         """
@@ -71,19 +153,31 @@ class CompaniesAPIClient(BaseAPIClient):
         Returns:
             Deleted company details
         """
-        return await self.delete(f"/companies/{company_id}")
+        company = await self.delete(f"/companies/{company_id}")
 
-    async def drop_schema(self, company_id: str) -> Dict[str, Any]:
+        # Keep the cached lists and the typeahead search in step
+        collection_cache.remove("companies", company_id)
+        search_indexes.remove("companies", company_id)
+        return company
+
+    async def drop_schema(self, company_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
         """
         Drop the database schema for a company
 
         Args:
             company_id: Company ID
+            timeout: Seconds to wait for the API, API_TIMEOUT by default
 
         Returns:
             Response message
         """
-        return await self.post(f"/companies/{company_id}/drop-schema", params={"confirm": "true"})
+        result = await self.post(
+            f"/companies/{company_id}/drop-schema", params={"confirm": "true"}, timeout=timeout
+        )
+
+        # The company's schema details changed, fetch it again next time
+        collection_cache.expire("companies")
+        return result
 
 
 def get_companies_client(request):
@@ -1,6 +1,10 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 from app.api.base_client import BaseAPIClient
+from app.utils.collection_cache import collection_cache
+from app.utils.listing import ListQuery, Page, paginate_local
+from app.utils.permission_catalog import PermissionCatalog, permission_catalog
+from app.utils.search_index import search_indexes
 
 
 class PermissionsAPIClient(BaseAPIClient):
@@ -24,6 +28,26 @@ class PermissionsAPIClient(BaseAPIClient):
 
         return await self.get("/permissions/", params=params)
 
+    async def get_permissions_page(self, query: ListQuery) -> Page:
+        """
+        Get one page of permissions
+
+        Args:
+            query: Page, sorting, search and filters (module) to request
+
+        Returns:
+            Page of permission dictionaries with the total count
+        """
+        search_fields = ["name", "code", "description", "module"]
+        if query.cursor or set(query.filters) - {"module"}:
+            return await self.get_page("/permissions/", query, search_fields=search_fields)
+
+        # Every user sees the same permissions, page through the shared catalog
+        catalog = await self.get_catalog()
+        module = query.filters.get("module")
+        permissions = list(catalog.by_module.get(module, {}).values()) if module else catalog.permissions
+        return paginate_local(permissions, query, search_fields)
+
     async def get_permission(self, permission_id: str) -> Dict[str, Any]:
         """
         Get a specific permission by ID
@@ -34,7 +58,21 @@ class PermissionsAPIClient(BaseAPIClient):
         Returns:
             Permission details
         """
-        return await self.get(f"/permissions/{permission_id}")
+        return await self.get_entity("permissions", permission_id, f"/permissions/{permission_id}")
+
+    async def get_permission_for_edit(self, permission_id: str) -> Tuple[Dict[str, Any], Optional[str]]:
+        """
+        Get a specific permission by ID, with the version to send back when saving it
+
+        Args:
+            permission_id: Permission ID
+
+        Returns:
+            Permission details and version
+        """
+        permission, version = await self.get_versioned(f"/permissions/{permission_id}")
+        collection_cache.store_entity(self.request, "permissions", permission)
+        return permission, version
 
     async def get_modules(self) -> List[str]:
         """
@@ -45,6 +83,15 @@ class PermissionsAPIClient(BaseAPIClient):
         """
         return await self.get("/permissions/modules")
 
+    async def get_catalog(self) -> PermissionCatalog:
+        """
+        Get the shared permission catalog, fetching it if missing or stale
+
+        Returns:
+            Permission catalog, indexed by ID and by module
+        """
+        return await permission_catalog.ensure_loaded(self.get_permissions, self.get_modules)
+
     async def create_permission(self, permission_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Create a new permission
@@ -55,20 +102,34 @@ class PermissionsAPIClient(BaseAPIClient):
         Returns:
             Created permission details
         """
-        return await self.post("/permissions", json_data=permission_data)
+        permission = await self.post("/permissions", json_data=permission_data)
 
-    async def update_permission(self, permission_id: str, permission_data: Dict[str, Any]) -> Dict[str, Any]:
+        # Keep the catalog, cached entities and the typeahead search in step
+        permission_catalog.upsert(permission)
+        collection_cache.upsert("permissions", permission, self.request)
+        search_indexes.upsert("permissions", permission, self.request)
+        return permission
+
+    async def update_permission(self, permission_id: str, permission_data: Dict[str, Any],
+                                version: Optional[str] = None) -> Dict[str, Any]:
         """
         Update an existing permission
 
         Args:
             permission_id: Permission ID
             permission_data: Updated permission data
+            version: Version from get_permission_for_edit(), to refuse overwriting newer changes
 
         Returns:
             Updated permission details
         """
-        return await self.put(f"/permissions/{permission_id}", json_data=permission_data)
+        permission = await self.put(f"/permissions/{permission_id}", json_data=permission_data, if_match=version)
+
+        # Keep the catalog, cached entities and the typeahead search in step
+        permission_catalog.upsert(permission)
+        collection_cache.upsert("permissions", permission, self.request)
+        search_indexes.upsert("permissions", permission, self.request)
+        return permission
 
     async def delete_permission(self, permission_id: str) -> Dict[str, Any]:
         """
@@ -80,16 +141,31 @@ class PermissionsAPIClient(BaseAPIClient):
         Returns:
             Deleted permission details
         """
-        return await self.delete(f"/permissions/{permission_id}")
+        permission = await self.delete(f"/permissions/{permission_id}")
+
+        # Keep the catalog, cached entities and the typeahead search in step
+        permission_catalog.remove(permission_id)
+        collection_cache.remove("permissions", permission_id)
+        search_indexes.remove("permissions", permission_id)
+        return permission
 
-    async def initialize_permissions(self) -> Dict[str, Any]:
+    async def initialize_permissions(self, timeout: Optional[float] = None) -> Dict[str, Any]:
         """
         Initialize permissions from registry
 
+        Args:
+            timeout: Seconds to wait for the API, API_TIMEOUT by default
+
         Returns:
             Response message
         """
-        return await self.post("/permissions/initialize")
+        result = await self.post("/permissions/initialize", timeout=timeout)
+
+        # The whole permission set may have changed, the catalog, cache and search fetch it again
+        permission_catalog.expire()
+        collection_cache.expire("permissions")
+        search_indexes.expire("permissions")
+        return result
 
 
 def get_permissions_client(request):
@@ -1,6 +1,10 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 from app.api.base_client import BaseAPIClient
+from app.utils.collection_cache import collection_cache
+from app.utils.listing import ListQuery, Page
+from app.utils.fragment_cache import fragment_cache
+from app.utils.search_index import search_indexes
 
 
 class RolesAPIClient(BaseAPIClient):
@@ -15,7 +19,22 @@ class RolesAPIClient(BaseAPIClient):
         Returns:
             List of role dictionaries
         """
-        return await self.get("/roles/")
+        roles = await self.get_collection("roles", "/roles/")
+        if roles is None:
+            roles = await self.get("/roles/")
+        return roles
+
+    async def get_roles_page(self, query: ListQuery) -> Page:
+        """
+        Get one page of roles
+
+        Args:
+            query: Page, sorting and search to request
+
+        Returns:
+            Page of role dictionaries with the total count
+        """
+        return await self.get_cached_page("roles", "/roles/", query, search_fields=["name", "description"])
 
     async def get_role(self, role_id: str) -> Dict[str, Any]:
         """
@@ -27,7 +46,21 @@ class RolesAPIClient(BaseAPIClient):
         Returns:
             Role details
         """
-        return await self.get(f"/roles/{role_id}")
+        return await self.get_entity("roles", role_id, f"/roles/{role_id}")
+
+    async def get_role_for_edit(self, role_id: str) -> Tuple[Dict[str, Any], Optional[str]]:
+        """
+        Get a specific role by ID, with the version to send back when saving it
+
+        Args:
+            role_id: Role ID
+
+        Returns:
+            Role details and version
+        """
+        role, version = await self.get_versioned(f"/roles/{role_id}")
+        collection_cache.store_entity(self.request, "roles", role)
+        return role, version
 
     async def create_role(self, role_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -39,20 +72,38 @@ class RolesAPIClient(BaseAPIClient):
         Returns:
             Created role details
         """
-        return await self.post("/roles", json_data=role_data)
+        role = await self.post("/roles", json_data=role_data)
 
-    async def update_role(self, role_id: str, role_data: Dict[str, Any]) -> Dict[str, Any]:
+        # Cached navbar and sidebar fragments may show stale role data
+        fragment_cache.invalidate("roles")
+
+        # Keep the cached lists and the typeahead search in step
+        collection_cache.upsert("roles", role, self.request)
+        search_indexes.upsert("roles", role, self.request)
+        return role
+
+    async def update_role(self, role_id: str, role_data: Dict[str, Any],
+                          version: Optional[str] = None) -> Dict[str, Any]:
         """
         Update an existing role
 
         Args:
             role_id: Role ID
             role_data: Updated role data
+            version: Version from get_role_for_edit(), to refuse overwriting newer changes
 
         Returns:
             Updated role details
         """
-        return await self.put(f"/roles/{role_id}", json_data=role_data)
+        role = await self.put(f"/roles/{role_id}", json_data=role_data, if_match=version)
+
+        # Cached navbar and sidebar fragments may show stale role data
+        fragment_cache.invalidate("roles")
+
+        # Keep the cached lists and the typeahead search in step
+        collection_cache.upsert("roles", role, self.request)
+        search_indexes.upsert("roles", role, self.request)
+        return role
 
     async def delete_role(self, role_id: str) -> Dict[str, Any]:
         """
@@ -64,7 +115,15 @@ class RolesAPIClient(BaseAPIClient):
         Returns:
             Deleted role details
         """
-        return await self.delete(f"/roles/{role_id}")
+        role = await self.delete(f"/roles/{role_id}")
+
+        # Cached navbar and sidebar fragments may show stale role data
+        fragment_cache.invalidate("roles")
+
+        # Keep the cached lists and the typeahead search in step
+        collection_cache.remove("roles", role_id)
+        search_indexes.remove("roles", role_id)
+        return role
 
     async def update_role_permissions(self, role_id: str,
                                       add_permission_ids: List[str] = None,
@@ -86,7 +145,14 @@ class RolesAPIClient(BaseAPIClient):
         if remove_permission_ids:
             data["remove_permission_ids"] = remove_permission_ids
 
-        return await self.put(f"/roles/{role_id}/permissions", json_data=data)
+        role = await self.put(f"/roles/{role_id}/permissions", json_data=data)
+
+        # Cached navbar and sidebar fragments may show stale role data
+        fragment_cache.invalidate("roles")
+
+        # Keep the cached lists in step
+        collection_cache.upsert("roles", role, self.request)
+        return role
 
 
 def get_roles_client(request):
@@ -1,6 +1,7 @@
 from typing import List, Dict, Any, Optional
 
 from app.api.base_client import BaseAPIClient
+from app.utils.fragment_cache import fragment_cache
 
 
 class SitesAPIClient(BaseAPIClient):
@@ -51,7 +52,11 @@ class SitesAPIClient(BaseAPIClient):
         Returns:
             Created site details
         """
-        return await self.post("/sites", json_data=site_data)
+        site = await self.post("/sites", json_data=site_data)
+
+        # Cached navbar fragments list the sites
+        fragment_cache.invalidate("sites")
+        return site
 
     async def update_site(self, site_id: str, site_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -64,7 +69,11 @@ class SitesAPIClient(BaseAPIClient):
         Returns:
             Updated site details
         """
-        return await self.put(f"/sites/{site_id}", json_data=site_data)
+        site = await self.put(f"/sites/{site_id}", json_data=site_data)
+
+        # Cached navbar fragments list the sites
+        fragment_cache.invalidate("sites")
+        return site
 
     async def delete_site(self, site_id: str) -> Dict[str, Any]:
         """
@@ -76,7 +85,11 @@ class SitesAPIClient(BaseAPIClient):
         Returns:
             Deleted site details
         """
-        return await self.delete(f"/sites/{site_id}")
+        site = await self.delete(f"/sites/{site_id}")
+
+        # Cached navbar fragments list the sites
+        fragment_cache.invalidate("sites")
+        return site
 
 
 def get_sites_client(request):
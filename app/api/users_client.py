@@ -1,6 +1,12 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 from app.api.base_client import BaseAPIClient
+from app.utils.collection_cache import collection_cache
+from app.utils.listing import ListQuery, Page
+from app.utils.search_index import search_indexes
+
+# Fields a user update replaces, as sent by the edit form (without the password)
+USER_FIELDS = ("email", "username", "name", "surname", "telephone", "role", "is_active")
 
 
 class UsersAPIClient(BaseAPIClient):
@@ -30,6 +36,20 @@ class UsersAPIClient(BaseAPIClient):
 
         return await self.get("/users", params=params)
 
+    async def get_users_page(self, query: ListQuery) -> Page:
+        """
+        Get one page of users
+
+        Args:
+            query: Page, sorting, search and filters (company_id, site_id) to request
+
+        Returns:
+            Page of user dictionaries with the total count
+        """
+        return await self.get_cached_page(
+            "users", "/users", query, search_fields=["username", "email", "first_name", "last_name"]
+        )
+
     async def get_user(self, user_id: str) -> Dict[str, Any]:
         """
         Get a specific user by ID
@@ -40,7 +60,21 @@ class UsersAPIClient(BaseAPIClient):
         Returns:
             User details
         """
-        return await self.get(f"/users/{user_id}")
+        return await self.get_entity("users", user_id, f"/users/{user_id}")
+
+    async def get_user_for_edit(self, user_id: str) -> Tuple[Dict[str, Any], Optional[str]]:
+        """
+        Get a specific user by ID, with the version to send back when saving it
+
+        Args:
+            user_id: User ID
+
+        Returns:
+            User details and version
+        """
+        user, version = await self.get_versioned(f"/users/{user_id}")
+        collection_cache.store_entity(self.request, "users", user)
+        return user, version
 
     async def get_current_user(self) -> Dict[str, Any]:
         """
@@ -61,20 +95,51 @@ class UsersAPIClient(BaseAPIClient):
         Returns:
             Created user details
         """
-        return await self.post("/users", json_data=user_data)
+        user = await self.post("/users", json_data=user_data)
+
+        # Keep the cached lists and the typeahead search in step
+        collection_cache.upsert("users", user, self.request)
+        search_indexes.upsert("users", user, self.request)
+        return user
 
-    async def update_user(self, user_id: str, user_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def update_user(self, user_id: str, user_data: Dict[str, Any],
+                          version: Optional[str] = None) -> Dict[str, Any]:
         """
         Update an existing user
 
         Args:
             user_id: User ID
             user_data: Updated user data
+            version: Version from get_user_for_edit(), to refuse overwriting newer changes
+
+        Returns:
+            Updated user details
+        """
+        user = await self.put(f"/users/{user_id}", json_data=user_data, if_match=version)
+
+        # Keep the cached lists and the typeahead search in step
+        collection_cache.upsert("users", user, self.request)
+        search_indexes.upsert("users", user, self.request)
+        return user
+
+    async def set_user_active(self, user_id: str, active: bool) -> Dict[str, Any]:
+        """
+        Activate or deactivate a user, keeping their other fields
+
+        An update replaces the whole user, so the current one is fetched
+        first and sent back with its version.
+
+        Args:
+            user_id: User ID
+            active: Whether the user is active
 
         Returns:
             Updated user details
         """
-        return await self.put(f"/users/{user_id}", json_data=user_data)
+        user, version = await self.get_user_for_edit(user_id)
+        user_data = {field: user.get(field) for field in USER_FIELDS}
+        user_data["is_active"] = active
+        return await self.update_user(user_id, user_data, version=version)
 
     async def delete_user(self, user_id: str) -> Dict[str, Any]:
         """
@@ -86,7 +151,12 @@ class UsersAPIClient(BaseAPIClient):
         Returns:
             Deleted user details
         """
-        return await self.delete(f"/users/{user_id}")
+        user = await self.delete(f"/users/{user_id}")
+
+        # Keep the cached lists and the typeahead search in step
+        collection_cache.remove("users", user_id)
+        search_indexes.remove("users", user_id)
+        return user
 
 
 def get_users_client(request):
@@ -5,6 +5,9 @@ import httpx
 from starlette.requests import Request
 
 from app.config import settings
+from app.utils.collection_cache import collection_cache
+from app.utils.page_cache import invalidate_user_pages
+from app.utils.search_index import search_indexes
 
 
 class APIClient:
@@ -91,6 +94,11 @@ class APIClient:
         response = await self.http_client.post(
             path, headers=headers, data=data, json=json_data
         )
+
+        # Pages, collections cached for this user and search results may no longer match the backend
+        invalidate_user_pages(self.request)
+        collection_cache.expire_path(path)
+        search_indexes.expire_path(path)
         return await self._handle_response(response)
 
     async def put(self, path: str, data: Optional[Dict[str, Any]] = None,
@@ -110,6 +118,11 @@ class APIClient:
         response = await self.http_client.put(
             path, headers=headers, data=data, json=json_data
         )
+
+        # Pages, collections cached for this user and search results may no longer match the backend
+        invalidate_user_pages(self.request)
+        collection_cache.expire_path(path)
+        search_indexes.expire_path(path)
         return await self._handle_response(response)
 
     async def delete(self, path: str) -> Any:
@@ -124,6 +137,11 @@ class APIClient:
         """
         headers = await self._get_headers()
         response = await self.http_client.delete(path, headers=headers)
+
+        # Pages, collections cached for this user and search results may no longer match the backend
+        invalidate_user_pages(self.request)
+        collection_cache.expire_path(path)
+        search_indexes.expire_path(path)
         return await self._handle_response(response)
 
     async def login(self, email: str, password: str) -> Dict[str, Any]:
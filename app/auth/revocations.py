@@ -0,0 +1,130 @@
+# app/auth/revocations.py
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.config import settings
+
+
+class TokenRevocations:
+    """
+    Revokes the tokens of logged out sessions in the background
+
+    Logging out clears the session straight away; the backend call that
+    invalidates the tokens is queued here so a slow backend never holds up
+    the redirect. Failed calls (network errors, 429 and 5xx answers) are
+    retried with a growing delay, other answers are final: a 401 means the
+    token is no longer valid anyway.
+    """
+
+    def __init__(self, workers: int, max_pending: int, retries: int, retry_delay: float):
+        """
+        Initialize a stopped queue
+
+        Args:
+            workers: Revocations sent at once
+            max_pending: Revocations waiting before new ones are dropped
+            retries: Attempts after the first one fails
+            retry_delay: Seconds before the first retry, doubled for each one after
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.queue: Optional["asyncio.Queue[Tuple[httpx.AsyncClient, str]]"] = None
+        self._tasks: List[asyncio.Task] = []
+        self.stats = {"revoked": 0, "failed": 0, "dropped": 0}
+
+    def start(self) -> None:
+        """
+        Start the workers, called on application startup
+        """
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 5) -> None:
+        """
+        Send the revocations still queued, then stop the workers
+
+        Args:
+            timeout: Seconds to wait for the queue to drain
+        """
+        if self.queue is not None:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                print(f"Shutting down with {self.queue.qsize()} token revocations unsent")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, http_client: httpx.AsyncClient, access_token: str) -> None:
+        """
+        Queue a session's tokens for revocation
+
+        Args:
+            http_client: Shared API client
+            access_token: Access token of the session being logged out
+        """
+        if self.queue is None:
+            raise RuntimeError("The token revocation queue hasn't been started")
+        try:
+            self.queue.put_nowait((http_client, access_token))
+        except asyncio.QueueFull:
+            # The tokens still expire on their own
+            self.stats["dropped"] += 1
+            print("Token revocation queue full, dropping a logout")
+
+    async def _worker(self) -> None:
+        """
+        Send queued revocations one at a time
+        """
+        while True:
+            http_client, access_token = await self.queue.get()
+            try:
+                await self._revoke(http_client, access_token)
+            finally:
+                self.queue.task_done()
+
+    async def _revoke(self, http_client: httpx.AsyncClient, access_token: str) -> None:
+        """
+        Call the backend logout endpoint, retrying transient failures
+        """
+        headers = {"Authorization": f"Bearer {access_token}"}
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                response = await http_client.post("/auth/logout", headers=headers)
+                if response.status_code != 429 and response.status_code < 500:
+                    self.stats["revoked"] += 1
+                    return
+                error = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                error = str(e) or type(e).__name__
+
+            if attempt < self.retries:
+                await asyncio.sleep(delay)
+                delay *= 2
+
+        self.stats["failed"] += 1
+        print(f"Error revoking tokens on logout: {error}")
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Get the number of revocations waiting and their outcomes
+        """
+        return {
+            "pending": self.queue.qsize() if self.queue is not None else 0,
+            **self.stats,
+        }
+
+
+# Process-wide token revocation queue
+token_revocations = TokenRevocations(
+    settings.LOGOUT_REVOKE_WORKERS,
+    settings.LOGOUT_REVOKE_QUEUE_SIZE,
+    settings.LOGOUT_REVOKE_RETRIES,
+    settings.LOGOUT_REVOKE_RETRY_DELAY,
+)
@@ -1,20 +1,19 @@
 from starlette.requests import Request
 from starlette.responses import RedirectResponse
 from starlette.routing import Route
-from starlette.templating import Jinja2Templates
-from pathlib import Path
 
 import httpx
 from app.api.auth_client import get_auth_client
+from app.auth.warm_up import warm_up
 from app.config import settings
-
-# Get base directory path (project root)
-BASE_DIR = Path(__file__).parent.parent.parent
-
-# Initialize templates
-templates = Jinja2Templates(directory=BASE_DIR / "templates")
+from app.templating import templates
+from app.utils.collection_cache import collection_cache
+from app.utils.fragment_cache import fragment_cache
+from app.utils.page_cache import anonymous_page_cache, invalidate_user_pages
+from app.utils.search_index import search_indexes
 
 
+@anonymous_page_cache
 async def login_page(request: Request):
     """
     Render login page
@@ -58,8 +57,8 @@ async def login(request: Request):
         # Get auth client
         auth_client = get_auth_client(request)
 
-        # Attempt to login
-        auth_data = await auth_client.login(email, password)
+        # Attempt to login, prefetching the first pages' data meanwhile
+        auth_data = await auth_client.login(email, password, warm_up=warm_up if settings.LOGIN_WARM_UP else None)
 
         # Store tokens in session
         request.session[settings.AUTH_TOKEN_NAME] = auth_data["tokens"]["access_token"]
@@ -109,24 +108,42 @@ async def login(request: Request):
         return RedirectResponse(url="/auth/login", status_code=302)
 
 
+def forget_user_caches(request: Request) -> None:
+    """
+    Drop everything cached for the current user's session
+
+    Args:
+        request: The logout request, still carrying the user
+    """
+    identity = request.user.identity
+    invalidate_user_pages(request)
+    collection_cache.forget(identity)
+    search_indexes.forget(identity)
+    fragment_cache.forget(identity)
+
+
 async def logout(request: Request):
     """
     Log out the current user
+
+    The session and the user's caches are cleared straight away, the
+    backend revokes the tokens in the background.
     """
     # If user is not authenticated, redirect to login
     if "user" not in request.scope or not request.user.is_authenticated:
         return RedirectResponse(url="/auth/login", status_code=302)
 
     try:
-        # Get auth client
+        # Queue the token revocation in API
         auth_client = get_auth_client(request)
-
-        # Log out user in API
         await auth_client.logout()
 
-    except Exception:
-        # Ignore errors, we'll clear the session anyway
-        pass
+    except Exception as e:
+        # Don't keep the user logged in, the tokens still expire on their own
+        print(f"Error queueing token revocation: {e}")
+
+    # Forget the pages, lists and search results cached for this user
+    forget_user_caches(request)
 
     # Clear session
     if "session" in request.scope:
@@ -141,6 +158,7 @@ async def logout(request: Request):
     return RedirectResponse(url="/auth/login", status_code=302)
 
 
+@anonymous_page_cache
 async def forgot_password_page(request: Request):
     """
     Render forgot password page
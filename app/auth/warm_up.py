@@ -0,0 +1,106 @@
+# app/auth/warm_up.py
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+from starlette.requests import Request
+
+from app.api.companies_client import CompaniesAPIClient
+from app.api.permissions_client import PermissionsAPIClient
+from app.api.roles_client import RolesAPIClient
+from app.api.sites_client import SitesAPIClient
+from app.config import settings
+from app.dashboard.routes import dashboard_sites_key
+from app.middleware import User, UnauthenticatedUser
+from app.utils.collection_cache import collection_cache
+from app.utils.fragment_cache import fragment_cache
+
+
+def session_request(request: Request, tokens: Dict[str, Any], user_data: Optional[Dict[str, Any]] = None) -> Request:
+    """
+    Build a request as the session being logged in will make it
+
+    API clients read the tokens from the session and the caches are keyed
+    by the user, neither of which the login request has yet.
+
+    Args:
+        request: The login request
+        tokens: Tokens returned by the login endpoint
+        user_data: The user's details, once known
+
+    Returns:
+        Request carrying the new session and, with user_data, the user
+    """
+    session = {
+        settings.AUTH_TOKEN_NAME: tokens["access_token"],
+        settings.AUTH_REFRESH_TOKEN_NAME: tokens["refresh_token"],
+    }
+    user = UnauthenticatedUser()
+    if user_data is not None:
+        session["user_info"] = user_data
+        user = User(
+            user_id=str(user_data.get("id", "")),
+            email=user_data.get("email", ""),
+            username=user_data.get("username", ""),
+            role=user_data.get("role", ""),
+            access_token=tokens["access_token"],
+            refresh_token=tokens["refresh_token"],
+        )
+    return Request({**request.scope, "session": session, "user": user}, request.receive)
+
+
+async def warm_up(request: Request, tokens: Dict[str, Any], user: Awaitable[Dict[str, Any]]) -> None:
+    """
+    Fetch what the first pages after login need while the user's details load
+
+    The sites for the dashboard dropdown, the companies, the roles with
+    their permissions and the permission catalog are fetched at once, with
+    the new token. Once the user is known the rows are stored in the same
+    caches the pages read, so the dashboard and the first list pages don't
+    wait for the backend. Anything the user isn't allowed to see, or that
+    fails, is left for the page to fetch as usual.
+
+    Args:
+        request: The login request
+        tokens: Tokens returned by the login endpoint
+        user: The pending /users/me call
+    """
+    # Start every fetch now, they only need the token
+    token_request = session_request(request, tokens)
+    sites = asyncio.ensure_future(SitesAPIClient(token_request).get_sites())
+    companies = asyncio.ensure_future(CompaniesAPIClient(token_request).fetch_collection("/companies/"))
+    roles = asyncio.ensure_future(RolesAPIClient(token_request).fetch_collection("/roles/"))
+    catalog = asyncio.ensure_future(PermissionsAPIClient(token_request).get_catalog())
+    tasks = (sites, companies, roles, catalog)
+
+    try:
+        user_request = session_request(request, tokens, await user)
+
+        async def store_sites():
+            fragment_cache.set(
+                dashboard_sites_key(user_request, None), await sites, settings.FRAGMENT_CACHE_TTL, tags=("sites",)
+            )
+
+        # Store each result under the user as soon as it arrives
+        results = await asyncio.gather(
+            store_sites(),
+            collection_cache.ensure_collection(user_request, "companies", lambda: companies),
+            collection_cache.ensure_collection(user_request, "roles", lambda: roles),
+            catalog,
+            return_exceptions=True,
+        )
+        failed = [name for name, result in zip(("sites", "companies", "roles", "catalog"), results)
+                  if isinstance(result, Exception)]
+        if failed:
+            print(f"Login warm-up skipped: {', '.join(failed)}")
+
+    except Exception as e:
+        # The login itself failed, and reports it
+        print(f"Login warm-up cancelled: {e}")
+
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                # Mark errors of results nobody waited for as handled
+                task.exception()
@@ -1,54 +1,161 @@
 # app/companies/routes.py
+from typing import Dict, List, Optional
+
 from starlette.requests import Request
 from starlette.responses import RedirectResponse, JSONResponse
 from starlette.routing import Route
-from starlette.templating import Jinja2Templates
 from starlette.authentication import requires
-from pathlib import Path
 
 import httpx
 from app.api.companies_client import get_companies_client
+from app.config import settings
 from app.dependencies import permission_required
+from app.templating import templates
+from app.utils.bulk import BulkResult, run_bulk, selected_ids
+from app.utils.export import export_format, export_response
+from app.utils.jobs import Job, JobAlreadyRunning, JobQueueFull, job_runner
+from app.utils.listing import ListQuery
+from app.utils.page_cache import user_page_cache
 
-# Get base directory path (project root)
-BASE_DIR = Path(__file__).parent.parent.parent
+# Bulk actions on the companies list, with the past tense used in messages
+BULK_ACTIONS = {
+    "delete": "deleted",
+    "activate": "activated",
+    "deactivate": "deactivated",
+}
 
-# Initialize templates
-templates = Jinja2Templates(directory=BASE_DIR / "templates")
+# Company fields in exported lists, in column order
+EXPORT_COLUMNS = ("id", "name", "display_name", "slug", "schema_name", "email", "phone", "is_active")
+
+
+def companies_query(request: Request) -> ListQuery:
+    """
+    Read the companies list query (page, sorting, search and filters) from the query string
+    """
+    return ListQuery.from_request(
+        request,
+        sort_keys=("name", "slug", "schema_name", "email", "is_active"),
+        filters=("active_only",),
+        default_sort="name",
+    )
 
 
 @requires(["authenticated"])
 @permission_required(["view_companies"])
+@user_page_cache(ttl=5)
 async def companies_list(request: Request):
     """
     Render companies list page
     """
+    return await companies_list_response(request)
+
+
+async def companies_list_response(request: Request, bulk: Optional[BulkResult] = None,
+                                  notices: Optional[List[Dict[str, str]]] = None):
+    """
+    Render the companies list, or just its table for HTMX requests
+
+    Args:
+        request: The current request, with the list query in its query string
+        bulk: Outcome of a bulk action, to mark the rows it failed for
+        notices: Messages shown above the table, e.g. the bulk action summary
+
+    Returns:
+        Streamed page response
+    """
     # Get API client
     companies_client = get_companies_client(request)
 
-    try:
-        # Get query parameters
-        params = dict(request.query_params)
-        active_only = params.get("active_only", "false").lower() in ("true", "1", "t")
+    # Get page, sorting, search and filters from query parameters
+    query = companies_query(request)
+    active_only = query.filters.get("active_only", "false").lower() in ("true", "1", "t")
+
+    # Get any messages from session
+    messages = request.session.pop("messages", [])
 
-        # Fetch companies from API
-        companies = await companies_client.get_companies(active_only=active_only)
+    # Stream the page while the requested page of companies is fetched from API
+    return await templates.StreamingTemplateResponse(
+        "companies/list.html",
+        {
+            "request": request,
+            "messages": messages,
+            "active_only": active_only,
+            "bulk": bulk,
+            "notices": notices or [],
+            "title": "Companies"
+        },
+        data={"listing": companies_client.get_companies_page(query)},
+        on_error=companies_list_error,
+    )
 
-        # Get any messages from session
-        messages = request.session.pop("messages", [])
 
-        return templates.TemplateResponse(
-            "companies/list.html",
-            {
-                "request": request,
-                "messages": messages,
-                "companies": companies,
-                "active_only": active_only,
-                "title": "Companies"
-            }
+@requires(["authenticated"])
+@permission_required(["view_companies"])
+async def companies_export(request: Request):
+    """
+    Download the companies list as CSV or NDJSON, with the list page's search and filters
+    """
+    # Get the format and the same query as the list page
+    format_name = export_format(request)
+    if format_name is None:
+        return JSONResponse({"error": "Unknown export format"}, status_code=400)
+    query = companies_query(request)
+
+    try:
+        # Stream every matching company, fetching pages from API as the file is read
+        companies_client = get_companies_client(request)
+        return await export_response(
+            request, companies_client.get_companies_page, query, "companies", EXPORT_COLUMNS, format_name
         )
+    except Exception as e:
+        return companies_list_error(request, e)
 
-    except httpx.HTTPStatusError as e:
+
+@requires(["authenticated"])
+@permission_required(["manage_companies"])
+async def companies_bulk(request: Request):
+    """
+    Apply a bulk action (delete, activate, deactivate) to the companies ticked on the list
+
+    The backend calls run BULK_ACTION_CONCURRENCY at a time. HTMX requests
+    get the list table back with each row's outcome, others are redirected
+    to the list.
+    """
+    # Get API client
+    companies_client = get_companies_client(request)
+
+    # Get the action and the ticked companies
+    form_data = await request.form()
+    action = form_data.get("action")
+    company_ids = selected_ids(form_data)
+    calls = {
+        "delete": companies_client.delete_company,
+        "activate": lambda company_id: companies_client.set_company_active(company_id, True),
+        "deactivate": lambda company_id: companies_client.set_company_active(company_id, False),
+    }
+
+    bulk = None
+    if action not in calls or not company_ids:
+        messages = [{"type": "error", "text": "Select one or more companies and an action"}]
+    else:
+        # Run the action for every company, a few at a time
+        bulk = await run_bulk(action, company_ids, calls[action])
+        messages = bulk.messages("company", "companies", BULK_ACTIONS[action])
+
+    if request.headers.get("HX-Request") == "true":
+        # Update the table in place, with the outcomes above it
+        return await companies_list_response(request, bulk, messages)
+
+    # Redirect back to the same page of the list
+    request.session["messages"] = messages
+    return RedirectResponse(url=f"/companies{companies_query(request).url()}", status_code=302)
+
+
+def companies_list_error(request: Request, e: Exception):
+    """
+    Handle errors loading the companies list
+    """
+    if isinstance(e, httpx.HTTPStatusError):
         # Handle API HTTP errors
         if e.response.status_code == 403:
             # User doesn't have permission
@@ -63,12 +170,11 @@ async def companies_list(request: Request):
         ]
         return RedirectResponse(url="/dashboard", status_code=302)
 
-    except Exception as e:
-        # Handle general exceptions
-        request.session["messages"] = [
-            {"type": "error", "text": f"An unexpected error occurred: {str(e)}"}
-        ]
-        return RedirectResponse(url="/dashboard", status_code=302)
+    # Handle general exceptions
+    request.session["messages"] = [
+        {"type": "error", "text": f"An unexpected error occurred: {str(e)}"}
+    ]
+    return RedirectResponse(url="/dashboard", status_code=302)
 
 
 @requires(["authenticated"])
@@ -83,24 +189,26 @@ async def company_detail(request: Request):
     # Get API client
     companies_client = get_companies_client(request)
 
-    try:
-        # Fetch company from API
-        company = await companies_client.get_company(company_id)
+    # Get any messages from session
+    messages = request.session.pop("messages", [])
 
-        # Get any messages from session
-        messages = request.session.pop("messages", [])
+    # Stream the page while the company is fetched from API
+    return await templates.StreamingTemplateResponse(
+        "companies/detail.html",
+        {
+            "request": request,
+            "messages": messages,
+        },
+        data={"company": companies_client.get_company(company_id)},
+        on_error=company_detail_error,
+    )
 
-        return templates.TemplateResponse(
-            "companies/detail.html",
-            {
-                "request": request,
-                "messages": messages,
-                "company": company,
-                "title": f"Company: {company.get('name', '')}"
-            }
-        )
 
-    except httpx.HTTPStatusError as e:
+def company_detail_error(request: Request, e: Exception):
+    """
+    Handle errors loading the company detail page
+    """
+    if isinstance(e, httpx.HTTPStatusError):
         # Handle API HTTP errors
         if e.response.status_code == 404:
             # Company not found
@@ -120,12 +228,11 @@ async def company_detail(request: Request):
 
         return RedirectResponse(url="/companies", status_code=302)
 
-    except Exception as e:
-        # Handle general exceptions
-        request.session["messages"] = [
-            {"type": "error", "text": f"An unexpected error occurred: {str(e)}"}
-        ]
-        return RedirectResponse(url="/companies", status_code=302)
+    # Handle general exceptions
+    request.session["messages"] = [
+        {"type": "error", "text": f"An unexpected error occurred: {str(e)}"}
+    ]
+    return RedirectResponse(url="/companies", status_code=302)
 
 
 @requires(["authenticated"])
@@ -224,8 +331,8 @@ async def company_edit_page(request: Request):
     companies_client = get_companies_client(request)
 
     try:
-        # Fetch company from API
-        company = await companies_client.get_company(company_id)
+        # Fetch company from API, with the version to send back when saving
+        company, version = await companies_client.get_company_for_edit(company_id)
 
         # Get any messages from session
         messages = request.session.pop("messages", [])
@@ -236,6 +343,7 @@ async def company_edit_page(request: Request):
                 "request": request,
                 "messages": messages,
                 "company": company,
+                "version": version,
                 "title": f"Edit Company: {company.get('name', '')}"
             }
         )
@@ -297,8 +405,8 @@ async def company_edit(request: Request):
             "is_active": form_data.get("is_active") == "on"
         }
 
-        # Update company through API
-        company = await companies_client.update_company(company_id, company_data)
+        # Update company through API, refused if it changed since the form was loaded
+        company = await companies_client.update_company(company_id, company_data, version=form_data.get("version") or None)
 
         # Add success message
         request.session["messages"] = [
@@ -319,6 +427,10 @@ async def company_edit(request: Request):
         except Exception:
             pass
 
+        if e.response.status_code == 412:
+            # Saved by someone else since the form was loaded, the edit page shows their version
+            error_msg = "This company was changed by someone else while you were editing it, please make your changes again"
+
         request.session["messages"] = [
             {"type": "error", "text": error_msg}
         ]
@@ -403,6 +515,8 @@ async def company_delete(request: Request):
 async def company_drop_schema(request: Request):
     """
     Handle company schema drop
+
+    The drop runs as a background job; the response redirects to its status page.
     """
     # Get company ID from path parameters
     company_id = request.path_params.get("company_id")
@@ -418,50 +532,35 @@ async def company_drop_schema(request: Request):
         ]
         return RedirectResponse(url=f"/companies/{company_id}", status_code=302)
 
-    # Get API client
+    # Get API client, kept by the job after this request ends
     companies_client = get_companies_client(request)
 
-    try:
-        # Drop schema through API
-        result = await companies_client.drop_schema(company_id)
-
-        # Add success message
-        request.session["messages"] = [
-            {"type": "success", "text": result.get("message", "Schema dropped successfully")}
-        ]
-
-        # Redirect to companies list
-        return RedirectResponse(url="/companies", status_code=302)
-
-    except httpx.HTTPStatusError as e:
-        # Handle API HTTP errors
-        error_msg = "Error dropping schema"
-
-        # Try to extract error message from response
-        try:
-            error_data = await e.response.json()
-            error_msg = error_data.get("detail", error_msg)
-        except Exception:
-            pass
+    async def drop_schema(job: Job) -> str:
+        job.report(message="Dropping the company schema")
+        result = await companies_client.drop_schema(company_id, timeout=settings.JOB_API_TIMEOUT)
+        return (result or {}).get("message", "Schema dropped successfully")
 
+    try:
+        # Drop the schema in the background, a large tenant can take longer than a request may
+        job = job_runner.submit(
+            request, "company_drop_schema", "Drop company schema", drop_schema,
+            url=f"/companies/{company_id}", key=str(company_id),
+        )
+    except (JobQueueFull, JobAlreadyRunning) as e:
         request.session["messages"] = [
-            {"type": "error", "text": error_msg}
+            {"type": "error", "text": str(e)}
         ]
-
-        # Redirect back to company detail page
         return RedirectResponse(url=f"/companies/{company_id}", status_code=302)
 
-    except Exception as e:
-        # Handle general exceptions
-        request.session["messages"] = [
-            {"type": "error", "text": f"An unexpected error occurred: {str(e)}"}
-        ]
-        return RedirectResponse(url=f"/companies/{company_id}", status_code=302)
+    # Follow the progress on the job's status page
+    return RedirectResponse(url=f"/jobs/{job.id}", status_code=302)
 
 
 # Define routes
 routes = [
     Route("/", endpoint=companies_list, methods=["GET"]),
+    Route("/export", endpoint=companies_export, methods=["GET"]),
+    Route("/bulk", endpoint=companies_bulk, methods=["POST"]),
     Route("/create", endpoint=company_create_page, methods=["GET"]),
     Route("/create", endpoint=company_create, methods=["POST"]),
     Route("/{company_id:uuid}", endpoint=company_detail, methods=["GET"]),
@@ -35,8 +35,77 @@ class Settings(BaseSettings):
     AUTH_TOKEN_NAME: str = "access_token"
     AUTH_REFRESH_TOKEN_NAME: str = "refresh_token"
 
+    # Login settings
+    LOGIN_WARM_UP: bool = os.getenv("LOGIN_WARM_UP", "True").lower() in ("true", "1", "t")  # prefetch the first pages' data on login
+
+    # Logout settings
+    LOGOUT_REVOKE_WORKERS: int = int(os.getenv("LOGOUT_REVOKE_WORKERS", "2"))  # token revocations sent at once
+    LOGOUT_REVOKE_QUEUE_SIZE: int = int(os.getenv("LOGOUT_REVOKE_QUEUE_SIZE", "1000"))  # revocations waiting before logouts skip them
+    LOGOUT_REVOKE_RETRIES: int = int(os.getenv("LOGOUT_REVOKE_RETRIES", "3"))  # attempts after a failed revocation
+    LOGOUT_REVOKE_RETRY_DELAY: float = float(os.getenv("LOGOUT_REVOKE_RETRY_DELAY", "1"))  # seconds before the first retry, doubled after
+
     # Template settings
     TEMPLATE_RELOAD: bool = DEBUG
+    TEMPLATE_CACHE_DIR: str = os.getenv("TEMPLATE_CACHE_DIR", ".cache/jinja")  # relative to project root
+    FRAGMENT_CACHE_SIZE: int = int(os.getenv("FRAGMENT_CACHE_SIZE", "1000"))  # rendered fragments kept in memory
+    FRAGMENT_CACHE_TTL: int = int(os.getenv("FRAGMENT_CACHE_TTL", "300"))  # seconds, 0 disables the cache
+    PAGE_CACHE_SIZE: int = int(os.getenv("PAGE_CACHE_SIZE", "500"))  # rendered pages kept in memory
+    ANONYMOUS_PAGE_TTL: int = int(os.getenv("ANONYMOUS_PAGE_TTL", "300"))  # seconds, 0 disables the cache
+    USER_PAGE_CACHE: bool = os.getenv("USER_PAGE_CACHE", "True").lower() in ("true", "1", "t")  # per-user micro-cache
+
+    # Compression settings
+    COMPRESSION_MIN_SIZE: int = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # bytes, smaller bodies are sent as is
+    COMPRESSION_THREAD_SIZE: int = int(os.getenv("COMPRESSION_THREAD_SIZE", "262144"))  # bytes, larger bodies compress off the event loop
+    COMPRESSION_CACHE_SIZE: int = int(os.getenv("COMPRESSION_CACHE_SIZE", "256"))  # compressed bodies kept in memory
+
+    # Static file settings
+    STATIC_MEMORY_MAX_SIZE: int = int(os.getenv("STATIC_MEMORY_MAX_SIZE", "1048576"))  # bytes, larger files are served from disk
+
+    # Search settings
+    SEARCH_INDEX_USERS: int = int(os.getenv("SEARCH_INDEX_USERS", "100"))  # users with a search index in memory
+    SEARCH_INDEX_TTL: int = int(os.getenv("SEARCH_INDEX_TTL", "300"))  # seconds before a collection is fetched again
+    SEARCH_USERS_FETCH_LIMIT: int = int(os.getenv("SEARCH_USERS_FETCH_LIMIT", "5000"))  # user accounts fetched into an index
+
+    # Collection cache settings
+    COLLECTION_CACHE_USERS: int = int(os.getenv("COLLECTION_CACHE_USERS", "100"))  # users with cached collections in memory
+    COLLECTION_CACHE_TTL: int = int(os.getenv("COLLECTION_CACHE_TTL", "60"))  # seconds before a collection is fetched again, 0 disables
+    COLLECTION_CACHE_MAX_ITEMS: int = int(os.getenv("COLLECTION_CACHE_MAX_ITEMS", "2000"))  # largest collection listed from memory
+
+    # User import settings
+    USER_IMPORT_CONCURRENCY: int = int(os.getenv("USER_IMPORT_CONCURRENCY", "8"))  # users created at once during a CSV import
+    USER_IMPORT_MAX_ROWS: int = int(os.getenv("USER_IMPORT_MAX_ROWS", "10000"))  # rows read from one import file
+    USER_IMPORT_MAX_SIZE: int = int(os.getenv("USER_IMPORT_MAX_SIZE", str(10 * 1024 * 1024)))  # bytes, larger uploads are refused
+    USER_IMPORT_HISTORY: int = int(os.getenv("USER_IMPORT_HISTORY", "20"))  # finished imports kept with their result files
+
+    # Bulk action settings
+    BULK_ACTION_CONCURRENCY: int = int(os.getenv("BULK_ACTION_CONCURRENCY", "8"))  # backend calls at once for a list page bulk action
+    BULK_ACTION_MAX_ITEMS: int = int(os.getenv("BULK_ACTION_MAX_ITEMS", "500"))  # rows one bulk action may change
+
+    # Background job settings
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "4"))  # long operations run at once per process
+    JOB_QUEUE_SIZE: int = int(os.getenv("JOB_QUEUE_SIZE", "100"))  # jobs waiting for a worker before new ones are refused
+    JOB_DB_PATH: str = os.getenv("JOB_DB_PATH", ".cache/jobs.sqlite3")  # job status database, relative to project root
+    JOB_RETENTION: int = int(os.getenv("JOB_RETENTION", str(7 * 24 * 60 * 60)))  # seconds finished jobs are kept
+    JOB_API_TIMEOUT: int = int(os.getenv("JOB_API_TIMEOUT", "900"))  # seconds a job waits for a slow backend operation
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", "1"))  # seconds between checks for cancellations
+
+    # Export settings
+    EXPORT_PAGE_SIZE: int = int(os.getenv("EXPORT_PAGE_SIZE", "100"))  # rows fetched from the backend per request when exporting
+
+    # Permission catalog settings
+    PERMISSION_CATALOG_TTL: int = int(os.getenv("PERMISSION_CATALOG_TTL", "600"))  # seconds before the catalog is fetched again
+    ROLE_MATRIX_CONCURRENCY: int = int(os.getenv("ROLE_MATRIX_CONCURRENCY", "8"))  # roles saved at once from the permission matrix
+
+    # Live events settings
+    EVENTS_CLIENT_BUFFER: int = int(os.getenv("EVENTS_CLIENT_BUFFER", "100"))  # undelivered events before a client is dropped
+    EVENTS_REPLAY_SIZE: int = int(os.getenv("EVENTS_REPLAY_SIZE", "500"))  # events kept per channel for reconnecting clients
+    EVENTS_HEARTBEAT: int = int(os.getenv("EVENTS_HEARTBEAT", "15"))  # seconds between keep-alive comments
+    EVENTS_RETRY_MS: int = int(os.getenv("EVENTS_RETRY_MS", "3000"))  # browser reconnection delay
+    EVENTS_PUBLISH_TOKEN: str = os.getenv("EVENTS_PUBLISH_TOKEN", "")  # bearer token for /events/publish, empty disables it
+
+    # Diagnostics settings
+    # Default for the Server-Timing header, users can toggle it for their own session
+    SERVER_TIMING: bool = os.getenv("SERVER_TIMING", str(DEBUG)).lower() in ("true", "1", "t")
 
     class Config:
         """Pydantic config"""
@@ -1,16 +1,62 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
 from starlette.requests import Request
 from starlette.responses import RedirectResponse
 from starlette.routing import Route
-from starlette.templating import Jinja2Templates
-from pathlib import Path
 
 from app.api.sites_client import get_sites_client
+from app.config import settings
+from app.dashboard.widgets import inventory_widget, recent_orders_widget, sales_summary_widget
+from app.templating import templates
+from app.utils.fragment_cache import fragment_cache
+
+
+def dashboard_sites_key(request: Request, company_id: Optional[str]) -> tuple:
+    """
+    Get the fragment cache key of the current user's sites for the dropdown
+    """
+    return ("dashboard-sites", request.user.identity, str(company_id))
 
-# Get base directory path (project root)
-BASE_DIR = Path(__file__).parent.parent.parent
 
-# Initialize templates
-templates = Jinja2Templates(directory=BASE_DIR / "templates")
+async def get_dashboard_sites(request: Request, company_id: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Get the sites for the dropdown, cached per user like the navbar they feed
+
+    Args:
+        request: The current request
+        company_id: Company from the URL context, if any
+
+    Returns:
+        List of site dictionaries
+    """
+    key = dashboard_sites_key(request, company_id)
+    sites = fragment_cache.get(key)
+    if sites is None:
+        sites = await get_sites_client(request).get_sites(company_id=company_id)
+        # Dropped with the navbar whenever a site changes
+        fragment_cache.set(key, sites, settings.FRAGMENT_CACHE_TTL, tags=("sites",))
+    return sites
+
+
+async def get_current_site(request: Request, site_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Get details of the site from the URL context, if any
+
+    Args:
+        request: The current request
+        site_id: Site from the URL context
+
+    Returns:
+        Site details, or None without a site or when it can't be loaded
+    """
+    if not site_id:
+        return None
+    try:
+        return await get_sites_client(request).get_site(site_id)
+    except Exception as e:
+        print(f"Error fetching site details: {e}")
+        return None
 
 
 async def dashboard(request: Request):
@@ -30,30 +76,13 @@ async def dashboard(request: Request):
     company_id = context.get("company_id")
     site_id = context.get("site_id")
 
-    # Get sites client
-    sites_client = get_sites_client(request)
-
     try:
-        # Fetch sites for the dropdown
-        sites = await sites_client.get_sites(company_id=company_id)
-
-        # If we have a site_id, get specific site details
-        current_site = None
-        if site_id:
-            try:
-                current_site = await sites_client.get_site(site_id)
-            except Exception as e:
-                print(f"Error fetching site details: {e}")
-
-        # Example dummy data that would come from API
-        # In real implementation, this would be fetched from appropriate API endpoints
-        recent_orders = []
-        inventory_status = []
-        sales_summary = {
-            "today": {"total": 2580, "change": 12},
-            "active_orders": 16,
-            "reservations": 8
-        }
+        # Fetch sites for the dropdown and the current site together,
+        # the widgets fetch their own data once the page is shown
+        sites, current_site = await asyncio.gather(
+            get_dashboard_sites(request, company_id),
+            get_current_site(request, site_id),
+        )
 
         # Customize title based on context
         title = "Dashboard"
@@ -71,9 +100,6 @@ async def dashboard(request: Request):
             "current_site": current_site,
             "company_id": company_id,
             "site_id": site_id,
-            "recent_orders": recent_orders,
-            "inventory_status": inventory_status,
-            "sales_summary": sales_summary,
             "messages": request.state.template_context.get("messages", []),
         }
 
@@ -93,4 +119,7 @@ async def dashboard(request: Request):
 # Define routes
 routes = [
     Route("/", endpoint=dashboard, methods=["GET"]),
+    Route("/widgets/sales-summary", endpoint=sales_summary_widget, methods=["GET"]),
+    Route("/widgets/recent-orders", endpoint=recent_orders_widget, methods=["GET"]),
+    Route("/widgets/inventory", endpoint=inventory_widget, methods=["GET"]),
 ]
\ No newline at end of file
@@ -0,0 +1,126 @@
+# app/dashboard/widgets.py
+import asyncio
+import functools
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from starlette.authentication import requires
+from starlette.requests import Request
+from starlette.responses import HTMLResponse
+
+from app.templating import templates
+from app.utils.fragment_cache import fragment_cache
+from app.utils.server_timing import get_server_timing
+
+# Widget handlers load their data and return the template context
+WidgetLoader = Callable[[Request], Awaitable[Dict[str, Any]]]
+
+
+def widget_site_id(request: Request):
+    """
+    Get the site a widget shows data for
+
+    Args:
+        request: The widget request
+
+    Returns:
+        Site ID passed by the dashboard, or the current site from the session
+    """
+    return request.query_params.get("site_id") or request.session.get("current_site_id")
+
+
+def dashboard_widget(name: str, template: str, timeout: float = 5.0, ttl: float = 30):
+    """
+    Turn a widget data loader into its own lazily loaded endpoint
+
+    The dashboard renders a placeholder per widget that fetches the widget
+    with hx-trigger="load", so slow widgets don't hold up the page or each
+    other. Rendered widgets are kept in the fragment cache per user and
+    site. A widget that fails or runs past its timeout renders an error
+    card with a retry button, which isn't cached.
+
+    Args:
+        name: Widget name, used in the cache key and Server-Timing
+        template: Template rendering the widget
+        timeout: Seconds the loader may take
+        ttl: Seconds a rendered widget is reused, 0 disables caching
+
+    Returns:
+        Decorator for widget loaders
+    """
+    def decorator(loader: WidgetLoader):
+        @functools.wraps(loader)
+        async def endpoint(request: Request):
+            start = time.perf_counter()
+            key = (f"widget-{name}", request.user.identity, str(widget_site_id(request)))
+            body = fragment_cache.get(key) if ttl > 0 else None
+            outcome = "hit"
+
+            if body is None:
+                outcome = "miss"
+                try:
+                    context = await asyncio.wait_for(loader(request), timeout)
+                except Exception as e:
+                    outcome = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+                    print(f"Error loading dashboard widget {name}: {e!r}")
+                    context = None
+
+                if context is None:
+                    # Retry button reloads just this widget
+                    body = templates.get_template("dashboard/widgets/error.html").render(
+                        request=request, name=name, timed_out=outcome == "timeout",
+                        url=request.url.path + (f"?{request.url.query}" if request.url.query else ""),
+                    )
+                else:
+                    body = templates.get_template(template).render(request=request, **context)
+                    if ttl > 0:
+                        fragment_cache.set(key, body, ttl, tags=(f"widget:{name}",))
+
+            timing = get_server_timing(request)
+            if timing:
+                timing.record(f"widget-{name}", time.perf_counter() - start, f"{name} {outcome}")
+
+            return HTMLResponse(body)
+
+        return endpoint
+
+    return decorator
+
+
+@requires(["authenticated"])
+@dashboard_widget("sales-summary", "dashboard/widgets/sales_summary.html", timeout=3.0, ttl=60)
+async def sales_summary_widget(request: Request) -> Dict[str, Any]:
+    """
+    Load the sales summary cards
+    """
+    # Example dummy data that would come from API
+    # In real implementation, this would be fetched for widget_site_id(request)
+    return {
+        "sales_summary": {
+            "today": {"total": 2580, "change": 12},
+            "active_orders": 16,
+            "reservations": 8
+        }
+    }
+
+
+@requires(["authenticated"])
+@dashboard_widget("recent-orders", "dashboard/widgets/recent_orders.html", timeout=5.0, ttl=15)
+async def recent_orders_widget(request: Request) -> Dict[str, Any]:
+    """
+    Load the recent orders table
+    """
+    # Example dummy data that would come from API
+    # In real implementation, this would be fetched for widget_site_id(request)
+    return {"recent_orders": []}
+
+
+@requires(["authenticated"])
+@dashboard_widget("inventory", "dashboard/widgets/inventory.html", timeout=5.0, ttl=120)
+async def inventory_widget(request: Request) -> Dict[str, Any]:
+    """
+    Load the inventory status bars
+    """
+    # Example dummy data that would come from API
+    # In real implementation, this would be fetched for widget_site_id(request)
+    return {"inventory_status": []}
@@ -6,6 +6,35 @@ from functools import wraps
 from app.api_client import get_api_client
 
 
+def has_permissions(request: Request, permissions: List[str]) -> bool:
+    """
+    Check if the current user has all of the given permissions
+
+    Args:
+        request: The current request
+        permissions: Permissions required
+
+    Returns:
+        True if the user has every permission
+    """
+    if "user" not in request.scope or not request.user.is_authenticated:
+        return False
+
+    # This is simplified - in a real app, you would check actual permissions
+    # For now, we'll just check role
+    if request.user.role == "admin":
+        # Admin has all permissions
+        return True
+    elif request.user.role == "manager":
+        # Manager has many permissions but not all
+        return not any(p.startswith("admin_") for p in permissions)
+    elif request.user.role == "staff":
+        # Staff has limited permissions
+        return all(p.startswith("view_") for p in permissions)
+
+    return False
+
+
 def permission_required(permissions: Union[str, List[str]]):
     """
     Decorator to check if the current user has the required permissions
@@ -33,21 +62,7 @@ def permission_required(permissions: Union[str, List[str]]):
                 return RedirectResponse(url="/auth/login", status_code=302)
 
             # Check if user has required permissions
-            # This is simplified - in a real app, you would check actual permissions
-            # For now, we'll just check role
-            has_permission = False
-
-            if request.user.role == "admin":
-                # Admin has all permissions
-                has_permission = True
-            elif request.user.role == "manager":
-                # Manager has many permissions but not all
-                has_permission = not any(p.startswith("admin_") for p in permissions)
-            elif request.user.role == "staff":
-                # Staff has limited permissions
-                has_permission = all(p.startswith("view_") for p in permissions)
-
-            if not has_permission:
+            if not has_permissions(request, permissions):
                 # Add error message to session
                 request.session["messages"] = [
                     {"type": "error", "text": "You do not have permission to access this page"}
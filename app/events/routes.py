@@ -0,0 +1,129 @@
+# app/events/routes.py
+import asyncio
+import hmac
+import json
+from typing import List
+
+from starlette.authentication import requires
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from app.api.companies_client import get_companies_client
+from app.api.sites_client import get_sites_client
+from app.config import settings
+from app.utils.event_hub import event_hub, format_event
+from app.utils.fragment_cache import fragment_cache
+
+# Notifications sent to a page that connects for the first time
+RECENT_NOTIFICATIONS = 5
+
+
+async def allowed_channels(request: Request) -> List[str]:
+    """
+    Get the channels the current user may follow
+
+    Every user follows their own channel. The company and site passed in
+    the query string (or the session's current site) are checked with the
+    backend first, like pages in a company or site context are; one the
+    user can't see is left out rather than failing the whole stream.
+
+    Args:
+        request: The stream request
+
+    Returns:
+        Channel names, the user's own first
+    """
+    company_id = request.query_params.get("company_id")
+    site_id = request.query_params.get("site_id") or request.session.get("current_site_id")
+
+    checks = {}
+    if company_id:
+        checks[f"company:{company_id}"] = get_companies_client(request).get_company(company_id)
+    if site_id:
+        checks[f"site:{site_id}"] = get_sites_client(request).get_site(site_id)
+
+    results = await asyncio.gather(*checks.values(), return_exceptions=True)
+    return [f"user:{request.user.identity}"] + [
+        channel for channel, result in zip(checks, results) if result and not isinstance(result, Exception)
+    ]
+
+
+@requires(["authenticated"])
+async def event_stream(request: Request):
+    """
+    Stream live events for the current user, company and site (Server-Sent Events)
+
+    Pass company_id and site_id in the query string. Browsers reconnect on
+    their own and send Last-Event-ID, the events missed in between are
+    replayed first.
+    """
+    channels = await allowed_channels(request)
+    last_event_id = request.headers.get("last-event-id")
+
+    async def body():
+        # Subscribe once streaming starts, so the finally below always runs
+        subscription = event_hub.subscribe(channels, last_event_id)
+        try:
+            if last_event_id is None:
+                # Fill the notifications menu of a freshly loaded page, as already read
+                for event in event_hub.recent(channels, "notification", RECENT_NOTIFICATIONS):
+                    yield format_event("recent-notification", event.data, event_id=event.id)
+            async for chunk in event_hub.stream(subscription):
+                yield chunk
+        finally:
+            event_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop reverse proxies from buffering the stream
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+async def publish(request: Request):
+    """
+    Publish events sent by the backend to connected clients
+
+    Expects a bearer token matching EVENTS_PUBLISH_TOKEN and a JSON body
+    with channel, event and data, or a list of those. "widget" events
+    ({"name": "sales-summary"}) also drop the cached copies of that
+    dashboard widget so clients reload fresh data.
+    """
+    token = settings.EVENTS_PUBLISH_TOKEN
+    if not token:
+        return Response(status_code=404)
+
+    authorization = request.headers.get("authorization", "")
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+        return JSONResponse({"error": "Invalid publish token"}, status_code=401)
+
+    try:
+        payload = await request.json()
+    except json.JSONDecodeError:
+        return JSONResponse({"error": "Invalid JSON"}, status_code=400)
+
+    messages = payload if isinstance(payload, list) else [payload]
+    if not all(isinstance(message, dict) and message.get("channel") and message.get("event") for message in messages):
+        return JSONResponse({"error": "Each event needs a channel and an event name"}, status_code=400)
+
+    published = []
+    for message in messages:
+        data = message.get("data")
+        if message["event"] == "widget" and isinstance(data, dict) and data.get("name"):
+            fragment_cache.invalidate(f"widget:{data['name']}")
+        event = event_hub.publish(message["channel"], message["event"], data)
+        published.append(event.id)
+
+    return JSONResponse({"published": published})
+
+
+# Define routes
+routes = [
+    Route("/", endpoint=event_stream, methods=["GET"]),
+    Route("/publish", endpoint=publish, methods=["POST"]),
+]
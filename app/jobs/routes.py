@@ -0,0 +1,69 @@
+# app/jobs/routes.py
+from starlette.authentication import requires
+from starlette.requests import Request
+from starlette.responses import RedirectResponse
+from starlette.routing import Route
+
+from app.templating import templates
+from app.utils.jobs import job_runner
+
+
+@requires(["authenticated"])
+async def job_status(request: Request):
+    """
+    Render the status of a background job
+
+    The status block polls itself with HTMX until the job finishes.
+    """
+    # Get the job, only the user who started it can follow it
+    job = job_runner.get(request, request.path_params["job_id"])
+    if job is None:
+        request.session["messages"] = [
+            {"type": "error", "text": "Operation not found, it may have expired"}
+        ]
+        return RedirectResponse(url="/dashboard", status_code=302)
+
+    # Get any messages from session
+    messages = request.session.pop("messages", [])
+
+    return templates.TemplateResponse(
+        "jobs/status.html",
+        {
+            "request": request,
+            "messages": messages,
+            "job": job,
+            "title": job.title
+        }
+    )
+
+
+@requires(["authenticated"])
+async def job_cancel(request: Request):
+    """
+    Handle cancelling a background job
+    """
+    # Get the job, only the user who started it can cancel it
+    job_id = request.path_params["job_id"]
+    job = job_runner.get(request, job_id)
+    if job is None:
+        request.session["messages"] = [
+            {"type": "error", "text": "Operation not found, it may have expired"}
+        ]
+        return RedirectResponse(url="/dashboard", status_code=302)
+
+    if job.done:
+        request.session["messages"] = [
+            {"type": "error", "text": "The operation has already finished"}
+        ]
+    else:
+        job_runner.cancel(job)
+
+    # Back to the status page, which shows the outcome
+    return RedirectResponse(url=f"/jobs/{job_id}", status_code=302)
+
+
+# Define routes
+routes = [
+    Route("/{job_id}", endpoint=job_status, methods=["GET"]),
+    Route("/{job_id}/cancel", endpoint=job_cancel, methods=["POST"]),
+]
@@ -10,18 +10,32 @@ from starlette.middleware import Middleware
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.middleware.authentication import AuthenticationMiddleware
 from starlette.routing import Mount, Route
-from starlette.staticfiles import StaticFiles
-from starlette.templating import Jinja2Templates
-from starlette.responses import RedirectResponse
+from starlette.responses import JSONResponse, RedirectResponse
 from starlette.requests import Request
 
+from app.auth.revocations import token_revocations
 from app.config import settings
 from app.middleware import (
     AuthBackend,
     APIExceptionMiddleware,
+    CompressionMiddleware,
     ContextMiddleware,
-    PermissionMiddleware
+    PermissionMiddleware,
+    ServerTimingMiddleware,
+    ServerTimingStage,
 )
+from app.templating import precompile_templates
+from app.users.imports import user_imports
+from app.utils.fragment_cache import fragment_cache
+from app.utils.assets import AssetStaticFiles, manifest as asset_manifest
+from app.utils.collection_cache import collection_cache
+from app.utils.compression import compressed_bodies
+from app.utils.event_hub import event_hub
+from app.utils.jobs import job_runner
+from app.utils.page_cache import anonymous_pages, user_pages
+from app.utils.permission_catalog import permission_catalog
+from app.utils.search_index import search_indexes
+from app.utils.server_timing import SESSION_KEY as SERVER_TIMING_SESSION_KEY
 
 # Import route modules
 from app.auth.routes import routes as auth_routes
@@ -30,6 +44,9 @@ from app.users.routes import routes as users_routes
 from app.companies.routes import routes as companies_routes
 from app.roles.routes import routes as roles_routes
 from app.permissions.routes import routes as permissions_routes
+from app.search.routes import routes as search_routes
+from app.events.routes import routes as events_routes
+from app.jobs.routes import routes as jobs_routes
 
 # Import other route modules as they're created
 
@@ -37,14 +54,9 @@ from app.permissions.routes import routes as permissions_routes
 # Get base directory path (project root)
 BASE_DIR = Path(__file__).parent.parent
 
-# Initialize templates
-templates = Jinja2Templates(directory=BASE_DIR / "templates")
 
-# Add custom filters or globals to templates
-templates.env.globals.update({
-    "app_name": settings.APP_NAME,
-    "app_version": settings.APP_VERSION,
-})
+# Static files, read into memory at startup
+static_files = AssetStaticFiles(directory=BASE_DIR / "static")
 
 
 # Root route handler
@@ -78,20 +90,57 @@ async def debug_info(request: Request):
         "request_headers": dict(request.headers),
         "request_path": request.url.path,
         "context": getattr(request.state, "context", {}),
+        "fragment_cache": fragment_cache.report(),
+        "anonymous_page_cache": anonymous_pages.report(),
+        "user_page_cache": user_pages.report(),
+        "compression_cache": compressed_bodies.report(),
+        "search_index": search_indexes.report(),
+        "permission_catalog": permission_catalog.report(),
+        "collection_cache": collection_cache.report(),
+        "event_hub": event_hub.report(),
+        "jobs": job_runner.report(),
+        "token_revocations": token_revocations.report(),
     }
 
     # Return JSON in debug mode
-    from starlette.responses import JSONResponse
     return JSONResponse(info)
 
 
+# Server-Timing toggle handler
+async def toggle_server_timing(request: Request):
+    """
+    Switch the Server-Timing header on or off for the current user's session
+    POST enabled=true|false (form or query string), or omit it to flip the current state
+    """
+    if "user" not in request.scope or not request.user.is_authenticated:
+        return RedirectResponse(url="/auth/login", status_code=302)
+
+    form = await request.form()
+    enabled = form.get("enabled") or request.query_params.get("enabled")
+    if enabled is None:
+        current = request.session.get(SERVER_TIMING_SESSION_KEY, settings.SERVER_TIMING)
+        request.session[SERVER_TIMING_SESSION_KEY] = not current
+    else:
+        request.session[SERVER_TIMING_SESSION_KEY] = enabled.lower() in ("true", "1", "t")
+
+    return JSONResponse({"server_timing": request.session[SERVER_TIMING_SESSION_KEY]})
+
+
 # Configure middleware - order is important!
+# Each ServerTimingStage records the time spent in the middleware just above it
 middleware = [
+    Middleware(ServerTimingMiddleware),  # Collect timings for the Server-Timing header
+    Middleware(CompressionMiddleware),  # Compress responses (brotli or gzip)
     Middleware(SessionMiddleware, secret_key=settings.SECRET_KEY),
+    Middleware(ServerTimingStage, name="session"),
     Middleware(ContextMiddleware),  # Extract hierarchical URL structure
+    Middleware(ServerTimingStage, name="context"),
     Middleware(AuthenticationMiddleware, backend=AuthBackend()),
+    Middleware(ServerTimingStage, name="auth"),
     Middleware(PermissionMiddleware),  # Check permissions based on URL context
+    Middleware(ServerTimingStage, name="permission"),
     Middleware(APIExceptionMiddleware),
+    Middleware(ServerTimingStage, name="api-exception"),
 ]
 
 
@@ -131,12 +180,31 @@ async def startup():
         except Exception as e:
             print(f"Warning: Could not create favicon: {e}")
 
-    print(f"Starting {settings.APP_NAME} v{settings.APP_VERSION}")
+    # Start the background job workers and the logout token revocations
+    job_runner.start()
+    token_revocations.start()
+
+    # Compile all templates up front (loaded from the bytecode cache after the first boot)
+    compiled = precompile_templates()
+
+    # Resolve static URLs to the fingerprinted files from scripts/build_assets.py
+    assets = asset_manifest.load()
+    if not assets:
+        print("Warning: static/dist/manifest.json not found, run scripts/build_assets.py for cacheable assets")
+
+    # Serve static files from memory
+    static_count = static_files.load()
+
+    print(f"Starting {settings.APP_NAME} v{settings.APP_VERSION} ({compiled} templates compiled, "
+          f"{assets} assets fingerprinted, {static_count} static files in memory)")
 
 
 # Shutdown event handler
 async def shutdown():
     """Cleanup application resources on shutdown"""
+    await job_runner.stop()
+    await token_revocations.stop()
+    await user_imports.stop()
     await app.state.http_client.aclose()
     print(f"Shutting down {settings.APP_NAME}")
 
@@ -149,8 +217,11 @@ routes = [
     # Debug route (only active in DEBUG mode)
     Route("/debug", endpoint=debug_info),
 
+    # Per-user Server-Timing toggle
+    Route("/debug/server-timing", endpoint=toggle_server_timing, methods=["POST"]),
+
     # Mount static files - pointing to project root static folder
-    Mount("/static", app=StaticFiles(directory=BASE_DIR / "static"), name="static"),
+    Mount("/static", app=static_files, name="static"),
 
     # Mount routes from all modules
     Mount("/auth", routes=auth_routes),
@@ -159,6 +230,9 @@ routes = [
     Mount("/companies", routes=companies_routes),
     Mount("/roles", routes=roles_routes),
     Mount("/permissions", routes=permissions_routes),
+    Mount("/search", routes=search_routes),
+    Mount("/events", routes=events_routes),
+    Mount("/jobs", routes=jobs_routes),
     # Mount other routes as they're created
 
     # Mount for hierarchical URL structure (company/site)
@@ -1,15 +1,21 @@
+import time
 from typing import Optional, Tuple
 
 import httpx
 from starlette.authentication import (
     AuthCredentials, AuthenticationBackend, AuthenticationError, BaseUser
 )
+from starlette.datastructures import Headers, MutableHeaders
 from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
 from starlette.requests import Request
 from starlette.responses import RedirectResponse, JSONResponse
 from starlette.status import HTTP_403_FORBIDDEN, HTTP_401_UNAUTHORIZED
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from app.config import settings
+from app.utils.compression import StreamCompressor, choose_encoding, compress_body, is_compressible
+from app.utils.flash import load_flash
+from app.utils.server_timing import SCOPE_KEY, ServerTiming, server_timing_enabled
 
 
 class User(BaseUser):
@@ -108,6 +114,154 @@ class AuthBackend(AuthenticationBackend):
         return AuthCredentials(permissions), user
 
 
+class ServerTimingMiddleware(BaseHTTPMiddleware):
+    """
+    Middleware to collect per-request timings and report them in a Server-Timing header
+    """
+
+    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint):
+        # Share the collector with inner middleware, API clients and templates
+        timing = ServerTiming()
+        request.scope[SCOPE_KEY] = timing
+
+        response = await call_next(request)
+
+        if server_timing_enabled(request):
+            response.headers.append("Server-Timing", timing.header_value())
+
+        return response
+
+
+class ServerTimingStage:
+    """
+    Marker placed after a middleware to record how long it took to hand the request on
+    """
+
+    def __init__(self, app: ASGIApp, name: str):
+        self.app = app
+        self.name = name
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        timing = scope.get(SCOPE_KEY)
+        if timing:
+            timing.mark(self.name)
+        await self.app(scope, receive, send)
+
+
+class CompressionMiddleware:
+    """
+    Middleware to compress responses with brotli or gzip
+
+    Bodies of known size below COMPRESSION_MIN_SIZE are sent as they are,
+    larger ones are compressed in one go (cached for identical bodies).
+    Streamed responses are compressed chunk by chunk and flushed as they
+    arrive.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        compressor: Optional[StreamCompressor] = None
+        buffered: Optional[list] = None
+        passthrough = False
+
+        async def send_start(content_length: Optional[int]):
+            headers = MutableHeaders(raw=list(start_message["headers"]))
+            headers["Content-Encoding"] = encoding
+            vary = [value.strip().lower() for value in headers.get("vary", "").split(",")]
+            if "accept-encoding" not in vary and "*" not in vary:
+                headers.add_vary_header("Accept-Encoding")
+            if content_length is None:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(content_length)
+
+            # The compressed body is a different representation, only a weak ETag still applies
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+
+            start_message["headers"] = headers.raw
+            await send(start_message)
+
+        async def send_compressed(message: Message):
+            nonlocal start_message, compressor, buffered, passthrough
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = Headers(raw=message["headers"])
+                content_length = headers.get("content-length")
+                # Partial bodies are byte ranges of the uncompressed representation
+                if (status < 200 or status in (204, 206, 304) or "content-range" in headers
+                        or not is_compressible(headers)
+                        or (content_length is not None and int(content_length) < settings.COMPRESSION_MIN_SIZE)):
+                    passthrough = True
+                    await send(message)
+                    return
+
+                # Hold the headers back until we know how the body is compressed
+                start_message = message
+                if content_length is not None:
+                    # Body size is known up front (possibly re-chunked by inner middleware),
+                    # collect it and compress it in one go
+                    buffered = []
+                return
+
+            if (not passthrough and start_message is not None and compressor is None
+                    and message["type"] != "http.response.body"):
+                # e.g. http.response.pathsend, the server sends the file itself: send it as it is
+                passthrough = True
+                await send(start_message)
+                for chunk in buffered or []:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if buffered is not None:
+                buffered.append(body)
+                if more_body:
+                    return
+
+                start = time.perf_counter()
+                body = b"".join(buffered)
+                compressed = await compress_body(body, encoding)
+                timing = scope.get(SCOPE_KEY)
+                if timing:
+                    timing.record("compress", time.perf_counter() - start, f"{encoding} {len(body)}B")
+
+                await send_start(len(compressed))
+                await send({"type": "http.response.body", "body": compressed})
+                return
+
+            # Streamed body of unknown size, compress and flush chunk by chunk
+            if compressor is None:
+                compressor = StreamCompressor(encoding)
+                await send_start(None)
+
+            data = await compressor.compress(body) if body else b""
+            if not more_body:
+                data += compressor.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
 class ContextMiddleware(BaseHTTPMiddleware):
     """
     Middleware to handle context (company, site) based on URL structure
@@ -155,6 +309,9 @@ class ContextMiddleware(BaseHTTPMiddleware):
                 # No company or site in URL, regular path
                 request.state.context["remaining_path"] = '/'.join(path_parts)
 
+        # Pick up flash messages handed over in the URL by streamed pages
+        load_flash(request)
+
         # Process request with the context
         response = await call_next(request)
         return response
@@ -167,7 +324,8 @@ class PermissionMiddleware(BaseHTTPMiddleware):
 
     async def dispatch(self, request: Request, call_next: RequestResponseEndpoint):
         # Skip permission check for public routes
-        if request.url.path.startswith('/auth/') or request.url.path.startswith('/static/'):
+        # /events/publish authenticates the backend with its own token
+        if request.url.path.startswith('/auth/') or request.url.path.startswith('/static/') or request.url.path == '/events/publish':
             return await call_next(request)
 
         # Check if user is authenticated
@@ -176,6 +334,15 @@ class PermissionMiddleware(BaseHTTPMiddleware):
                 request.session["messages"] = [
                     {"type": "error", "text": "Please log in to access this page"}
                 ]
+
+            # HTMX follows redirects inside the XHR, ask it for a full page load instead
+            if request.headers.get("hx-request") == "true":
+                return JSONResponse(
+                    {"error": "Authentication required", "redirect": "/auth/login"},
+                    status_code=HTTP_401_UNAUTHORIZED,
+                    headers={"HX-Redirect": "/auth/login"}
+                )
+
             return RedirectResponse('/auth/login', status_code=302)
 
         # Get context
@@ -269,7 +436,8 @@ class APIExceptionMiddleware(BaseHTTPMiddleware):
                 if request.headers.get("hx-request") == "true":
                     return JSONResponse(
                         {"error": "Session expired", "redirect": "/auth/login"},
-                        status_code=HTTP_401_UNAUTHORIZED
+                        status_code=HTTP_401_UNAUTHORIZED,
+                        headers={"HX-Redirect": "/auth/login"}
                     )
 
                 return RedirectResponse(url="/auth/login", status_code=302)
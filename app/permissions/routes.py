@@ -1,58 +1,169 @@
 # app/permissions/routes.py
+import asyncio
+from typing import Dict, List, Optional
+
 from starlette.requests import Request
 from starlette.responses import RedirectResponse, JSONResponse
 from starlette.routing import Route
-from starlette.templating import Jinja2Templates
 from starlette.authentication import requires
-from pathlib import Path
 
 import httpx
 from app.api.permissions_client import get_permissions_client
+from app.config import settings
 from app.dependencies import permission_required
+from app.templating import requested_block, templates
+from app.utils.bulk import BulkResult, run_bulk, selected_ids
+from app.utils.export import export_format, export_response
+from app.utils.jobs import Job, JobAlreadyRunning, JobQueueFull, job_runner
+from app.utils.listing import ListQuery
+from app.utils.page_cache import user_page_cache
+
+# Permission fields in exported lists, in column order
+EXPORT_COLUMNS = ("id", "code", "name", "module", "description")
+
+
+def permissions_query(request: Request) -> ListQuery:
+    """
+    Read the permissions list query (page, sorting, search and filters) from the query string
+    """
+    return ListQuery.from_request(
+        request,
+        sort_keys=("name", "code", "module", "description"),
+        filters=("module",),
+        default_sort="module",
+    )
+
 
-# Get base directory path (project root)
-BASE_DIR = Path(__file__).parent.parent.parent
+async def permission_modules(permissions_client) -> List[str]:
+    """
+    Get the module names from the shared permission catalog
+
+    Args:
+        permissions_client: Permissions API client for the current request
 
-# Initialize templates
-templates = Jinja2Templates(directory=BASE_DIR / "templates")
+    Returns:
+        Module names, in display order
+    """
+    catalog = await permissions_client.get_catalog()
+    return list(catalog.modules)
 
 
 @requires(["authenticated"])
 @permission_required(["view_permissions"])
+@user_page_cache(ttl=5)
 async def permissions_list(request: Request):
     """
     Render permissions list page
     """
+    return await permissions_list_response(request)
+
+
+async def permissions_list_response(request: Request, bulk: Optional[BulkResult] = None,
+                                    notices: Optional[List[Dict[str, str]]] = None):
+    """
+    Render the permissions list, or just its table for HTMX requests
+
+    Args:
+        request: The current request, with the list query in its query string
+        bulk: Outcome of a bulk action, to mark the rows it failed for
+        notices: Messages shown above the table, e.g. the bulk action summary
+
+    Returns:
+        Streamed page response
+    """
     # Get API client
     permissions_client = get_permissions_client(request)
 
+    # Get page, sorting, search and filters from query parameters
+    query = permissions_query(request)
+    module = query.filters.get("module")
+
+    # Get any messages from session
+    messages = request.session.pop("messages", [])
+
+    # The module dropdown is outside the table, table updates don't need it
+    data = {"listing": permissions_client.get_permissions_page(query)}
+    if requested_block(request) != "table":
+        data["modules"] = permission_modules(permissions_client)
+
+    # Stream the page while the requested page of permissions and the modules are fetched from API
+    return await templates.StreamingTemplateResponse(
+        "permissions/list.html",
+        {
+            "request": request,
+            "messages": messages,
+            "selected_module": module,
+            "bulk": bulk,
+            "notices": notices or [],
+            "title": "Permissions"
+        },
+        data=data,
+        on_error=permissions_list_error,
+    )
+
+
+@requires(["authenticated"])
+@permission_required(["view_permissions"])
+async def permissions_export(request: Request):
+    """
+    Download the permissions list as CSV or NDJSON, with the list page's search and filters
+    """
+    # Get the format and the same query as the list page
+    format_name = export_format(request)
+    if format_name is None:
+        return JSONResponse({"error": "Unknown export format"}, status_code=400)
+    query = permissions_query(request)
+
     try:
-        # Get query parameters
-        params = dict(request.query_params)
-        module = params.get("module")
+        # Stream every matching permission, fetching pages from API as the file is read
+        permissions_client = get_permissions_client(request)
+        return await export_response(
+            request, permissions_client.get_permissions_page, query, "permissions", EXPORT_COLUMNS, format_name
+        )
+    except Exception as e:
+        return permissions_list_error(request, e)
+
+
+@requires(["authenticated"])
+@permission_required(["manage_permissions"])
+async def permissions_bulk(request: Request):
+    """
+    Delete the permissions ticked on the list
 
-        # Fetch permissions from API
-        permissions = await permissions_client.get_permissions(module=module)
+    The backend calls run BULK_ACTION_CONCURRENCY at a time. HTMX requests
+    get the list table back with each row's outcome, others are redirected
+    to the list.
+    """
+    # Get API client
+    permissions_client = get_permissions_client(request)
 
-        # Get all modules for filter dropdown
-        modules = await permissions_client.get_modules()
+    # Get the action and the ticked permissions
+    form_data = await request.form()
+    action = form_data.get("action")
+    permission_ids = selected_ids(form_data)
 
-        # Get any messages from session
-        messages = request.session.pop("messages", [])
+    bulk = None
+    if action != "delete" or not permission_ids:
+        messages = [{"type": "error", "text": "Select one or more permissions and an action"}]
+    else:
+        # Delete every permission, a few at a time
+        bulk = await run_bulk(action, permission_ids, permissions_client.delete_permission)
+        messages = bulk.messages("permission", "permissions", "deleted")
 
-        return templates.TemplateResponse(
-            "permissions/list.html",
-            {
-                "request": request,
-                "messages": messages,
-                "permissions": permissions,
-                "modules": modules,
-                "selected_module": module,
-                "title": "Permissions"
-            }
-        )
+    if request.headers.get("HX-Request") == "true":
+        # Update the table in place, with the outcomes above it
+        return await permissions_list_response(request, bulk, messages)
 
-    except httpx.HTTPStatusError as e:
+    # Redirect back to the same page of the list
+    request.session["messages"] = messages
+    return RedirectResponse(url=f"/permissions{permissions_query(request).url()}", status_code=302)
+
+
+def permissions_list_error(request: Request, e: Exception):
+    """
+    Handle errors loading the permissions list
+    """
+    if isinstance(e, httpx.HTTPStatusError):
         # Handle API HTTP errors
         if e.response.status_code == 403:
             # User doesn't have permission
@@ -67,12 +178,11 @@ async def permissions_list(request: Request):
         ]
         return RedirectResponse(url="/dashboard", status_code=302)
 
-    except Exception as e:
-        # Handle general exceptions
-        request.session["messages"] = [
-            {"type": "error", "text": f"An unexpected error occurred: {str(e)}"}
-        ]
-        return RedirectResponse(url="/dashboard", status_code=302)
+    # Handle general exceptions
+    request.session["messages"] = [
+        {"type": "error", "text": f"An unexpected error occurred: {str(e)}"}
+    ]
+    return RedirectResponse(url="/dashboard", status_code=302)
 
 
 @requires(["authenticated"])
@@ -87,24 +197,26 @@ async def permission_detail(request: Request):
     # Get API client
     permissions_client = get_permissions_client(request)
 
-    try:
-        # Fetch permission from API
-        permission = await permissions_client.get_permission(permission_id)
+    # Get any messages from session
+    messages = request.session.pop("messages", [])
 
-        # Get any messages from session
-        messages = request.session.pop("messages", [])
+    # Stream the page while the permission is fetched from API
+    return await templates.StreamingTemplateResponse(
+        "permissions/detail.html",
+        {
+            "request": request,
+            "messages": messages,
+        },
+        data={"permission": permissions_client.get_permission(permission_id)},
+        on_error=permission_detail_error,
+    )
 
-        return templates.TemplateResponse(
-            "permissions/detail.html",
-            {
-                "request": request,
-                "messages": messages,
-                "permission": permission,
-                "title": f"Permission: {permission.get('name', '')}"
-            }
-        )
 
-    except httpx.HTTPStatusError as e:
+def permission_detail_error(request: Request, e: Exception):
+    """
+    Handle errors loading the permission detail page
+    """
+    if isinstance(e, httpx.HTTPStatusError):
         # Handle API HTTP errors
         if e.response.status_code == 404:
             # Permission not found
@@ -124,12 +236,11 @@ async def permission_detail(request: Request):
 
         return RedirectResponse(url="/permissions", status_code=302)
 
-    except Exception as e:
-        # Handle general exceptions
-        request.session["messages"] = [
-            {"type": "error", "text": f"An unexpected error occurred: {str(e)}"}
-        ]
-        return RedirectResponse(url="/permissions", status_code=302)
+    # Handle general exceptions
+    request.session["messages"] = [
+        {"type": "error", "text": f"An unexpected error occurred: {str(e)}"}
+    ]
+    return RedirectResponse(url="/permissions", status_code=302)
 
 
 @requires(["authenticated"])
@@ -143,7 +254,7 @@ async def permission_create_page(request: Request):
 
     try:
         # Get modules for dropdown
-        modules = await permissions_client.get_modules()
+        modules = await permission_modules(permissions_client)
 
         # Get any messages from session
         messages = request.session.pop("messages", [])
@@ -234,11 +345,11 @@ async def permission_edit_page(request: Request):
     permissions_client = get_permissions_client(request)
 
     try:
-        # Fetch permission from API
-        permission = await permissions_client.get_permission(permission_id)
-
-        # Get modules for dropdown
-        modules = await permissions_client.get_modules()
+        # Fetch permission (with its version) and the modules for the dropdown together
+        (permission, version), modules = await asyncio.gather(
+            permissions_client.get_permission_for_edit(permission_id),
+            permission_modules(permissions_client),
+        )
 
         # Get any messages from session
         messages = request.session.pop("messages", [])
@@ -250,6 +361,7 @@ async def permission_edit_page(request: Request):
                 "messages": messages,
                 "permission": permission,
                 "modules": modules,
+                "version": version,
                 "title": f"Edit Permission: {permission.get('name', '')}"
             }
         )
@@ -301,8 +413,8 @@ async def permission_edit(request: Request):
             "description": form_data.get("description")
         }
 
-        # Update permission through API
-        permission = await permissions_client.update_permission(permission_id, permission_data)
+        # Update permission through API, refused if it changed since the form was loaded
+        permission = await permissions_client.update_permission(permission_id, permission_data, version=form_data.get("version") or None)
 
         # Add success message
         request.session["messages"] = [
@@ -323,6 +435,10 @@ async def permission_edit(request: Request):
         except Exception:
             pass
 
+        if e.response.status_code == 412:
+            # Saved by someone else since the form was loaded, the edit page shows their version
+            error_msg = "This permission was changed by someone else while you were editing it, please make your changes again"
+
         request.session["messages"] = [
             {"type": "error", "text": error_msg}
         ]
@@ -406,50 +522,41 @@ async def permission_delete(request: Request):
 async def initialize_permissions(request: Request):
     """
     Handle permission initialization from registry
+
+    The initialization runs as a background job; the response redirects to its status page.
     """
-    # Get API client
+    # Get API client, kept by the job after this request ends
     permissions_client = get_permissions_client(request)
 
-    try:
-        # Initialize permissions through API
-        result = await permissions_client.initialize_permissions()
+    async def initialize(job: Job) -> str:
+        job.report(progress=0.0, message="Initializing permissions from the registry")
+        result = await permissions_client.initialize_permissions(timeout=settings.JOB_API_TIMEOUT)
 
-        # Add success message
-        request.session["messages"] = [
-            {"type": "success", "text": result.get("message", "Permissions initialized successfully")}
-        ]
-
-        # Redirect to permissions list
-        return RedirectResponse(url="/permissions", status_code=302)
-
-    except httpx.HTTPStatusError as e:
-        # Handle API HTTP errors
-        error_msg = "Error initializing permissions"
-
-        # Try to extract error message from response
-        try:
-            error_data = await e.response.json()
-            error_msg = error_data.get("detail", error_msg)
-        except Exception:
-            pass
+        # Reload the catalog now rather than on the next permissions page
+        job.report(progress=0.8, message="Reloading the permission catalog")
+        await permissions_client.get_catalog()
+        return (result or {}).get("message", "Permissions initialized successfully")
 
+    try:
+        job = job_runner.submit(
+            request, "initialize_permissions", "Initialize permissions", initialize,
+            url="/permissions", key="registry",
+        )
+    except (JobQueueFull, JobAlreadyRunning) as e:
         request.session["messages"] = [
-            {"type": "error", "text": error_msg}
+            {"type": "error", "text": str(e)}
         ]
-
-        # Redirect to permissions list
         return RedirectResponse(url="/permissions", status_code=302)
 
-    except Exception as e:
-        # Handle general exceptions
-        request.session["messages"] = [
-            {"type": "error", "text": f"An unexpected error occurred: {str(e)}"}
-        ]
-        return RedirectResponse(url="/permissions", status_code=302)
+    # Follow the progress on the job's status page
+    return RedirectResponse(url=f"/jobs/{job.id}", status_code=302)
+
 
-    # Define routes
+# Define routes
 routes = [
     Route("/", endpoint=permissions_list, methods=["GET"]),
+    Route("/export", endpoint=permissions_export, methods=["GET"]),
+    Route("/bulk", endpoint=permissions_bulk, methods=["POST"]),
     Route("/create", endpoint=permission_create_page, methods=["GET"]),
     Route("/create", endpoint=permission_create, methods=["POST"]),
     Route("/{permission_id:uuid}", endpoint=permission_detail, methods=["GET"]),
@@ -1,25 +1,104 @@
 # app/roles/routes.py
+import asyncio
+import uuid
+from typing import Iterable, List, Set, Tuple
+
 from starlette.requests import Request
 from starlette.responses import RedirectResponse, JSONResponse
 from starlette.routing import Route
-from starlette.templating import Jinja2Templates
 from starlette.authentication import requires
-from pathlib import Path
 
 import httpx
 from app.api.roles_client import get_roles_client
 from app.api.permissions_client import get_permissions_client
+from app.config import settings
 from app.dependencies import permission_required
+from app.templating import templates
+from app.utils.export import export_format, export_response
+from app.utils.listing import ListQuery
+from app.utils.page_cache import user_page_cache
+
+# Role forms have a checkbox per permission, the matrix one per role and permission
+PERMISSION_FORM_MAX_FIELDS = 50000
+
+# Role fields in exported lists, in column order; permissions are listed by code
+EXPORT_COLUMNS = ("id", "name", "description", "is_system_role", "permissions")
+
+
+def roles_query(request: Request) -> ListQuery:
+    """
+    Read the roles list query (page, sorting and search) from the query string
+    """
+    return ListQuery.from_request(
+        request,
+        sort_keys=("name", "is_system_role", "permissions", "description"),
+        default_sort="name",
+    )
 
-# Get base directory path (project root)
-BASE_DIR = Path(__file__).parent.parent.parent
 
-# Initialize templates
-templates = Jinja2Templates(directory=BASE_DIR / "templates")
+def selected_permission_ids(form_data) -> Set[str]:
+    """
+    Get the permission IDs ticked in a role form
+
+    Args:
+        form_data: Submitted form, with a permission_<id> checkbox per permission
+
+    Returns:
+        Set of permission IDs
+    """
+    return {
+        key[len("permission_"):] for key, value in form_data.items()
+        if key.startswith("permission_") and value == "on"
+    }
+
+
+def split_ids(value: str) -> Set[str]:
+    """
+    Parse a comma separated list of IDs from a hidden form field
+
+    Args:
+        value: Field value
+
+    Returns:
+        Set of IDs
+    """
+    return {item for item in (value or "").split(",") if item}
+
+
+def is_uuid(value: str) -> bool:
+    """
+    Check that a role ID from a form is a UUID before putting it in an API path
+    """
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
+
+
+def permission_changes(loaded: Iterable[str], selected: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """
+    Work out the permissions to add to and remove from a role
+
+    Comparing with the permissions the form was rendered with (rather than
+    the role as it is now) only applies the user's own changes, and leaves
+    alone those saved by someone else in the meantime.
+
+    Args:
+        loaded: Permission IDs the role had when the form was rendered
+        selected: Permission IDs ticked in the form
+
+    Returns:
+        Permission IDs to add and to remove
+    """
+    loaded = set(loaded)
+    selected = set(selected)
+    return sorted(selected - loaded), sorted(loaded - selected)
 
 
 @requires(["authenticated"])
 @permission_required(["view_roles"])
+@user_page_cache(ttl=5)
 async def roles_list(request: Request):
     """
     Render roles list page
@@ -27,24 +106,50 @@ async def roles_list(request: Request):
     # Get API client
     roles_client = get_roles_client(request)
 
-    try:
-        # Fetch roles from API
-        roles = await roles_client.get_roles()
+    # Get page, sorting and search from query parameters
+    query = roles_query(request)
 
-        # Get any messages from session
-        messages = request.session.pop("messages", [])
+    # Get any messages from session
+    messages = request.session.pop("messages", [])
 
-        return templates.TemplateResponse(
-            "roles/list.html",
-            {
-                "request": request,
-                "messages": messages,
-                "roles": roles,
-                "title": "Roles"
-            }
-        )
+    # Stream the page while the requested page of roles is fetched from API
+    return await templates.StreamingTemplateResponse(
+        "roles/list.html",
+        {
+            "request": request,
+            "messages": messages,
+            "title": "Roles"
+        },
+        data={"listing": roles_client.get_roles_page(query)},
+        on_error=roles_list_error,
+    )
 
-    except httpx.HTTPStatusError as e:
+
+@requires(["authenticated"])
+@permission_required(["view_roles"])
+async def roles_export(request: Request):
+    """
+    Download the roles list as CSV or NDJSON, with the list page's search
+    """
+    # Get the format and the same query as the list page
+    format_name = export_format(request)
+    if format_name is None:
+        return JSONResponse({"error": "Unknown export format"}, status_code=400)
+    query = roles_query(request)
+
+    try:
+        # Stream every matching role, fetching pages from API as the file is read
+        roles_client = get_roles_client(request)
+        return await export_response(request, roles_client.get_roles_page, query, "roles", EXPORT_COLUMNS, format_name)
+    except Exception as e:
+        return roles_list_error(request, e)
+
+
+def roles_list_error(request: Request, e: Exception):
+    """
+    Handle errors loading the roles list
+    """
+    if isinstance(e, httpx.HTTPStatusError):
         # Handle API HTTP errors
         if e.response.status_code == 403:
             # User doesn't have permission
@@ -59,12 +164,11 @@ async def roles_list(request: Request):
         ]
         return RedirectResponse(url="/dashboard", status_code=302)
 
-    except Exception as e:
-        # Handle general exceptions
-        request.session["messages"] = [
-            {"type": "error", "text": f"An unexpected error occurred: {str(e)}"}
-        ]
-        return RedirectResponse(url="/dashboard", status_code=302)
+    # Handle general exceptions
+    request.session["messages"] = [
+        {"type": "error", "text": f"An unexpected error occurred: {str(e)}"}
+    ]
+    return RedirectResponse(url="/dashboard", status_code=302)
 
 
 @requires(["authenticated"])
@@ -79,24 +183,26 @@ async def role_detail(request: Request):
     # Get API client
     roles_client = get_roles_client(request)
 
-    try:
-        # Fetch role from API
-        role = await roles_client.get_role(role_id)
+    # Get any messages from session
+    messages = request.session.pop("messages", [])
 
-        # Get any messages from session
-        messages = request.session.pop("messages", [])
+    # Stream the page while the role is fetched from API
+    return await templates.StreamingTemplateResponse(
+        "roles/detail.html",
+        {
+            "request": request,
+            "messages": messages,
+        },
+        data={"role": roles_client.get_role(role_id)},
+        on_error=role_detail_error,
+    )
 
-        return templates.TemplateResponse(
-            "roles/detail.html",
-            {
-                "request": request,
-                "messages": messages,
-                "role": role,
-                "title": f"Role: {role.get('name', '')}"
-            }
-        )
 
-    except httpx.HTTPStatusError as e:
+def role_detail_error(request: Request, e: Exception):
+    """
+    Handle errors loading the role detail page
+    """
+    if isinstance(e, httpx.HTTPStatusError):
         # Handle API HTTP errors
         if e.response.status_code == 404:
             # Role not found
@@ -116,12 +222,11 @@ async def role_detail(request: Request):
 
         return RedirectResponse(url="/roles", status_code=302)
 
-    except Exception as e:
-        # Handle general exceptions
-        request.session["messages"] = [
-            {"type": "error", "text": f"An unexpected error occurred: {str(e)}"}
-        ]
-        return RedirectResponse(url="/roles", status_code=302)
+    # Handle general exceptions
+    request.session["messages"] = [
+        {"type": "error", "text": f"An unexpected error occurred: {str(e)}"}
+    ]
+    return RedirectResponse(url="/roles", status_code=302)
 
 
 @requires(["authenticated"])
@@ -134,14 +239,8 @@ async def role_create_page(request: Request):
     permissions_client = get_permissions_client(request)
 
     try:
-        # Fetch permissions from API
-        permissions = await permissions_client.get_permissions()
-        modules = await permissions_client.get_modules()
-
-        # Group permissions by module
-        permissions_by_module = {}
-        for module in modules:
-            permissions_by_module[module] = [p for p in permissions if p.get("module") == module]
+        # Get the permissions, grouped by module, from the shared catalog
+        catalog = await permissions_client.get_catalog()
 
         # Get any messages from session
         messages = request.session.pop("messages", [])
@@ -151,8 +250,8 @@ async def role_create_page(request: Request):
             {
                 "request": request,
                 "messages": messages,
-                "permissions": permissions,
-                "permissions_by_module": permissions_by_module,
+                "permissions": catalog.permissions,
+                "permissions_by_module": catalog.grouped(),
                 "title": "Create Role"
             }
         )
@@ -175,14 +274,10 @@ async def role_create(request: Request):
 
     try:
         # Get form data
-        form_data = await request.form()
+        form_data = await request.form(max_fields=PERMISSION_FORM_MAX_FIELDS)
 
         # Extract permission IDs (multi-select checkboxes)
-        permission_ids = []
-        for key, value in form_data.items():
-            if key.startswith('permission_') and value == 'on':
-                permission_id = key.replace('permission_', '')
-                permission_ids.append(permission_id)
+        permission_ids = sorted(selected_permission_ids(form_data))
         role_data = {
             "name": form_data.get("name"),
             "description": form_data.get("description"),
@@ -240,17 +335,14 @@ async def role_edit_page(request: Request):
     permissions_client = get_permissions_client(request)
 
     try:
-        # Fetch role from API
-        role = await roles_client.get_role(role_id)
-        # Fetch all permissions
-        permissions = await permissions_client.get_permissions()
-        modules = await permissions_client.get_modules()
-        # Get role's permissions IDs for pre-selecting checkboxes
-        role_permission_ids = [p.get("id") for p in role.get("permissions", [])]
-        # Group permissions by module
-        permissions_by_module = {}
-        for module in modules:
-            permissions_by_module[module] = [p for p in permissions if p.get("module") == module]
+        # Fetch the role (with its version) and the shared permission catalog together
+        (role, version), catalog = await asyncio.gather(
+            roles_client.get_role_for_edit(role_id),
+            permissions_client.get_catalog(),
+        )
+        # Get role's permissions IDs for pre-selecting checkboxes; only those with a
+        # checkbox are sent back as loaded, so permissions missing from the catalog are kept
+        role_permission_ids = {str(p.get("id")) for p in role.get("permissions", [])} & catalog.by_id.keys()
 
         # Get any messages from session
         messages = request.session.pop("messages", [])
@@ -260,9 +352,10 @@ async def role_edit_page(request: Request):
                 "request": request,
                 "messages": messages,
                 "role": role,
-                "permissions": permissions,
-                "permissions_by_module": permissions_by_module,
+                "permissions": catalog.permissions,
+                "permissions_by_module": catalog.grouped(),
                 "role_permission_ids": role_permission_ids,
+                "version": version,
                 "title": f"Edit Role: {role.get('name', '')}"
             }
         )
@@ -305,43 +398,40 @@ async def role_edit(request: Request):
     """
     # Get role ID from path parameters
     role_id = request.path_params.get("role_id")
-    # Get API clients
+    # Get API client
     roles_client = get_roles_client(request)
-    permissions_client = get_permissions_client(request)
 
     try:
         # Get form data
-        form_data = await request.form()
+        form_data = await request.form(max_fields=PERMISSION_FORM_MAX_FIELDS)
         # Basic role data
         role_data = {
             "name": form_data.get("name"),
             "description": form_data.get("description")
         }
 
-        # Update basic role data
-        role = await roles_client.update_role(role_id, role_data)
-        # Handle permissions separately
-        # Extract permission IDs (multi-select checkboxes)
-        new_permission_ids = []
-        for key, value in form_data.items():
-            if key.startswith('permission_') and value == 'on':
-                permission_id = key.replace('permission_', '')
-                new_permission_ids.append(permission_id)
-
-        # Get current role data to compare permissions
-        current_role = await roles_client.get_role(role_id)
-        current_permission_ids = [p.get("id") for p in current_role.get("permissions", [])]
-        # Determine which permissions to add and which to remove
-        permissions_to_add = [p_id for p_id in new_permission_ids if p_id not in current_permission_ids]
-        permissions_to_remove = [p_id for p_id in current_permission_ids if p_id not in new_permission_ids]
-
-        # Update permissions if needed
+        # Compare the ticked permissions with those the form was rendered with
+        loaded_permission_ids = form_data.get("loaded_permission_ids")
+        if loaded_permission_ids is None:
+            request.session["messages"] = [
+                {"type": "error", "text": "The form is out of date, please make your changes again"}
+            ]
+            return RedirectResponse(url=f"/roles/{role_id}/edit", status_code=302)
+        permissions_to_add, permissions_to_remove = permission_changes(
+            split_ids(loaded_permission_ids), selected_permission_ids(form_data)
+        )
+
+        # Update basic role data, refused if the role changed since the form was loaded
+        role = await roles_client.update_role(role_id, role_data, version=form_data.get("version") or None)
+
+        # Then apply the permission changes
         if permissions_to_add or permissions_to_remove:
             await roles_client.update_role_permissions(
                 role_id,
                 add_permission_ids=permissions_to_add,
                 remove_permission_ids=permissions_to_remove
             )
+
         # Add success message
         request.session["messages"] = [
             {"type": "success", "text": f"Role {role['name']} updated successfully"}
@@ -361,6 +451,10 @@ async def role_edit(request: Request):
         except Exception:
             pass
 
+        if e.response.status_code == 412:
+            # Saved by someone else since the form was loaded, the edit page shows their version
+            error_msg = "This role was changed by someone else while you were editing it, please make your changes again"
+
         request.session["messages"] = [
             {"type": "error", "text": error_msg}
         ]
@@ -434,11 +528,141 @@ async def role_delete(request: Request):
         ]
         return RedirectResponse(url="/roles", status_code=302)
 
+@requires(["authenticated"])
+@permission_required(["manage_roles"])
+async def role_matrix_page(request: Request):
+    """
+    Render the role x permission matrix for editing many roles at once
+    """
+    # Get API clients
+    roles_client = get_roles_client(request)
+    permissions_client = get_permissions_client(request)
+
+    try:
+        # Fetch the roles and the shared permission catalog together
+        roles, catalog = await asyncio.gather(
+            roles_client.get_roles(),
+            permissions_client.get_catalog(),
+        )
+        # Only permissions with a checkbox count as loaded, those missing from the catalog are kept
+        role_permission_ids = {
+            role["id"]: {str(p.get("id")) for p in role.get("permissions", [])} & catalog.by_id.keys()
+            for role in roles
+        }
+        # Number the editable roles, their form fields are named after the column
+        columns = {
+            role["id"]: column
+            for column, role in enumerate((role for role in roles if not role.get("is_system_role")), start=1)
+        }
+
+        # Get any messages from session
+        messages = request.session.pop("messages", [])
+
+        return templates.TemplateResponse(
+            "roles/matrix.html",
+            {
+                "request": request,
+                "messages": messages,
+                "roles": roles,
+                "permissions_by_module": catalog.grouped(),
+                "role_permission_ids": role_permission_ids,
+                "columns": columns,
+                "title": "Permission Matrix"
+            }
+        )
+
+    except Exception as e:
+        # Handle exceptions
+        request.session["messages"] = [
+            {"type": "error", "text": f"Error loading permission matrix: {str(e)}"}
+        ]
+        return RedirectResponse(url="/roles", status_code=302)
+
+
+@requires(["authenticated"])
+@permission_required(["manage_roles"])
+async def role_matrix_save(request: Request):
+    """
+    Handle permission matrix form submission
+
+    Every editable role has a column n with its ID in role_<n>, the
+    permissions it was rendered with in loaded_<n> and an r<n> checkbox per
+    permission. Roles whose permissions changed get one update each, sent
+    concurrently (at most ROLE_MATRIX_CONCURRENCY at a time).
+    """
+    # Get API client
+    roles_client = get_roles_client(request)
+
+    # Get form data
+    form_data = await request.form(max_fields=PERMISSION_FORM_MAX_FIELDS)
+
+    # Work out the changes per role
+    changes = {}
+    for key, value in form_data.items():
+        if key.startswith("role_"):
+            column = key[len("role_"):]
+            role_id = value
+            if not is_uuid(role_id):
+                continue
+            loaded = split_ids(form_data.get(f"loaded_{column}", ""))
+            to_add, to_remove = permission_changes(loaded, form_data.getlist(f"r{column}"))
+            if to_add or to_remove:
+                changes[role_id] = (to_add, to_remove)
+
+    if changes:
+        # Only the columns the page renders can be saved, system roles and unknown IDs are dropped
+        try:
+            roles = await roles_client.get_roles()
+        except Exception as e:
+            request.session["messages"] = [
+                {"type": "error", "text": f"Error loading roles: {str(e)}"}
+            ]
+            return RedirectResponse(url="/roles/matrix", status_code=302)
+        editable = {str(role["id"]).lower() for role in roles if not role.get("is_system_role")}
+        changes = {role_id: role_changes for role_id, role_changes in changes.items() if role_id.lower() in editable}
+
+    if not changes:
+        request.session["messages"] = [
+            {"type": "info", "text": "No permission changes to save"}
+        ]
+        return RedirectResponse(url="/roles/matrix", status_code=302)
+
+    semaphore = asyncio.Semaphore(settings.ROLE_MATRIX_CONCURRENCY)
+
+    async def save(role_id: str, to_add: List[str], to_remove: List[str]):
+        async with semaphore:
+            return await roles_client.update_role_permissions(
+                role_id,
+                add_permission_ids=to_add,
+                remove_permission_ids=to_remove
+            )
+
+    # Save the changed roles in parallel, one request per role
+    results = await asyncio.gather(
+        *(save(role_id, *role_changes) for role_id, role_changes in changes.items()),
+        return_exceptions=True,
+    )
+    failed = [result for result in results if isinstance(result, Exception)]
+
+    saved = len(changes) - len(failed)
+    messages = []
+    if saved:
+        messages.append({"type": "success", "text": f"Permissions updated for {saved} role{'s' if saved != 1 else ''}"})
+    if failed:
+        messages.append({"type": "error", "text": f"Could not update {len(failed)} role{'s' if len(failed) != 1 else ''}: {failed[0]}"})
+    request.session["messages"] = messages
+
+    return RedirectResponse(url="/roles/matrix", status_code=302)
+
+
 # Define routes
 routes = [
     Route("/", endpoint=roles_list, methods=["GET"]),
+    Route("/export", endpoint=roles_export, methods=["GET"]),
     Route("/create", endpoint=role_create_page, methods=["GET"]),
     Route("/create", endpoint=role_create, methods=["POST"]),
+    Route("/matrix", endpoint=role_matrix_page, methods=["GET"]),
+    Route("/matrix", endpoint=role_matrix_save, methods=["POST"]),
     Route("/{role_id:uuid}", endpoint=role_detail, methods=["GET"]),
     Route("/{role_id:uuid}/edit", endpoint=role_edit_page, methods=["GET"]),
     Route("/{role_id:uuid}/edit", endpoint=role_edit, methods=["POST"]),
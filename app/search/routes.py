@@ -0,0 +1,85 @@
+# app/search/routes.py
+import time
+
+from starlette.authentication import requires
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+from app.api.companies_client import get_companies_client
+from app.api.permissions_client import get_permissions_client
+from app.api.roles_client import get_roles_client
+from app.api.users_client import get_users_client
+from app.config import settings
+from app.dependencies import has_permissions
+from app.templating import templates
+from app.utils.search_index import SEARCH_KINDS, search_indexes
+from app.utils.server_timing import get_server_timing
+
+# Results shown in the navbar dropdown
+MAX_RESULTS = 8
+
+
+def visible_loaders(request: Request):
+    """
+    Get the collection loaders for the entity kinds the current user may see
+
+    Args:
+        request: The current request
+
+    Returns:
+        Functions fetching each visible collection, by kind
+    """
+    loaders = {
+        "users": lambda: get_users_client(request).get_users(limit=settings.SEARCH_USERS_FETCH_LIMIT),
+        "companies": lambda: get_companies_client(request).get_companies(),
+        "roles": lambda: get_roles_client(request).get_roles(),
+        "permissions": lambda: get_permissions_client(request).get_permissions(),
+    }
+    return {
+        kind: loader for kind, loader in loaders.items()
+        if has_permissions(request, [SEARCH_KINDS[kind]["permission"]])
+    }
+
+
+@requires(["authenticated"])
+async def search(request: Request):
+    """
+    Render typeahead results for the navbar search
+    """
+    query = request.query_params.get("q", "").strip()
+
+    # Fetch the collections that aren't in the user's index yet
+    loaders = visible_loaders(request)
+    index = await search_indexes.ensure_loaded(request, loaders)
+
+    start = time.perf_counter()
+    results = index.search(query, loaders, limit=MAX_RESULTS) if query else []
+    timing = get_server_timing(request)
+    if timing:
+        timing.record("search", time.perf_counter() - start, f"{len(results)} results")
+
+    return templates.TemplateResponse(
+        "components/search_results.html",
+        {
+            "request": request,
+            "query": query,
+            "results": results,
+        }
+    )
+
+
+@requires(["authenticated"])
+async def search_warm(request: Request):
+    """
+    Build the current user's search index before they start typing
+    """
+    await search_indexes.ensure_loaded(request, visible_loaders(request))
+    return Response(status_code=204)
+
+
+# Define routes
+routes = [
+    Route("/", endpoint=search, methods=["GET"]),
+    Route("/warm", endpoint=search_warm, methods=["GET"]),
+]
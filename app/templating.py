@@ -0,0 +1,406 @@
+import asyncio
+import html
+import json
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import jinja2
+from jinja2 import nodes
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.templating import _TemplateResponse
+
+from app.config import settings
+from app.utils.assets import asset_url_for, vendor_integrity
+from app.utils.flash import flash_url
+from app.utils.fragment_cache import FragmentCacheExtension
+from app.utils.server_timing import TimedJinja2Templates, get_server_timing
+
+# Get base directory path (project root)
+BASE_DIR = Path(__file__).parent.parent
+
+# Template source and compiled bytecode locations
+TEMPLATES_DIR = BASE_DIR / "templates"
+TEMPLATE_CACHE_DIR = BASE_DIR / settings.TEMPLATE_CACHE_DIR
+
+
+# Request header naming the block an HTMX request wants rendered, e.g. hx-headers='{"HX-Block": "table_rows"}'
+HX_BLOCK_HEADER = "HX-Block"
+
+# Block swapped into #main-content by boosted (hx-boost) navigation
+MAIN_BLOCK = "main"
+
+# Request headers that change what a page response contains
+VARY = "HX-Request, HX-Boosted, HX-Block"
+
+
+def requested_block(request: Request) -> Optional[str]:
+    """
+    Get the template block an HTMX request asked for
+
+    Args:
+        request: The current request
+
+    Returns:
+        Block name, or None when the full page should be rendered
+    """
+    if request.headers.get("HX-Request") != "true":
+        return None
+
+    # History restores after a cache miss need the whole page
+    if request.headers.get("HX-History-Restore-Request") == "true":
+        return None
+
+    block = request.headers.get(HX_BLOCK_HEADER)
+    if block:
+        return block
+
+    if request.headers.get("HX-Boosted") == "true":
+        return MAIN_BLOCK
+
+    return None
+
+
+class _BlockTemplate:
+    """
+    Stand-in for a jinja2 Template that renders only some of its blocks
+    """
+
+    def __init__(self, template: jinja2.Template, blocks: Dict[str, List], names: Sequence[str]):
+        self.template = template
+        self.name = template.name
+        self.blocks = blocks
+        self.names = names
+
+    def render(self, context: dict) -> str:
+        ctx = self.template.new_context(context)
+        ctx.blocks = {name: list(funcs) for name, funcs in self.blocks.items()}
+
+        parts = []
+        for name in self.names:
+            body = "".join(ctx.blocks[name][0](ctx))
+            parts.append(f"<title>{body.strip()}</title>" if name == "title" else body)
+
+        return "".join(parts)
+
+
+# Placeholder for the main block while the page shell is rendered
+_MAIN_PLACEHOLDER = "<!--main-block-->"
+
+
+def _script_string(value: str) -> str:
+    """
+    Encode a string as a JavaScript literal that is safe inside a <script> tag
+    """
+    return json.dumps(value).replace("<", "\\u003c")
+
+
+class Templates(TimedJinja2Templates):
+    """
+    Shared templates that render only the requested block for HTMX requests
+
+    Boosted navigation gets the title, flash messages and the "main" block,
+    requests with an HX-Block header get just that block. Everything else,
+    including history restores, gets the full page.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._parents: Dict[str, Optional[str]] = {}
+
+    def _parent_name(self, name: str) -> Optional[str]:
+        """
+        Get the name of the template a template extends, if any
+        """
+        if name not in self._parents or settings.TEMPLATE_RELOAD:
+            source, _, _ = self.env.loader.get_source(self.env, name)
+            extends = self.env.parse(source).find(nodes.Extends)
+            parent = None
+            if extends is not None and isinstance(extends.template, nodes.Const):
+                parent = extends.template.value
+            self._parents[name] = parent
+        return self._parents[name]
+
+    def inherited_blocks(self, template: jinja2.Template) -> Dict[str, List]:
+        """
+        Collect block functions through the inheritance chain, child first
+
+        Args:
+            template: Leaf template
+
+        Returns:
+            Mapping of block name to its render functions, most specific first
+        """
+        blocks: Dict[str, List] = {}
+        current = template
+        while current is not None:
+            for name, func in current.blocks.items():
+                blocks.setdefault(name, []).append(func)
+            parent = self._parent_name(current.name)
+            current = self.env.get_template(parent) if parent else None
+        return blocks
+
+    def TemplateResponse(self, *args, **kwargs):
+        # Support both the (request, name, context, ...) and the older (name, context, ...) call styles
+        fields = ("name", "context", "status_code", "headers", "media_type", "background")
+        request = kwargs.get("request")
+        positional = args
+        if args and isinstance(args[0], Request):
+            request, positional = args[0], args[1:]
+        values = dict(zip(fields, positional))
+        for field in fields:
+            values.setdefault(field, kwargs.get(field))
+
+        name = values["name"]
+        context = values["context"] or {}
+        request = request or context.get("request")
+
+        block = requested_block(request) if request is not None else None
+        if block is None:
+            response = super().TemplateResponse(*args, **kwargs)
+            response.headers.append("Vary", VARY)
+            return response
+
+        start = time.perf_counter()
+        template = self.get_template(name)
+        blocks = self.inherited_blocks(template)
+        url = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+
+        if block == MAIN_BLOCK and len(blocks.get("full_content", [])) > 1:
+            # Page has its own layout and can't be swapped into #main-content,
+            # keep the flash messages for the full page load htmx will do instead
+            if "session" in request.scope and context.get("messages"):
+                request.session["messages"] = context["messages"]
+            return Response(status_code=200, headers={"HX-Redirect": url, "Vary": VARY})
+
+        if block not in blocks:
+            # Unknown block, fall back to the full page
+            response = super().TemplateResponse(*args, **kwargs)
+            response.headers.append("Vary", VARY)
+            return response
+
+        names = [block]
+        headers = {"Vary": VARY}
+        if block == MAIN_BLOCK:
+            # Title and flash messages live outside #main-content, messages are swapped out-of-band
+            names = ["title", "messages", MAIN_BLOCK]
+            headers["HX-Push-Url"] = url
+        headers.update(values["headers"] or {})
+
+        context = dict(context)
+        context.setdefault("request", request)
+        context["hx_partial"] = True
+        for processor in self.context_processors:
+            context.update(processor(request))
+
+        response = _TemplateResponse(
+            _BlockTemplate(template, blocks, names),
+            context,
+            status_code=values["status_code"] or 200,
+            headers=headers,
+            media_type=values["media_type"],
+            background=values["background"],
+        )
+
+        timing = get_server_timing(request)
+        if timing:
+            timing.record("jinja", time.perf_counter() - start, f"{name}#{block}")
+
+        return response
+
+    def _render_shell(self, template: jinja2.Template, blocks: Dict[str, List], context: dict) -> Optional[str]:
+        """
+        Render the page around the main block, with the page data still missing
+
+        Returns:
+            Rendered page with a placeholder for the main block, or None if the
+            layout itself needs the page data
+        """
+        ctx = template.new_context(context)
+        ctx.blocks = {name: list(funcs) for name, funcs in blocks.items()}
+        ctx.blocks[MAIN_BLOCK] = [lambda _: iter([_MAIN_PLACEHOLDER])]
+        try:
+            return "".join(template.root_render_func(ctx))
+        except jinja2.UndefinedError:
+            return None
+
+    async def StreamingTemplateResponse(self, name: str, context: Dict[str, Any],
+                                        data: Dict[str, Awaitable],
+                                        on_error: Callable[[Request, Exception], Response]) -> Response:
+        """
+        Render a page while its data is still being fetched
+
+        The document head, navbar and sidebar are sent straight away so the
+        browser can start loading assets, the main block follows once every
+        awaitable in data has resolved. Backend calls run concurrently.
+
+        Args:
+            name: Template name
+            context: Template context available up front (must include the request)
+            data: Awaitables resolving to the remaining context values
+            on_error: Handler mapping a data error to a response, as in the
+                handler's own except blocks. Once the page has started
+                streaming, redirects are replayed in the browser with the
+                flash messages carried in the URL.
+
+        Returns:
+            Streaming response, or a regular response for HTMX requests and
+            pages whose layout depends on the data
+        """
+        request = context["request"]
+        keys = list(data)
+        tasks = [asyncio.ensure_future(data[key]) for key in keys]
+
+        async def resolve() -> Dict[str, Any]:
+            try:
+                return dict(zip(keys, await asyncio.gather(*tasks)))
+            finally:
+                # Stop calls still pending after a failure and mark their errors as handled
+                for task in tasks:
+                    if not task.done():
+                        task.cancel()
+                    elif not task.cancelled():
+                        task.exception()
+
+        template = self.get_template(name)
+        blocks = self.inherited_blocks(template)
+
+        # Data dependent values in the layout (e.g. the title) render empty in the shell
+        placeholders = {key: jinja2.ChainableUndefined(name=key) for key in keys}
+        shell = None
+        if requested_block(request) is None and MAIN_BLOCK in blocks:
+            start = time.perf_counter()
+            shell = self._render_shell(template, blocks, {**context, **placeholders})
+            timing = get_server_timing(request)
+            if timing:
+                timing.record("jinja-shell", time.perf_counter() - start, name)
+
+        if shell is None:
+            # Nothing to flush early: wait for the data and render normally
+            try:
+                values = await resolve()
+            except Exception as e:
+                return on_error(request, e)
+            return self.TemplateResponse(name, {**context, **values})
+
+        head, tail = shell.split(_MAIN_PLACEHOLDER, 1)
+        shell_title = self._render_title(template, blocks, {**context, **placeholders})
+
+        async def body():
+            try:
+                yield head
+                try:
+                    values = await resolve()
+
+                    start = time.perf_counter()
+                    full_context = {**context, **values}
+                    ctx = template.new_context(full_context)
+                    ctx.blocks = {name: list(funcs) for name, funcs in blocks.items()}
+                    main = "".join(ctx.blocks[MAIN_BLOCK][0](ctx))
+
+                    # Fix up the title if it depends on the page data
+                    title = self._render_title(template, blocks, full_context)
+                    if title and title != shell_title:
+                        main += f"<script>document.title = {_script_string(html.unescape(title))};</script>"
+
+                    timing = get_server_timing(request)
+                    if timing:
+                        timing.record("jinja", time.perf_counter() - start, name)
+                except Exception as e:
+                    response.failed = True
+                    main = self._error_snippet(request, on_error(request, e))
+
+                yield main
+                yield tail
+            finally:
+                # Client went away before the data arrived
+                for task in tasks:
+                    task.cancel()
+
+        response = StreamingResponse(body(), media_type="text/html", headers={"Vary": VARY})
+
+        # Lets wrappers such as the page cache tell an error redirect from a complete page
+        response.failed = False
+        return response
+
+    def _render_title(self, template: jinja2.Template, blocks: Dict[str, List], context: dict) -> Optional[str]:
+        """
+        Render the title block on its own
+        """
+        if "title" not in blocks:
+            return None
+        ctx = template.new_context(context)
+        ctx.blocks = {name: list(funcs) for name, funcs in blocks.items()}
+        return "".join(ctx.blocks["title"][0](ctx)).strip()
+
+    def _error_snippet(self, request: Request, response: Response) -> str:
+        """
+        Turn an error response into markup for a page whose headers are already sent
+        """
+        # The session cookie has been written already, hand the messages over in the URL
+        messages = request.session.pop("messages", []) if "session" in request.scope else []
+
+        location = response.headers.get("location")
+        if location is None:
+            return response.body.decode() if response.body else ""
+
+        url = flash_url(location, messages)
+        return (
+            f"<script>window.location.replace({_script_string(url)});</script>"
+            f'<noscript><meta http-equiv="refresh" content="0;url={html.escape(url)}"></noscript>'
+        )
+
+
+def create_templates() -> Templates:
+    """
+    Create the template engine shared by every route module
+
+    Compiled templates are kept in a bytecode cache on disk so a fresh
+    process can skip parsing and code generation. Templates are only
+    checked for changes on disk when TEMPLATE_RELOAD is enabled. The
+    {% cache %} tag keeps rendered fragments such as the navbar in memory.
+
+    Returns:
+        Configured templates instance
+    """
+    TEMPLATE_CACHE_DIR.mkdir(exist_ok=True, parents=True)
+
+    env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(TEMPLATES_DIR),
+        autoescape=True,
+        auto_reload=settings.TEMPLATE_RELOAD,
+        bytecode_cache=jinja2.FileSystemBytecodeCache(str(TEMPLATE_CACHE_DIR)),
+        extensions=[FragmentCacheExtension],
+    )
+
+    # Shared template globals
+    env.globals.update({
+        "app_name": settings.APP_NAME,
+        "app_version": settings.APP_VERSION,
+    })
+
+    templates = Templates(env=env)
+
+    # Static URLs point at the fingerprinted build output when there is one
+    env.globals["url_for"] = asset_url_for
+    env.globals["vendor_integrity"] = vendor_integrity
+
+    return templates
+
+
+def precompile_templates() -> int:
+    """
+    Compile every template up front so the first request doesn't pay for it
+
+    Returns:
+        Number of templates compiled
+    """
+    names = templates.env.list_templates(extensions=["html"])
+    for name in names:
+        templates.env.get_template(name)
+    return len(names)
+
+
+# Shared templates instance
+templates = create_templates()
@@ -0,0 +1,364 @@
+# app/users/imports.py
+import asyncio
+import csv
+import io
+import itertools
+import os
+import re
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+from app.api.users_client import UsersAPIClient
+from app.config import settings
+from app.utils.bulk import error_detail
+from app.utils.event_hub import event_hub
+from app.utils.export import csv_cell
+
+# Columns read from an import file; only the required ones must be present
+IMPORT_COLUMNS = ("username", "email", "password", "name", "surname", "telephone", "role", "is_active")
+REQUIRED_COLUMNS = ("username", "email", "password")
+
+# Columns of the per-row result file
+RESULT_COLUMNS = ("row", "username", "email", "status", "user_id", "error")
+
+# Loose email check, the backend has the final say
+_EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+# Rows read from the file at a time, in a worker thread
+_READ_BATCH_SIZE = 200
+
+# Values accepted for is_active; an empty cell means active
+_TRUE = ("1", "true", "yes", "y", "on")
+_FALSE = ("0", "false", "no", "n", "off")
+
+
+def read_header(file: IO[bytes]) -> List[str]:
+    """
+    Check the header row of an uploaded import file
+
+    Args:
+        file: Uploaded file, positioned at the start
+
+    Returns:
+        Column names, lower-cased
+
+    Raises:
+        ValueError: If the file isn't a CSV with the required columns
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        header = next(csv.reader(text), None)
+    except (UnicodeDecodeError, csv.Error):
+        raise ValueError("The file is not a UTF-8 CSV file")
+    finally:
+        text.detach()
+    if not header:
+        raise ValueError("The file is empty")
+
+    columns = [column.strip().lower() for column in header]
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    return columns
+
+
+def _read_batch(rows: Iterator[Tuple[int, Dict[str, str]]],
+                size: int) -> Tuple[List[Tuple[int, Dict[str, str]]], Optional[Exception]]:
+    """
+    Read the next rows of an import file, run in a worker thread
+
+    Returns:
+        The rows read, and the error that stopped reading early, if any
+    """
+    batch = []
+    try:
+        batch.extend(itertools.islice(rows, size))
+    except Exception as e:
+        return batch, e
+    return batch, None
+
+
+def parse_row(values: Dict[str, str]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Validate one import row and build the user to create
+
+    Args:
+        values: Cells of the row by column name
+
+    Returns:
+        User data and None, or None and the validation error
+    """
+    cells = {column: (values.get(column) or "").strip() for column in IMPORT_COLUMNS}
+
+    missing = [column for column in REQUIRED_COLUMNS if not cells[column]]
+    if missing:
+        return None, f"Missing {', '.join(missing)}"
+    if not _EMAIL.match(cells["email"]):
+        return None, "Invalid email address"
+
+    is_active = cells["is_active"].lower()
+    if is_active and is_active not in _TRUE + _FALSE:
+        return None, "is_active must be true or false"
+
+    return {
+        "email": cells["email"],
+        "username": cells["username"],
+        "name": cells["name"],
+        "surname": cells["surname"],
+        "telephone": cells["telephone"],
+        "password": cells["password"],
+        "role": cells["role"] or "staff",
+        "is_active": is_active not in _FALSE,
+    }, None
+
+
+class UserImport:
+    """
+    Progress and results of one CSV import
+
+    Rows are read and validated one at a time and handed to a fixed number
+    of workers creating the users, so the file is never held in memory and
+    at most USER_IMPORT_CONCURRENCY backend calls are in flight. Each row's
+    outcome is appended to a result file as soon as it is known.
+    """
+
+    def __init__(self, owner: str, filename: str):
+        """
+        Initialize an import that hasn't started yet
+
+        Args:
+            owner: Identity of the user who uploaded the file
+            filename: Name of the uploaded file
+        """
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.filename = filename
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.counts = {"read": 0, "created": 0, "invalid": 0, "failed": 0}
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self.result_path: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    @property
+    def processed(self) -> int:
+        """
+        Rows with a known outcome
+        """
+        return self.counts["created"] + self.counts["invalid"] + self.counts["failed"]
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.time()) - self.started
+
+    async def run(self, source: IO[bytes], users_client: UsersAPIClient) -> None:
+        """
+        Create the users listed in the file, then notify the owner
+
+        Args:
+            source: Copy of the uploaded file, closed when the import ends
+            users_client: Client for the uploader's session, shared by the workers
+        """
+        queue: "asyncio.Queue[Optional[Tuple[int, Dict[str, Any]]]]" = asyncio.Queue(
+            maxsize=settings.USER_IMPORT_CONCURRENCY * 2
+        )
+        result_file = tempfile.NamedTemporaryFile(
+            "w", newline="", encoding="utf-8", prefix="user-import-", suffix=".csv", delete=False
+        )
+        self.result_path = result_file.name
+        writer = csv.writer(result_file)
+        # Result rows waiting to be written, off the event loop, after each batch read
+        pending: List[tuple] = [RESULT_COLUMNS]
+
+        def record(number: int, username: str, email: str, status: str, user_id: Any = None, error: str = "") -> None:
+            # Usernames and emails come from the upload, keep spreadsheets from running them
+            pending.append((number, csv_cell(username), csv_cell(email), status, csv_cell(user_id), csv_cell(error)))
+
+        async def flush() -> None:
+            rows = pending[:]
+            del pending[:]
+            await run_in_threadpool(writer.writerows, rows)
+
+        async def create_users():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                number, user_data = item
+                try:
+                    user = await users_client.create_user(user_data)
+                    self.counts["created"] += 1
+                    user_id = user.get("id") if isinstance(user, dict) else None
+                    record(number, user_data["username"], user_data["email"], "created", user_id)
+                except Exception as e:
+                    self.counts["failed"] += 1
+                    record(number, user_data["username"], user_data["email"], "failed", error=error_detail(e))
+
+        workers = [asyncio.create_task(create_users()) for _ in range(settings.USER_IMPORT_CONCURRENCY)]
+        try:
+            try:
+                seen = set()
+                rows = self._rows(source)
+                # The file may be on disk and up to USER_IMPORT_MAX_SIZE, read it in a thread a batch at a time
+                full = False
+                while not full:
+                    batch, read_error = await run_in_threadpool(_read_batch, rows, _READ_BATCH_SIZE)
+                    if not batch and read_error is None:
+                        break
+                    for number, values in batch:
+                        self.counts["read"] += 1
+                        user_data, error = parse_row(values)
+                        if user_data is not None:
+                            # Duplicates within the file would only fail one by one on the backend
+                            keys = (("username", user_data["username"].lower()), ("email", user_data["email"].lower()))
+                            duplicate = next((name for name, value in keys if (name, value) in seen), None)
+                            if duplicate:
+                                user_data, error = None, f"Duplicate {duplicate} in the file"
+                            seen.update(keys)
+
+                        if user_data is None:
+                            self.counts["invalid"] += 1
+                            record(number, values.get("username", ""), values.get("email", ""), "invalid", error=error)
+                        else:
+                            # Waits while every worker is busy, so reading keeps pace with the backend
+                            await queue.put((number, user_data))
+
+                        if self.counts["read"] >= settings.USER_IMPORT_MAX_ROWS:
+                            self.error = f"Only the first {settings.USER_IMPORT_MAX_ROWS} rows were imported"
+                            full = True
+                            break
+                    await flush()
+                    if read_error is not None and not full:
+                        raise read_error
+
+            except Exception as e:
+                # e.g. a file that isn't UTF-8 past the header, the rows read so far are kept
+                print(f"Error importing users from {self.filename}: {e}")
+                self.error = f"Import stopped at row {self.counts['read'] + 1}: {e}"
+
+            # Let the workers create the users already queued, and record them
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+            await flush()
+
+        finally:
+            # Only left running when the import itself is cancelled, on shutdown
+            for worker in workers:
+                worker.cancel()
+            writer.writerows(pending)
+            result_file.close()
+            source.close()
+            self.finished = time.time()
+
+            event_hub.publish(f"user:{self.owner}", "notification", {
+                "title": "User import finished",
+                "icon": "people",
+                "level": "warning" if self.error or self.counts["invalid"] or self.counts["failed"] else "success",
+                "text": f"{self.counts['created']} created, {self.processed - self.counts['created']} not imported",
+                "url": f"/users/import/{self.id}",
+            })
+
+    @staticmethod
+    def _rows(source: IO[bytes]) -> Iterator[Tuple[int, Dict[str, str]]]:
+        """
+        Read the data rows of the file with their line numbers in the spreadsheet
+        """
+        text = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+        reader = csv.reader(text)
+        columns = [column.strip().lower() for column in next(reader)]
+        for values in reader:
+            if not any(value.strip() for value in values):
+                continue
+            yield reader.line_num, dict(zip(columns, values))
+
+    def discard(self) -> None:
+        """
+        Delete the result file
+        """
+        if self.result_path:
+            try:
+                os.unlink(self.result_path)
+            except OSError:
+                pass
+
+
+class UserImports:
+    """
+    Imports in progress and recently finished, oldest dropped first
+
+    Imports run in this process, so their progress pages have to be served
+    by the same worker that received the upload.
+    """
+
+    def __init__(self, max_imports: int):
+        """
+        Args:
+            max_imports: Number of imports kept, with their result files
+        """
+        self.max_imports = max_imports
+        self.imports: "OrderedDict[str, UserImport]" = OrderedDict()
+
+    def start(self, request: Request, source: IO[bytes], filename: str) -> UserImport:
+        """
+        Start importing an uploaded file in the background
+
+        Args:
+            request: The upload request, whose session the users are created with
+            source: Copy of the uploaded file, positioned at the start
+            filename: Name of the uploaded file
+
+        Returns:
+            The started import
+        """
+        job = UserImport(request.user.identity, filename)
+        job.task = asyncio.create_task(job.run(source, UsersAPIClient(request)))
+        self.imports[job.id] = job
+
+        # Forget the oldest finished imports
+        for old in [old for old in self.imports.values() if old.done][:max(len(self.imports) - self.max_imports, 0)]:
+            old.discard()
+            del self.imports[old.id]
+        return job
+
+    async def stop(self) -> None:
+        """
+        Cancel the imports still running and delete every result file, called on application shutdown
+        """
+        tasks = [job.task for job in self.imports.values() if job.task is not None and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job in self.imports.values():
+            job.discard()
+        self.imports.clear()
+
+    def get(self, request: Request, import_id: str) -> Optional[UserImport]:
+        """
+        Get one of the current user's imports
+
+        Args:
+            request: The current request
+            import_id: Import ID
+
+        Returns:
+            The import, or None if it doesn't exist or belongs to someone else
+        """
+        job = self.imports.get(import_id)
+        if job is None or job.owner != request.user.identity:
+            return None
+        return job
+
+
+# Process-wide user imports
+user_imports = UserImports(settings.USER_IMPORT_HISTORY)
@@ -1,14 +1,43 @@
+import shutil
+import tempfile
+
+from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request
-from starlette.responses import RedirectResponse, JSONResponse
+from starlette.responses import FileResponse, RedirectResponse, JSONResponse
 from starlette.routing import Route
-from starlette.templating import Jinja2Templates
 from starlette.authentication import requires
 
 import httpx
 from app.api_client import get_api_client
-
-# Initialize templates
-templates = Jinja2Templates(directory="templates")
+from app.api.users_client import get_users_client
+from app.config import settings
+from app.templating import templates
+from app.users.imports import IMPORT_COLUMNS, REQUIRED_COLUMNS, read_header, user_imports
+from app.utils.bulk import run_bulk, selected_ids
+from app.utils.export import export_format, export_response
+from app.utils.listing import ListQuery
+
+# Bulk actions on the users list, with the past tense used in messages
+BULK_ACTIONS = {
+    "delete": "deleted",
+    "activate": "activated",
+    "deactivate": "deactivated",
+}
+
+# User fields in exported lists, in column order
+EXPORT_COLUMNS = ("id", "username", "email", "first_name", "last_name", "role", "is_active")
+
+
+def users_query(request: Request) -> ListQuery:
+    """
+    Read the users list query (page, sorting, search and filters) from the query string
+    """
+    return ListQuery.from_request(
+        request,
+        sort_keys=("username", "email", "first_name", "last_name", "role", "is_active"),
+        filters=("company_id", "site_id"),
+        default_sort="username",
+    )
 
 
 @requires(["authenticated"])
@@ -17,19 +46,14 @@ async def users_list(request: Request):
     Render users list page
     """
     # Get API client
-    api_client = get_api_client(request)
+    users_client = get_users_client(request)
 
     try:
-        # Get query parameters
-        params = dict(request.query_params)
-        page = int(params.get("page", 1))
-        limit = int(params.get("limit", 10))
-
-        # Calculate offset for pagination
-        offset = (page - 1) * limit
+        # Get page, sorting, search and filters from query parameters
+        query = users_query(request)
 
-        # Fetch users from API
-        users = await api_client.get("/users", params={"skip": offset, "limit": limit})
+        # Fetch the requested page of users from API, with the total count
+        listing = await users_client.get_users_page(query)
 
         # Get any messages from session
         messages = request.session.pop("messages", [])
@@ -39,10 +63,11 @@ async def users_list(request: Request):
             {
                 "request": request,
                 "messages": messages,
-                "users": users,
-                "page": page,
-                "limit": limit,
-                "total": len(users),  # This would be replaced with a total count from the API
+                "listing": listing,
+                "users": listing.items,
+                "page": query.page,
+                "limit": query.limit,
+                "total": listing.total,
                 "title": "Users"
             }
         )
@@ -70,6 +95,202 @@ async def users_list(request: Request):
         return RedirectResponse(url="/dashboard", status_code=302)
 
 
+@requires(["authenticated"])
+async def users_export(request: Request):
+    """
+    Download the users list as CSV or NDJSON, with the list page's search and filters
+    """
+    # Get the format and the same query as the list page
+    format_name = export_format(request)
+    if format_name is None:
+        return JSONResponse({"error": "Unknown export format"}, status_code=400)
+    query = users_query(request)
+
+    # Get API client
+    users_client = get_users_client(request)
+
+    try:
+        # Stream every matching user, fetching pages from API as the file is read
+        return await export_response(request, users_client.get_users_page, query, "users", EXPORT_COLUMNS, format_name)
+
+    except httpx.HTTPStatusError as e:
+        # Handle API HTTP errors
+        if e.response.status_code == 403:
+            # User doesn't have permission
+            request.session["messages"] = [
+                {"type": "error", "text": "You don't have permission to view users"}
+            ]
+            return RedirectResponse(url="/dashboard", status_code=302)
+
+        # Handle other API errors
+        request.session["messages"] = [
+            {"type": "error", "text": f"Error exporting users: {str(e)}"}
+        ]
+        return RedirectResponse(url="/users", status_code=302)
+
+    except Exception as e:
+        # Handle general exceptions
+        request.session["messages"] = [
+            {"type": "error", "text": f"An unexpected error occurred: {str(e)}"}
+        ]
+        return RedirectResponse(url="/users", status_code=302)
+
+
+@requires(["authenticated"])
+async def users_bulk(request: Request):
+    """
+    Apply a bulk action (delete, activate, deactivate) to the users ticked on the list
+
+    The backend calls run BULK_ACTION_CONCURRENCY at a time and the
+    outcome is shown on the list the request is redirected back to.
+    """
+    # Get API client
+    users_client = get_users_client(request)
+
+    # Get the action and the ticked users
+    form_data = await request.form()
+    action = form_data.get("action")
+    user_ids = selected_ids(form_data)
+    calls = {
+        "delete": users_client.delete_user,
+        "activate": lambda user_id: users_client.set_user_active(user_id, True),
+        "deactivate": lambda user_id: users_client.set_user_active(user_id, False),
+    }
+
+    if action not in calls or not user_ids:
+        request.session["messages"] = [{"type": "error", "text": "Select one or more users and an action"}]
+    else:
+        # Run the action for every user, a few at a time
+        bulk = await run_bulk(action, user_ids, calls[action])
+        request.session["messages"] = bulk.messages("user", "users", BULK_ACTIONS[action])
+
+    # Redirect back to the same page of the list
+    return RedirectResponse(url=f"/users{users_query(request).url()}", status_code=302)
+
+
+@requires(["authenticated"])
+async def user_import_page(request: Request):
+    """
+    Render the CSV user import page
+    """
+    # Get any messages from session
+    messages = request.session.pop("messages", [])
+
+    return templates.TemplateResponse(
+        "users/import.html",
+        {
+            "request": request,
+            "messages": messages,
+            "columns": IMPORT_COLUMNS,
+            "required_columns": REQUIRED_COLUMNS,
+            "title": "Import Users"
+        }
+    )
+
+
+def _copy_upload(upload) -> tempfile.SpooledTemporaryFile:
+    """
+    Copy an uploaded file so the import can keep reading it after the request ends
+    """
+    copy = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    upload.file.seek(0)
+    shutil.copyfileobj(upload.file, copy)
+    copy.seek(0)
+    return copy
+
+
+@requires(["authenticated"])
+async def user_import(request: Request):
+    """
+    Handle a CSV user import upload
+
+    The header is checked straight away; the rows are validated and the
+    users created in the background while the status page shows progress.
+    """
+    # Get the uploaded file
+    form_data = await request.form()
+    upload = form_data.get("file")
+    if upload is None or not hasattr(upload, "file") or not upload.filename:
+        request.session["messages"] = [
+            {"type": "error", "text": "Choose a CSV file to import"}
+        ]
+        return RedirectResponse(url="/users/import", status_code=302)
+
+    if upload.size is not None and upload.size > settings.USER_IMPORT_MAX_SIZE:
+        limit = settings.USER_IMPORT_MAX_SIZE // (1024 * 1024)
+        request.session["messages"] = [
+            {"type": "error", "text": f"The file is too large, the limit is {limit} MB"}
+        ]
+        return RedirectResponse(url="/users/import", status_code=302)
+
+    # Check the columns before starting, off the event loop as the file may be on disk
+    source = await run_in_threadpool(_copy_upload, upload)
+    try:
+        await run_in_threadpool(read_header, source)
+    except ValueError as e:
+        source.close()
+        request.session["messages"] = [
+            {"type": "error", "text": str(e)}
+        ]
+        return RedirectResponse(url="/users/import", status_code=302)
+    source.seek(0)
+
+    # Create the users in the background and follow the progress
+    job = user_imports.start(request, source, upload.filename)
+    return RedirectResponse(url=f"/users/import/{job.id}", status_code=302)
+
+
+@requires(["authenticated"])
+async def user_import_status(request: Request):
+    """
+    Render the progress of a user import
+
+    The progress block polls itself with HTMX until the import finishes.
+    """
+    # Get the import, only its owner can follow it
+    job = user_imports.get(request, request.path_params["import_id"])
+    if job is None:
+        request.session["messages"] = [
+            {"type": "error", "text": "Import not found, it may have expired"}
+        ]
+        return RedirectResponse(url="/users/import", status_code=302)
+
+    # Get any messages from session
+    messages = request.session.pop("messages", [])
+
+    return templates.TemplateResponse(
+        "users/import_status.html",
+        {
+            "request": request,
+            "messages": messages,
+            "job": job,
+            "title": "Import Users"
+        }
+    )
+
+
+@requires(["authenticated"])
+async def user_import_results(request: Request):
+    """
+    Download the per-row results of a finished user import as CSV
+    """
+    # Get the import, only its owner can download the results
+    job = user_imports.get(request, request.path_params["import_id"])
+    if job is None or not job.done:
+        request.session["messages"] = [
+            {"type": "error", "text": "The results are available once the import has finished"}
+        ]
+        return RedirectResponse(url=f"/users/import/{job.id}" if job else "/users/import", status_code=302)
+
+    name = job.filename.rsplit(".", 1)[0] or "users"
+    return FileResponse(
+        job.result_path,
+        media_type="text/csv; charset=utf-8",
+        filename=f"{name}-results.csv",
+        headers={"Cache-Control": "no-store"},
+    )
+
+
 @requires(["authenticated"])
 async def user_detail(request: Request):
     """
@@ -212,11 +433,11 @@ async def user_edit_page(request: Request):
     user_id = request.path_params.get("user_id")
 
     # Get API client
-    api_client = get_api_client(request)
+    users_client = get_users_client(request)
 
     try:
-        # Fetch user from API
-        user = await api_client.get(f"/users/{user_id}")
+        # Fetch user from API, with the version to send back when saving
+        user, version = await users_client.get_user_for_edit(user_id)
 
         # Get any messages from session
         messages = request.session.pop("messages", [])
@@ -227,6 +448,7 @@ async def user_edit_page(request: Request):
                 "request": request,
                 "messages": messages,
                 "user": user,
+                "version": version,
                 "title": f"Edit User: {user.get('username', '')}"
             }
         )
@@ -268,7 +490,7 @@ async def user_edit(request: Request):
     user_id = request.path_params.get("user_id")
 
     # Get API client
-    api_client = get_api_client(request)
+    users_client = get_users_client(request)
 
     try:
         # Get form data
@@ -288,8 +510,8 @@ async def user_edit(request: Request):
         if password:
             user_data["password"] = password
 
-        # Update user through API
-        user = await api_client.put(f"/users/{user_id}", json_data=user_data)
+        # Update user through API, refused if it changed since the form was loaded
+        user = await users_client.update_user(user_id, user_data, version=form_data.get("version") or None)
 
         # Add success message
         request.session["messages"] = [
@@ -310,6 +532,10 @@ async def user_edit(request: Request):
         except Exception:
             pass
 
+        if e.response.status_code == 412:
+            # Saved by someone else since the form was loaded, the edit page shows their version
+            error_msg = "This user was changed by someone else while you were editing it, please make your changes again"
+
         request.session["messages"] = [
             {"type": "error", "text": error_msg}
         ]
@@ -391,6 +617,12 @@ async def user_delete(request: Request):
 # Define routes
 routes = [
     Route("/", endpoint=users_list, methods=["GET"]),
+    Route("/export", endpoint=users_export, methods=["GET"]),
+    Route("/bulk", endpoint=users_bulk, methods=["POST"]),
+    Route("/import", endpoint=user_import_page, methods=["GET"]),
+    Route("/import", endpoint=user_import, methods=["POST"]),
+    Route("/import/{import_id}", endpoint=user_import_status, methods=["GET"]),
+    Route("/import/{import_id}/results", endpoint=user_import_results, methods=["GET"]),
     Route("/create", endpoint=user_create_page, methods=["GET"]),
     Route("/create", endpoint=user_create, methods=["POST"]),
     Route("/{user_id:uuid}", endpoint=user_detail, methods=["GET"]),
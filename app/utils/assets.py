@@ -0,0 +1,403 @@
+import hashlib
+import json
+import mimetypes
+import os
+from email.utils import formatdate
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import jinja2
+from markupsafe import Markup
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from app.config import settings
+from app.utils.compression import COMPRESSIBLE_TYPES, choose_encoding, compress, supported_encodings
+
+# Get base directory path (project root)
+BASE_DIR = Path(__file__).parent.parent.parent
+
+# Static source files and the fingerprinted build output
+STATIC_DIR = BASE_DIR / "static"
+DIST_DIR = STATIC_DIR / "dist"
+MANIFEST_PATH = DIST_DIR / "manifest.json"
+
+# Third-party assets vendored into static/ by scripts/build_assets.py, with
+# the pinned upstream URL they are fetched from and its sha384 integrity hash
+VENDOR_ASSETS: Dict[str, Tuple[str, Optional[str]]] = {
+    "vendor/bootstrap/bootstrap.min.css": (
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css",
+        "sha384-T3c6CoIi6uLrA9TneNEoa7RxnatzjcDSCmG1MXxSR1GAsXEV/Dwwykc2MPK8M2HN",
+    ),
+    "vendor/bootstrap/bootstrap.bundle.min.js": (
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js",
+        "sha384-C6RzsynM9kWDrMNeT87bh95OGNyZPhcTNXj1NW7RuBCsyN/o0jlpcV8Qyq46cDfL",
+    ),
+    # Not pinned yet, scripts/build_assets.py --allow-unpinned prints their hashes
+    "vendor/bootstrap-icons/bootstrap-icons.min.css": (
+        "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.2/font/bootstrap-icons.min.css",
+        None,
+    ),
+    "vendor/bootstrap-icons/fonts/bootstrap-icons.woff2": (
+        "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.2/font/fonts/bootstrap-icons.woff2",
+        None,
+    ),
+    "vendor/bootstrap-icons/fonts/bootstrap-icons.woff": (
+        "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.2/font/fonts/bootstrap-icons.woff",
+        None,
+    ),
+    "vendor/htmx/htmx.min.js": (
+        "https://unpkg.com/htmx.org@1.9.9/dist/htmx.min.js",
+        "sha384-QFjmbokDn2DjBjq+fM+8LUIVrAgqcNW2s0PjAxHETgRn9l4fvX31ZxDxvwQnyMOX",
+    ),
+}
+
+# Fingerprinted files never change, browsers can keep them for a year without revalidating
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class AssetManifest:
+    """
+    Map of source asset paths to their fingerprinted build output
+    """
+
+    def __init__(self, path: Path):
+        """
+        Initialize the manifest
+
+        Args:
+            path: Location of manifest.json
+        """
+        self.path = path
+        self.entries: Dict[str, str] = {}
+        self.mtime: Optional[float] = None
+
+    def load(self) -> int:
+        """
+        Read the manifest from disk, if the asset build has been run
+
+        Returns:
+            Number of fingerprinted assets
+        """
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            self.entries, self.mtime = {}, None
+            return 0
+
+        if mtime != self.mtime:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+            self.mtime = mtime
+        return len(self.entries)
+
+    def resolve(self, path: str) -> str:
+        """
+        Get the path to serve for a source asset
+
+        Args:
+            path: Path relative to static/, e.g. "css/main.css"
+
+        Returns:
+            Fingerprinted path, or the source path if it isn't in the manifest
+        """
+        if settings.DEBUG:
+            # Pick up rebuilds without a restart
+            self.load()
+        return self.entries.get(path.lstrip("/"), path)
+
+
+# Process-wide manifest, loaded at startup
+manifest = AssetManifest(MANIFEST_PATH)
+
+
+@jinja2.pass_context
+def asset_url_for(context: dict, name: str, /, **path_params) -> str:
+    """
+    Template url_for that resolves static files through the asset manifest
+
+    Vendored assets that haven't been fetched yet fall back to their pinned
+    upstream URL, so a checkout works before the asset build has run.
+    """
+    request: Request = context["request"]
+    if name == "static" and "path" in path_params:
+        path = manifest.resolve(path_params["path"])
+        fallback = vendor_fallback(path)
+        if fallback is not None:
+            return fallback[0]
+        path_params["path"] = path
+    return str(request.url_for(name, **path_params))
+
+
+def vendor_fallback(path: str) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    Get the upstream URL and integrity hash of a vendored asset that hasn't been fetched
+
+    Args:
+        path: Path relative to static/, as resolved through the manifest
+
+    Returns:
+        The pinned URL and hash, or None if the asset is served by this app
+    """
+    if path in VENDOR_ASSETS and not (STATIC_DIR / path).exists():
+        return VENDOR_ASSETS[path]
+    return None
+
+
+def vendor_integrity(path: str) -> Markup:
+    """
+    Template helper adding the integrity attributes of an asset loaded from its CDN
+
+    Args:
+        path: Path relative to static/, e.g. "vendor/htmx/htmx.min.js"
+
+    Returns:
+        integrity and crossorigin attributes, or nothing when this app serves the asset
+    """
+    fallback = vendor_fallback(manifest.resolve(path))
+    if fallback is None or fallback[1] is None:
+        return Markup("")
+    return Markup(' integrity="{}" crossorigin="anonymous"').format(fallback[1])
+
+
+# File name suffixes of precompressed variants written by scripts/build_assets.py
+VARIANT_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+class StaticAsset:
+    """
+    A static file held in memory, with its precompressed variants
+    """
+
+    def __init__(self, path: str, full_path: Path, stat_result: os.stat_result):
+        """
+        Initialize the asset from its file on disk
+
+        Args:
+            path: Path relative to the static directory
+            full_path: Location on disk
+            stat_result: Result of os.stat() for the file
+        """
+        self.path = path
+        self.full_path = full_path
+        self.stat_result = stat_result
+
+        content_type, _ = mimetypes.guess_type(path)
+        content_type = content_type or "application/octet-stream"
+        if content_type.startswith("text/") or content_type == "application/javascript":
+            content_type += "; charset=utf-8"
+        self.content_type = content_type
+
+        self.last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        self.immutable = full_path.is_relative_to(DIST_DIR)
+
+        # Large files stay on disk and are sent with FileResponse
+        self.body: Optional[bytes] = None
+        self.etag = f'"{int(stat_result.st_mtime):x}-{stat_result.st_size:x}"'
+        self.variants: Dict[str, bytes] = {}
+
+        if stat_result.st_size <= settings.STATIC_MEMORY_MAX_SIZE:
+            self.body = full_path.read_bytes()
+            self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:16] + '"'
+            if content_type.startswith(COMPRESSIBLE_TYPES) and len(self.body) >= settings.COMPRESSION_MIN_SIZE:
+                self._load_variants()
+
+    def _load_variants(self) -> None:
+        for encoding in supported_encodings():
+            # Prefer the variant written by the asset build, compress here otherwise
+            variant_path = self.full_path.with_name(self.full_path.name + VARIANT_SUFFIXES[encoding])
+            if variant_path.exists() and variant_path.stat().st_mtime >= self.stat_result.st_mtime:
+                variant = variant_path.read_bytes()
+            else:
+                variant = compress(self.body, encoding, static=True)
+
+            # Keep it only if it actually saves bytes
+            if len(variant) < len(self.body):
+                self.variants[encoding] = variant
+
+    def is_stale(self) -> bool:
+        """
+        Check whether the file changed on disk since it was loaded
+        """
+        try:
+            stat_result = self.full_path.stat()
+        except FileNotFoundError:
+            return True
+        return (stat_result.st_mtime, stat_result.st_size) != (self.stat_result.st_mtime, self.stat_result.st_size)
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range from a Range header
+
+    Args:
+        header: Range request header, e.g. "bytes=0-1023"
+        size: Size of the full body
+
+    Returns:
+        Inclusive (start, end) offsets, or None when the range can't be satisfied
+
+    Raises:
+        ValueError: If the header isn't a single byte range we support
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        raise ValueError("Only single byte ranges are supported")
+
+    start, _, end = ranges.strip().partition("-")
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            return None
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+class AssetStaticFiles(StaticFiles):
+    """
+    Static file server that keeps the asset tree in memory
+
+    Files up to STATIC_MEMORY_MAX_SIZE are read once at startup together
+    with brotli and gzip variants, and served without touching the disk.
+    Larger files are streamed with FileResponse, which uses the server's
+    zero-copy pathsend extension when available. Both support conditional
+    and Range requests. Fingerprinted build output is marked immutable.
+
+    Files are only checked for changes on disk in DEBUG.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.assets: Dict[str, StaticAsset] = {}
+
+    def load(self) -> int:
+        """
+        Read the asset tree into memory
+
+        Returns:
+            Number of files indexed
+        """
+        directory = Path(self.directory)
+        assets = {}
+        for full_path in directory.rglob("*"):
+            if not full_path.is_file():
+                continue
+
+            # Precompressed variants are served through the file they belong to
+            if full_path.suffix in (".br", ".gz") and full_path.with_suffix("").is_file():
+                continue
+
+            path = full_path.relative_to(directory).as_posix()
+            assets[path] = StaticAsset(path, full_path, full_path.stat())
+
+        self.assets = assets
+        return len(assets)
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+
+        path = Path(path).as_posix()
+        asset = self.assets.get(path)
+
+        if settings.DEBUG and (asset is None or asset.is_stale()):
+            # Pick up new and edited files while developing
+            full_path, stat_result = self.lookup_path(path)
+            if stat_result is None or not os.path.isfile(full_path):
+                self.assets.pop(path, None)
+                raise HTTPException(status_code=404)
+            asset = self.assets[path] = StaticAsset(path, Path(full_path), stat_result)
+
+        if asset is None:
+            raise HTTPException(status_code=404)
+
+        if asset.body is None:
+            return self.file_response(asset.full_path, asset.stat_result, scope)
+
+        return self.asset_response(asset, scope)
+
+    def asset_response(self, asset: StaticAsset, scope: Scope) -> Response:
+        """
+        Build the response for an in-memory asset
+
+        Args:
+            asset: The asset to serve
+            scope: ASGI scope of the request
+
+        Returns:
+            Full, partial (206), not modified (304) or unsatisfiable range (416) response
+        """
+        request_headers = Headers(scope=scope)
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if if_range and if_range not in (asset.etag, asset.last_modified):
+            # The client's partial copy is outdated, send everything
+            range_header = None
+
+        # Ranges always refer to the uncompressed bytes
+        encoding = None
+        if asset.variants and not range_header:
+            encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+            if encoding not in asset.variants:
+                encoding = None
+
+        body = asset.variants[encoding] if encoding else asset.body
+        etag = f'"{asset.etag[1:-1]}-{encoding}"' if encoding else asset.etag
+
+        headers = {
+            "Content-Type": asset.content_type,
+            "ETag": etag,
+            "Last-Modified": asset.last_modified,
+            "Accept-Ranges": "bytes",
+        }
+        if asset.variants:
+            headers["Vary"] = "Accept-Encoding"
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        if asset.immutable:
+            headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+
+        if self.is_not_modified(Headers(headers=headers), request_headers):
+            headers.pop("Content-Type")
+            return Response(status_code=304, headers=headers)
+
+        status_code = 200
+        if range_header:
+            try:
+                byte_range = parse_range(range_header, len(body))
+            except ValueError:
+                byte_range = (0, len(body) - 1)
+
+            if byte_range is None:
+                headers["Content-Range"] = f"bytes */{len(body)}"
+                return Response(status_code=416, headers=headers)
+
+            start, end = byte_range
+            if (start, end) != (0, len(body) - 1):
+                status_code = 206
+                headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+                body = body[start:end + 1]
+
+        if scope["method"] == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            body = b""
+
+        return Response(body, status_code=status_code, headers=headers)
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope,
+                      status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        cache_control = IMMUTABLE_CACHE_CONTROL if Path(full_path).is_relative_to(DIST_DIR) else None
+        # Sent from disk as it is, compressing it would read the whole file into memory
+        response.headers["Cache-Control"] = f"{cache_control}, no-transform" if cache_control else "no-transform"
+        return response
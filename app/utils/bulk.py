@@ -0,0 +1,119 @@
+import asyncio
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+import httpx
+
+from app.config import settings
+
+
+class BulkResult:
+    """
+    Outcome of one action applied to many selected rows
+    """
+
+    def __init__(self, action: str, succeeded: List[str], errors: Dict[str, str]):
+        """
+        Args:
+            action: Name of the action, e.g. "delete"
+            succeeded: IDs the action worked for
+            errors: Error message by ID, for the IDs it failed for
+        """
+        self.action = action
+        self.succeeded = succeeded
+        self.errors = errors
+
+    def messages(self, singular: str, plural: str, past: str) -> List[Dict[str, str]]:
+        """
+        Build the flash messages summing up the outcome
+
+        Args:
+            singular: Name of one row, e.g. "company"
+            plural: Name of several rows, e.g. "companies"
+            past: Past tense of the action, e.g. "deleted"
+
+        Returns:
+            A success message, an error message, or both
+        """
+        def rows(count: int) -> str:
+            return f"{count} {singular if count == 1 else plural}"
+
+        messages = []
+        if self.succeeded:
+            messages.append({"type": "success", "text": f"{rows(len(self.succeeded))} {past}"})
+        if self.errors:
+            first = next(iter(self.errors.values()))
+            messages.append({"type": "error", "text": f"{rows(len(self.errors))} could not be {past}: {first}"})
+        return messages
+
+
+def selected_ids(form_data) -> List[str]:
+    """
+    Get the row IDs ticked in a list page's bulk form
+
+    Args:
+        form_data: Submitted form, with an "ids" checkbox per row
+
+    Returns:
+        Distinct, well-formed IDs in the order they were ticked, at most BULK_ACTION_MAX_ITEMS
+    """
+    ids = []
+    for value in form_data.getlist("ids"):
+        try:
+            uuid.UUID(value)
+        except ValueError:
+            continue
+        if value not in ids:
+            ids.append(value)
+    return ids[:settings.BULK_ACTION_MAX_ITEMS]
+
+
+def error_detail(e: Exception) -> str:
+    """
+    Get a short reason for a failed backend call
+
+    Args:
+        e: Exception raised by an API client
+
+    Returns:
+        The backend's "detail" message, or a description of the error
+    """
+    if isinstance(e, httpx.HTTPStatusError):
+        try:
+            detail = e.response.json().get("detail")
+        except Exception:
+            detail = None
+        return str(detail or f"HTTP {e.response.status_code}")
+    return str(e) or type(e).__name__
+
+
+async def run_bulk(action: str, ids: Iterable[str], call: Callable[[str], Awaitable[Any]],
+                   limit: Optional[int] = None) -> BulkResult:
+    """
+    Apply an API call to many rows, a few at a time
+
+    Every call runs even if some fail; each row gets its own outcome.
+
+    Args:
+        action: Name of the action, e.g. "delete"
+        ids: Row IDs
+        call: Client method taking one ID, e.g. delete_company
+        limit: Calls in flight at once, BULK_ACTION_CONCURRENCY by default
+
+    Returns:
+        The IDs that succeeded and the error for each that failed
+    """
+    ids = list(ids)
+    semaphore = asyncio.Semaphore(limit or settings.BULK_ACTION_CONCURRENCY)
+
+    async def run(row_id: str):
+        async with semaphore:
+            return await call(row_id)
+
+    results = await asyncio.gather(*(run(row_id) for row_id in ids), return_exceptions=True)
+
+    succeeded = [row_id for row_id, result in zip(ids, results) if not isinstance(result, Exception)]
+    errors = {
+        row_id: error_detail(result) for row_id, result in zip(ids, results) if isinstance(result, Exception)
+    }
+    return BulkResult(action, succeeded, errors)
@@ -0,0 +1,289 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from starlette.requests import Request
+
+from app.config import settings
+
+
+class UserCollections:
+    """
+    Collections and single entities cached for one user
+    """
+
+    __slots__ = ("collections", "entities", "lock")
+
+    def __init__(self):
+        # Rows by ID per kind, in the order the API returned them, with the time they were loaded
+        self.collections: Dict[str, Tuple[float, Dict[str, Dict[str, Any]]]] = {}
+        # Detail responses by kind and ID, with the time they were fetched
+        self.entities: Dict[Tuple[str, str], Tuple[float, Dict[str, Any]]] = {}
+        self.lock = asyncio.Lock()
+
+
+class CollectionCache:
+    """
+    Whole collections and entities per user, kept in step with their writes
+
+    List pages search, sort and slice a cached collection in memory instead
+    of asking the backend for every page. Writes made through the API
+    clients apply the entity the backend sent back: it is inserted into the
+    collection of the user who created it and replaced or removed wherever
+    it is cached, so the list shown after the redirect needs no backend
+    call. Changes made elsewhere show up once an entry is older than
+    COLLECTION_CACHE_TTL.
+
+    Collections larger than COLLECTION_CACHE_MAX_ITEMS, or that the backend
+    only sends one page of, are not cached: their lists keep paging on the
+    backend.
+    """
+
+    def __init__(self, max_users: int, ttl: float, max_items: int):
+        """
+        Initialize an empty cache
+
+        Args:
+            max_users: Maximum number of users with cached collections
+            ttl: Seconds a collection or entity is used before it is fetched again
+            max_items: Largest collection kept in memory
+        """
+        self.max_users = max_users
+        self.ttl = ttl
+        self.max_items = max_items
+        self.users: "OrderedDict[str, UserCollections]" = OrderedDict()
+        # Kinds found too large to cache for a user, until when (monotonic)
+        self.uncacheable: Dict[Tuple[str, str], float] = {}
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _get(self, request: Request, create: bool = False) -> Optional[UserCollections]:
+        """
+        Get the current user's cache, least recently used users dropped first
+        """
+        if not self.ttl or "user" not in request.scope or not request.user.is_authenticated:
+            return None
+
+        identity = request.user.identity
+        cached = self.users.get(identity)
+        if cached is None:
+            if not create:
+                return None
+            cached = self.users[identity] = UserCollections()
+            while len(self.users) > self.max_users:
+                self.users.popitem(last=False)
+        self.users.move_to_end(identity)
+        return cached
+
+    def _fresh(self, loaded: float) -> bool:
+        return time.monotonic() - loaded < self.ttl
+
+    def is_cacheable(self, request: Request, kind: str) -> bool:
+        """
+        Check whether a kind may be cached as a whole collection for the current user
+
+        Args:
+            request: The current request
+            kind: Entity kind, e.g. "companies"
+
+        Returns:
+            False for a while after the kind was found too large for this user
+        """
+        until = self.uncacheable.get((request.user.identity, kind))
+        return until is None or time.monotonic() >= until
+
+    def collection(self, request: Request, kind: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get a collection cached for the current user
+
+        Args:
+            request: The current request
+            kind: Entity kind
+
+        Returns:
+            Every row, or None if the collection isn't cached or is stale
+        """
+        cached = self._get(request)
+        entry = cached.collections.get(kind) if cached else None
+        if entry is None or not self._fresh(entry[0]):
+            return None
+        return list(entry[1].values())
+
+    async def ensure_collection(self, request: Request, kind: str,
+                                fetch: Callable[[], Awaitable[Optional[List]]]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get a collection cached for the current user, fetching it if missing or stale
+
+        Concurrent requests of the same user wait for one fetch. Errors are
+        raised to the caller.
+
+        Args:
+            request: The current request
+            kind: Entity kind
+            fetch: Function fetching every row, returning None if the backend
+                only sent part of them
+
+        Returns:
+            Every row, or None if the collection can't be cached
+        """
+        cached = self._get(request, create=True)
+        if cached is None or not self.is_cacheable(request, kind):
+            return None
+
+        items = self.collection(request, kind)
+        if items is not None:
+            self.stats["hits"] += 1
+            return items
+
+        async with cached.lock:
+            items = self.collection(request, kind)
+            if items is not None:
+                self.stats["hits"] += 1
+                return items
+
+            self.stats["misses"] += 1
+            items = await fetch()
+            if items is None or len(items) > self.max_items:
+                # Leave this kind to backend paging for a while, other users may see fewer rows
+                now = time.monotonic()
+                self.uncacheable = {key: until for key, until in self.uncacheable.items() if until > now}
+                self.uncacheable[(request.user.identity, kind)] = now + self.ttl
+                return None
+
+            cached.collections[kind] = (
+                time.monotonic(),
+                {str(item["id"]): item for item in items if isinstance(item, dict) and item.get("id") is not None},
+            )
+            return list(cached.collections[kind][1].values())
+
+    def entity(self, request: Request, kind: str, entity_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get an entity cached for the current user
+
+        Args:
+            request: The current request
+            kind: Entity kind
+            entity_id: Entity ID
+
+        Returns:
+            The entity, or None if it isn't cached or is stale
+        """
+        cached = self._get(request)
+        entry = cached.entities.get((kind, str(entity_id))) if cached else None
+        if entry is None or not self._fresh(entry[0]):
+            return None
+        self.stats["hits"] += 1
+        return entry[1]
+
+    def store_entity(self, request: Request, kind: str, entity: Any) -> None:
+        """
+        Cache an entity fetched by the current user
+
+        Args:
+            request: The current request
+            kind: Entity kind
+            entity: Entity as returned by the API
+        """
+        cached = self._get(request, create=True)
+        if cached is None or not isinstance(entity, dict) or entity.get("id") is None:
+            return
+        cached.entities[(kind, str(entity["id"]))] = (time.monotonic(), entity)
+
+    def upsert(self, kind: str, entity: Any, request: Optional[Request] = None) -> None:
+        """
+        Apply a created or updated entity to every cache holding it
+
+        The entity replaces its cached copies, and is added to the
+        collection of the user who made the change. Other users' collections
+        only get entities they already had, as they may not be allowed to
+        see new ones.
+
+        Args:
+            kind: Entity kind
+            entity: Entity as returned by the API
+            request: Request that made the change
+        """
+        if not isinstance(entity, dict) or entity.get("id") is None:
+            # The API didn't return the entity, fetch the kind again next time
+            self.expire(kind)
+            return
+
+        entity_id = str(entity["id"])
+        own = self._get(request) if request is not None else None
+        now = time.monotonic()
+        for cached in self.users.values():
+            collection = cached.collections.get(kind)
+            if collection is not None and (entity_id in collection[1] or cached is own):
+                collection[1][entity_id] = entity
+            if (kind, entity_id) in cached.entities or cached is own:
+                cached.entities[(kind, entity_id)] = (now, entity)
+
+    def remove(self, kind: str, entity_id: str) -> None:
+        """
+        Drop a deleted entity from every cache
+
+        Args:
+            kind: Entity kind
+            entity_id: Entity ID
+        """
+        entity_id = str(entity_id)
+        for cached in self.users.values():
+            collection = cached.collections.get(kind)
+            if collection is not None:
+                collection[1].pop(entity_id, None)
+            cached.entities.pop((kind, entity_id), None)
+
+    def expire(self, kind: str) -> None:
+        """
+        Make every user fetch a kind again, collections and entities
+
+        Args:
+            kind: Entity kind
+        """
+        for cached in self.users.values():
+            cached.collections.pop(kind, None)
+            for key in [key for key in cached.entities if key[0] == kind]:
+                del cached.entities[key]
+
+    def expire_path(self, path: str) -> None:
+        """
+        Expire the kind an API path belongs to, for writes made without a typed client
+
+        Args:
+            path: API endpoint path, e.g. "/users/42"
+        """
+        self.expire(path.strip("/").split("/")[0])
+
+    def forget(self, identity: str) -> None:
+        """
+        Drop everything cached for a user, e.g. when they log out
+
+        Args:
+            identity: User identity
+        """
+        self.users.pop(identity, None)
+        self.uncacheable = {key: until for key, until in self.uncacheable.items() if key[0] != identity}
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Get the size of the cache and how often it answered
+
+        Returns:
+            Number of users, cached rows and entities, hit and miss counters
+        """
+        return {
+            "users": len(self.users),
+            "max_users": self.max_users,
+            "rows": sum(len(entry[1]) for cached in self.users.values() for entry in cached.collections.values()),
+            "entities": sum(len(cached.entities) for cached in self.users.values()),
+            "uncacheable": sorted({kind for (_, kind), until in self.uncacheable.items() if until > time.monotonic()}),
+            **self.stats,
+        }
+
+
+# Process-wide collection and entity cache
+collection_cache = CollectionCache(
+    settings.COLLECTION_CACHE_USERS,
+    settings.COLLECTION_CACHE_TTL,
+    settings.COLLECTION_CACHE_MAX_ITEMS,
+)
@@ -0,0 +1,192 @@
+import gzip
+import hashlib
+import zlib
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+
+from app.config import settings
+from app.utils.fragment_cache import FragmentCache
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional, fall back to gzip when it isn't installed
+    brotli = None
+
+# Content types worth compressing, matched by prefix
+COMPRESSIBLE_TYPES = (
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/csv",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+)
+
+# Compression levels tuned for on-the-fly compression
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Compression levels for static files, compressed once ahead of time
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+
+# Compressed bodies of responses served repeatedly, keyed by encoding and body digest
+compressed_bodies = FragmentCache(settings.COMPRESSION_CACHE_SIZE)
+
+# Compressed bodies are reused for this long (seconds)
+COMPRESSED_BODY_TTL = 600
+
+
+def supported_encodings() -> tuple:
+    """
+    Get the encodings this process can produce, preferred first
+
+    Returns:
+        Tuple of content codings
+    """
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the best content coding the client accepts
+
+    Args:
+        accept_encoding: Accept-Encoding request header
+
+    Returns:
+        "br", "gzip" or None for an uncompressed response
+    """
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip()] = quality
+
+    for coding in supported_encodings():
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+def is_compressible(headers: Headers) -> bool:
+    """
+    Check whether a response should be compressed
+
+    Args:
+        headers: Response headers
+
+    Returns:
+        True for uncompressed text-like responses that allow transformation
+    """
+    if "content-encoding" in headers:
+        return False
+    if "no-transform" in headers.get("cache-control", ""):
+        return False
+    content_type = headers.get("content-type", "").lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(body: bytes, encoding: str, static: bool = False) -> bytes:
+    """
+    Compress a complete body
+
+    Args:
+        body: Uncompressed body
+        encoding: "br" or "gzip"
+        static: Use the slower, denser levels meant for static files
+
+    Returns:
+        Compressed body
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=STATIC_BROTLI_QUALITY if static else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=STATIC_GZIP_LEVEL if static else GZIP_LEVEL, mtime=0)
+
+
+async def compress_body(body: bytes, encoding: str) -> bytes:
+    """
+    Compress a complete body, reusing earlier results for identical bodies
+
+    Bodies above COMPRESSION_THREAD_SIZE are compressed in the thread pool
+    so the event loop keeps serving other requests.
+
+    Args:
+        body: Uncompressed body
+        encoding: "br" or "gzip"
+
+    Returns:
+        Compressed body
+    """
+    key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+    compressed = compressed_bodies.get(key)
+    if compressed is None:
+        if len(body) >= settings.COMPRESSION_THREAD_SIZE:
+            compressed = await run_in_threadpool(compress, body, encoding)
+        else:
+            compressed = compress(body, encoding)
+        compressed_bodies.set(key, compressed, COMPRESSED_BODY_TTL)
+    return compressed
+
+
+class StreamCompressor:
+    """
+    Incremental compressor for streamed responses
+
+    Every chunk is flushed so the client can render it straight away.
+    """
+
+    def __init__(self, encoding: str):
+        """
+        Initialize the compressor
+
+        Args:
+            encoding: "br" or "gzip"
+        """
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            # wbits=31 writes a gzip header and trailer
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def _compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    async def compress(self, chunk: bytes) -> bytes:
+        """
+        Compress and flush a chunk
+
+        Args:
+            chunk: Uncompressed chunk
+
+        Returns:
+            Compressed bytes ready to send
+        """
+        if len(chunk) >= settings.COMPRESSION_THREAD_SIZE:
+            return await run_in_threadpool(self._compress, chunk)
+        return self._compress(chunk)
+
+    def finish(self) -> bytes:
+        """
+        End the compressed stream
+
+        Returns:
+            Remaining compressed bytes
+        """
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
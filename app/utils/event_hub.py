@@ -0,0 +1,334 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.config import settings
+
+# Event IDs are "<boot>-<sequence>", the boot part tells replays after a restart apart
+_BOOT = format(int(time.time() * 1000), "x")
+
+# Comment line sent to quiet connections so proxies keep them open
+HEARTBEAT = b": ping\n\n"
+
+
+class Event:
+    """
+    A message published to a channel
+    """
+
+    __slots__ = ("sequence", "id", "channel", "name", "data", "payload")
+
+    def __init__(self, sequence: int, channel: str, name: str, data: Any):
+        """
+        Build the event and its wire format, shared by every subscriber
+
+        Args:
+            sequence: Process-wide event number
+            channel: Channel the event was published to
+            name: SSE event name
+            data: JSON serializable payload
+        """
+        self.sequence = sequence
+        self.id = f"{_BOOT}-{sequence}"
+        self.channel = channel
+        self.name = name
+        self.data = data
+        self.payload = format_event(name, data, event_id=self.id)
+
+
+def format_event(name: str, data: Any, event_id: Optional[str] = None) -> bytes:
+    """
+    Encode an event in the text/event-stream format
+
+    Args:
+        name: SSE event name
+        data: JSON serializable payload
+        event_id: Value clients send back in Last-Event-ID
+
+    Returns:
+        The encoded event
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {name}")
+    # JSON never contains raw newlines, so the data always fits on one line
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'), default=str)}")
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+def parse_event_id(value: Optional[str]) -> Optional[int]:
+    """
+    Get the sequence number from a Last-Event-ID sent by a reconnecting client
+
+    Args:
+        value: Header value
+
+    Returns:
+        Sequence number, or None if the ID is missing or from another process
+    """
+    if not value:
+        return None
+    boot, _, sequence = value.strip().partition("-")
+    if boot != _BOOT or not sequence.isdigit():
+        return None
+    return int(sequence)
+
+
+class Subscription:
+    """
+    One connected client: the channels it follows and its pending events
+
+    The queue is bounded. A client that falls EVENTS_CLIENT_BUFFER events
+    behind is cut off rather than buffered without limit; the browser
+    reconnects on its own and catches up from the replay buffer.
+    """
+
+    __slots__ = ("channels", "queue", "overflowed")
+
+    def __init__(self, channels: Iterable[str], size: int):
+        """
+        Args:
+            channels: Channel names to receive events from
+            size: Maximum number of undelivered events
+        """
+        self.channels = tuple(channels)
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+
+    def offer(self, event: Event) -> bool:
+        """
+        Queue an event without waiting
+
+        Args:
+            event: The event to deliver
+
+        Returns:
+            False if the client is too far behind and has to be dropped
+        """
+        if self.overflowed:
+            return False
+        try:
+            self.queue.put_nowait(event.payload)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            return False
+        return True
+
+
+class EventHub:
+    """
+    In-process fan-out of events to the clients following a channel
+
+    Channels are named after what they cover, e.g. "company:<id>",
+    "site:<id>" or "user:<identity>". Each keeps the last EVENTS_REPLAY_SIZE
+    events so a reconnecting client can be sent what it missed. The hub
+    lives in one worker: with several workers, events have to be published
+    to each of them.
+
+    Idle connections cost a parked task each: a single heartbeat task
+    queues the keep-alive comments for all of them, instead of every
+    stream waking up on its own timer.
+    """
+
+    def __init__(self, replay_size: int, client_buffer: int, heartbeat: float):
+        """
+        Initialize an empty hub
+
+        Args:
+            replay_size: Events kept per channel for Last-Event-ID replay
+            client_buffer: Undelivered events allowed per client
+            heartbeat: Seconds between keep-alive comments
+        """
+        self.replay_size = replay_size
+        self.client_buffer = client_buffer
+        self.heartbeat = heartbeat
+        self.heartbeat_task: Optional[asyncio.Task] = None
+        self.clients: Set[Subscription] = set()
+        self.sequence = itertools.count(1)
+        self.last_sequence = 0
+        self.subscribers: Dict[str, Set[Subscription]] = {}
+        self.history: Dict[str, Deque[Event]] = {}
+        self.stats = {"published": 0, "delivered": 0, "dropped_clients": 0}
+
+    def publish(self, channel: str, name: str, data: Any = None) -> Event:
+        """
+        Send an event to every client following a channel
+
+        Never waits: clients that can't keep up are dropped instead.
+
+        Args:
+            channel: Channel name
+            name: SSE event name
+            data: JSON serializable payload
+
+        Returns:
+            The published event
+        """
+        self.last_sequence = next(self.sequence)
+        event = Event(self.last_sequence, channel, name, data)
+
+        history = self.history.get(channel)
+        if history is None:
+            history = self.history[channel] = deque(maxlen=self.replay_size)
+        history.append(event)
+
+        self.stats["published"] += 1
+        for subscription in self.subscribers.get(channel, ()):
+            if subscription.offer(event):
+                self.stats["delivered"] += 1
+
+        return event
+
+    def replay(self, channels: Iterable[str], after: int) -> Tuple[List[Event], bool]:
+        """
+        Get the events a client missed on its channels
+
+        Args:
+            channels: Channel names
+            after: Sequence number of the last event the client received
+
+        Returns:
+            Missed events in publish order, and whether any were already
+            dropped from the replay buffer
+        """
+        missed = []
+        complete = True
+        for channel in channels:
+            history = self.history.get(channel)
+            if not history:
+                continue
+            # A full buffer may have dropped events the client hasn't seen
+            if len(history) == history.maxlen and history[0].sequence > after + 1:
+                complete = False
+            missed.extend(event for event in history if event.sequence > after)
+        missed.sort(key=lambda event: event.sequence)
+        return missed, complete
+
+    def recent(self, channels: Iterable[str], name: str, limit: int) -> List[Event]:
+        """
+        Get the latest events of one kind on a set of channels
+
+        Args:
+            channels: Channel names
+            name: SSE event name
+            limit: Maximum number of events
+
+        Returns:
+            Up to limit events, oldest first
+        """
+        events = [
+            event for channel in channels for event in self.history.get(channel, ())
+            if event.name == name
+        ]
+        events.sort(key=lambda event: event.sequence)
+        return events[-limit:]
+
+    def subscribe(self, channels: Iterable[str], last_event_id: Optional[str] = None) -> Subscription:
+        """
+        Register a client, queueing the events it missed since Last-Event-ID
+
+        A client whose missed events no longer fit in the replay buffer (or
+        that last connected to another process) gets a "reset" event first,
+        telling it to reload instead of patching its state.
+
+        Args:
+            channels: Channel names to follow
+            last_event_id: Last-Event-ID header of a reconnecting client
+
+        Returns:
+            The subscription, to pass to unsubscribe() once the client is gone
+        """
+        subscription = Subscription(channels, self.client_buffer)
+
+        if last_event_id is not None:
+            after = parse_event_id(last_event_id)
+            missed, complete = self.replay(subscription.channels, after) if after is not None else ([], False)
+            if not complete or len(missed) >= self.client_buffer:
+                reset = Event(self.last_sequence, "", "reset", {"reason": "missed events"})
+                subscription.offer(reset)
+                missed = []
+            for event in missed:
+                subscription.offer(event)
+
+        for channel in subscription.channels:
+            self.subscribers.setdefault(channel, set()).add(subscription)
+        self.clients.add(subscription)
+
+        if self.heartbeat_task is None or self.heartbeat_task.done():
+            self.heartbeat_task = asyncio.get_running_loop().create_task(self._send_heartbeats())
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Forget a disconnected client
+
+        Args:
+            subscription: Value returned by subscribe()
+        """
+        for channel in subscription.channels:
+            subscribers = self.subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[channel]
+        self.clients.discard(subscription)
+
+        if subscription.overflowed:
+            self.stats["dropped_clients"] += 1
+
+    async def _send_heartbeats(self) -> None:
+        """
+        Queue a keep-alive comment for every client with nothing pending,
+        until the last client leaves
+        """
+        while self.clients:
+            await asyncio.sleep(self.heartbeat)
+            for subscription in self.clients:
+                if subscription.queue.empty():
+                    subscription.queue.put_nowait(HEARTBEAT)
+
+    async def stream(self, subscription: Subscription) -> AsyncIterator[bytes]:
+        """
+        Encode a subscription's events for a text/event-stream response
+
+        Sends the reconnection delay first, then events and heartbeats as
+        they are queued. Ends when the client falls too far behind.
+
+        Args:
+            subscription: Value returned by subscribe()
+
+        Yields:
+            Encoded chunks
+        """
+        yield f"retry: {settings.EVENTS_RETRY_MS}\n\n".encode()
+
+        queue = subscription.queue
+        while not subscription.overflowed:
+            chunk = [await queue.get()]
+            # Send whatever else is already queued in the same chunk
+            while not queue.empty():
+                chunk.append(queue.get_nowait())
+            yield b"".join(chunk)
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Get the number of clients and events held
+
+        Returns:
+            Connected clients, channels and counters
+        """
+        return {
+            "clients": len(self.clients),
+            "channels": len(self.subscribers),
+            "replay_events": sum(len(history) for history in self.history.values()),
+            **self.stats,
+        }
+
+
+# Process-wide event hub
+event_hub = EventHub(settings.EVENTS_REPLAY_SIZE, settings.EVENTS_CLIENT_BUFFER, settings.EVENTS_HEARTBEAT)
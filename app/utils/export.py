@@ -0,0 +1,200 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence
+
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+from app.config import settings
+from app.utils.listing import ListQuery, Page, row_id
+
+# Export formats and their content types
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+# Spreadsheets run cells starting with these as formulas
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+# Pages fetched at most when the backend doesn't say how many rows there are
+_MAX_PAGES = 10_000
+
+
+def export_format(request: Request) -> Optional[str]:
+    """
+    Get the export format asked for in the query string
+
+    Args:
+        request: The export request
+
+    Returns:
+        "csv" (the default) or "ndjson", None for anything else
+    """
+    name = request.query_params.get("format", "csv").lower()
+    return name if name in EXPORT_FORMATS else None
+
+
+async def iter_rows(fetch_page: Callable[[ListQuery], Awaitable[Page]], query: ListQuery,
+                    first: Optional[Page] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Walk every page of a list, fetching the next one only when asked for it
+
+    Args:
+        fetch_page: Client method fetching one page, e.g. get_roles_page
+        query: List query with the sorting, search and filters to export
+        first: First page, if it was already fetched
+
+    Yields:
+        The rows of each page
+    """
+    page = first or await fetch_page(query)
+    max_pages = page.pages if page.pages is not None and not page.keyset else _MAX_PAGES
+    fetched = 1
+    while True:
+        yield page.items
+        if not page.items or not page.has_next or fetched >= max_pages:
+            return
+
+        previous = page
+
+        # Keyset lists carry on from the cursor, the others by page number
+        query = ListQuery(
+            page=query.page + 1,
+            limit=query.limit,
+            sort=query.sort,
+            order=query.order,
+            search=query.search,
+            filters=query.filters,
+            cursor=page.next_cursor if page.keyset else None,
+        )
+        page = await fetch_page(query)
+        fetched += 1
+        if page.items and row_id(page.items[0]) == row_id(previous.items[0]):
+            # The backend ignored the offset or cursor and sent the same rows again
+            return
+
+
+def csv_cell(value: Any) -> str:
+    """
+    Format a value for a CSV cell
+    """
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, list):
+        # Related entities, e.g. a role's permissions, listed by code or name
+        return ";".join(
+            str(item.get("code") or item.get("name") or item.get("id")) if isinstance(item, dict) else str(item)
+            for item in value
+        )
+    if isinstance(value, dict):
+        return json.dumps(value, separators=(",", ":"), default=str)
+
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        # Keep spreadsheets from running user-entered text
+        return "'" + value
+    return str(value)
+
+
+async def csv_chunks(pages: AsyncIterator[List[Dict[str, Any]]], columns: Sequence[str]) -> AsyncIterator[bytes]:
+    """
+    Encode rows as CSV, one chunk per page
+
+    Args:
+        pages: Rows of each page
+        columns: Row fields to export, in column order
+
+    Yields:
+        Encoded chunks, starting with the header row
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> bytes:
+        chunk = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    # Byte order mark so spreadsheet programs read the file as UTF-8
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+    yield flush()
+
+    async for rows in pages:
+        writer.writerows([csv_cell(row.get(column)) for column in columns] for row in rows)
+        yield flush()
+
+
+async def ndjson_chunks(pages: AsyncIterator[List[Dict[str, Any]]], columns: Sequence[str]) -> AsyncIterator[bytes]:
+    """
+    Encode rows as newline-delimited JSON, one chunk per page
+
+    Args:
+        pages: Rows of each page
+        columns: Row fields to export
+
+    Yields:
+        Encoded chunks, one JSON object per line
+    """
+    async for rows in pages:
+        yield "".join(
+            json.dumps({column: row.get(column) for column in columns}, separators=(",", ":"), default=str) + "\n"
+            for row in rows
+        ).encode("utf-8")
+
+
+async def export_response(request: Request, fetch_page: Callable[[ListQuery], Awaitable[Page]], query: ListQuery,
+                          name: str, columns: Iterable[str], format_name: str = "csv") -> StreamingResponse:
+    """
+    Stream a whole list as a CSV or NDJSON download
+
+    The first page is fetched before the response starts, so backend
+    errors (e.g. no permission) are raised to the caller and handled like
+    on the list page. The other pages are fetched one at a time as the
+    client reads the file, so memory use doesn't grow with the number of
+    rows. When the client goes away the stream is cancelled and no more
+    pages are fetched.
+
+    Args:
+        request: The export request
+        fetch_page: Client method fetching one page, e.g. get_roles_page
+        query: List query with the sorting, search and filters to export
+        name: Collection name, used for the file name
+        columns: Row fields to export, in column order
+        format_name: "csv" or "ndjson"
+
+    Returns:
+        Streaming download response
+    """
+    columns = list(columns)
+    query = ListQuery(
+        limit=settings.EXPORT_PAGE_SIZE,
+        sort=query.sort,
+        order=query.order,
+        search=query.search,
+        filters=query.filters,
+    )
+    first = await fetch_page(query)
+
+    async def pages():
+        async for rows in iter_rows(fetch_page, query, first):
+            yield rows
+            # Checked between pages, a backend call is the expensive part
+            if await request.is_disconnected():
+                return
+
+    encode = csv_chunks if format_name == "csv" else ndjson_chunks
+    filename = f"{name}-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.{format_name}"
+    return StreamingResponse(
+        encode(pages(), columns),
+        media_type=EXPORT_FORMATS[format_name],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "no-store",
+        },
+    )
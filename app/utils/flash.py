@@ -0,0 +1,57 @@
+from typing import Any, Dict, List
+from urllib.parse import urlencode, urlsplit, urlunsplit, parse_qsl
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from starlette.requests import Request
+
+from app.config import settings
+
+# Query parameter carrying signed flash messages
+FLASH_PARAM = "_flash"
+
+# Signed messages are only accepted for this long (seconds)
+FLASH_MAX_AGE = 60
+
+_serializer = URLSafeTimedSerializer(settings.SECRET_KEY, salt="flash-messages")
+
+
+def flash_url(url: str, messages: List[Dict[str, Any]]) -> str:
+    """
+    Attach signed flash messages to a redirect URL
+
+    Used when the session can no longer be written because the response
+    headers have already been sent, e.g. from a streamed page.
+
+    Args:
+        url: Redirect target
+        messages: Flash messages
+
+    Returns:
+        URL with the signed messages in its query string
+    """
+    if not messages:
+        return url
+
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query)
+    query.append((FLASH_PARAM, _serializer.dumps(messages)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def load_flash(request: Request) -> None:
+    """
+    Move signed flash messages from the query string into the session
+
+    Args:
+        request: The current request
+    """
+    token = request.query_params.get(FLASH_PARAM)
+    if not token or "session" not in request.scope:
+        return
+
+    try:
+        messages = _serializer.loads(token, max_age=FLASH_MAX_AGE)
+    except BadSignature:
+        return
+
+    request.session["messages"] = request.session.get("messages", []) + list(messages)
@@ -0,0 +1,168 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from app.config import settings
+from app.utils.server_timing import get_server_timing
+
+
+class FragmentCache:
+    """
+    Bounded in-memory store for rendered template fragments and pages
+
+    Entries expire after their TTL, the least recently used entry is evicted
+    once the store is full, and entries can be dropped by tag when the data
+    they were rendered from changes.
+    """
+
+    def __init__(self, max_entries: int):
+        """
+        Initialize an empty store
+
+        Args:
+            max_entries: Maximum number of fragments kept
+        """
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple, Tuple[float, Tuple[str, ...], Any]]" = OrderedDict()
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        """
+        Get a fragment that hasn't expired yet
+
+        Args:
+            key: Fragment name followed by its vary values
+
+        Returns:
+            Rendered fragment, or None on a miss
+        """
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.entries.move_to_end(key)
+            self._count(key[0], "hits")
+            return entry[2]
+
+        if entry is not None:
+            del self.entries[key]
+        self._count(key[0], "misses")
+        return None
+
+    def set(self, key: Tuple, value: Any, ttl: float, tags: Iterable[str] = ()) -> None:
+        """
+        Store a rendered fragment
+
+        Args:
+            key: Fragment name followed by its vary values
+            value: Rendered fragment
+            ttl: Seconds the fragment stays valid
+            tags: Names of the data the fragment depends on, see invalidate()
+        """
+        self.entries[key] = (time.monotonic() + ttl, tuple(tags), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, tag: str) -> None:
+        """
+        Drop every fragment rendered from the given data
+
+        Args:
+            tag: Data name, e.g. "sites" or "roles"
+        """
+        for key in [key for key, entry in self.entries.items() if tag in entry[1]]:
+            del self.entries[key]
+
+    def forget(self, value: str) -> None:
+        """
+        Drop every fragment varying on a value, e.g. a user identity when they log out
+
+        Args:
+            value: Vary value
+        """
+        for key in [key for key in self.entries if value in key[1:]]:
+            del self.entries[key]
+
+    def clear(self) -> None:
+        """
+        Drop every fragment
+        """
+        self.entries.clear()
+
+    def _count(self, name: str, outcome: str) -> None:
+        stats = self.stats.setdefault(name, {"hits": 0, "misses": 0})
+        stats[outcome] += 1
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Get hit rates per fragment name
+
+        Returns:
+            Size of the store and hits, misses and hit rate for each fragment
+        """
+        fragments = {}
+        for name, stats in self.stats.items():
+            lookups = stats["hits"] + stats["misses"]
+            fragments[name] = {**stats, "hit_rate": round(stats["hits"] / lookups, 3) if lookups else 0.0}
+
+        return {"entries": len(self.entries), "max_entries": self.max_entries, "fragments": fragments}
+
+
+# Process-wide fragment store
+fragment_cache = FragmentCache(settings.FRAGMENT_CACHE_SIZE)
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Jinja extension adding a {% cache %} tag backed by the fragment store
+
+    Usage:
+        {% cache "sidebar", vary=(user.identity, nav_section), ttl=300, tags=("roles",) %}
+            ...
+        {% endcache %}
+
+    The fragment is rendered once per distinct combination of vary values and
+    reused until its TTL runs out or one of its tags is invalidated.
+    """
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+
+        # Fragment name, then keyword options
+        args = [parser.parse_expression(), nodes.ContextReference()]
+        kwargs = []
+        while parser.stream.skip_if("comma"):
+            key = parser.stream.expect("name")
+            parser.stream.expect("assign")
+            kwargs.append(nodes.Keyword(key.value, parser.parse_expression(), lineno=key.lineno))
+
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        call = self.call_method("_render_cached", args, kwargs)
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, name: str, context, vary=(), ttl: Optional[float] = None,
+                       tags: Iterable[str] = (), caller=None) -> Markup:
+        ttl = settings.FRAGMENT_CACHE_TTL if ttl is None else ttl
+        if ttl <= 0:
+            return Markup(caller())
+
+        start = time.perf_counter()
+        key = (name,) + tuple(str(value) for value in vary)
+        value = fragment_cache.get(key)
+        outcome = "hit"
+        if value is None:
+            outcome = "miss"
+            value = str(caller())
+            fragment_cache.set(key, value, ttl, tags)
+
+        request = context.get("request")
+        timing = get_server_timing(request) if request is not None else None
+        if timing:
+            timing.record(f"frag-{name}", time.perf_counter() - start, f"{name} {outcome}")
+
+        return Markup(value)
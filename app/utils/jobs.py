@@ -0,0 +1,475 @@
+import asyncio
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from starlette.requests import Request
+
+from app.config import settings
+from app.utils.bulk import error_detail
+from app.utils.event_hub import event_hub
+
+# Project root, the job database path is relative to it
+BASE_DIR = Path(__file__).parent.parent.parent
+
+# Job states; the last three are final
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Jobs whose runner hasn't been heard from for this long (seconds) died with their process
+_STALE_AFTER = 30
+
+_COLUMNS = (
+    "id", "kind", "owner", "title", "url", "status", "progress", "message", "error",
+    "cancel_requested", "created", "started", "finished", "updated",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    title TEXT NOT NULL,
+    url TEXT,
+    status TEXT NOT NULL,
+    progress REAL,
+    message TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+"""
+
+
+class JobQueueFull(Exception):
+    """
+    Raised when too many jobs are already waiting for a worker
+    """
+
+
+class JobAlreadyRunning(Exception):
+    """
+    Raised when another user's job is already working on the same thing
+    """
+
+
+class Job:
+    """
+    A long operation run in the background, with its status and progress
+    """
+
+    def __init__(self, kind: str, owner: str, title: str, url: Optional[str] = None, key: Optional[str] = None):
+        """
+        Initialize a queued job
+
+        Args:
+            kind: Operation name, e.g. "company_drop_schema"
+            owner: Identity of the user who started it, the only one who can follow it
+            title: Description shown on the status page
+            url: Page to go back to once the job has finished
+            key: What the job works on, e.g. a company ID
+        """
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner = owner
+        self.title = title
+        self.url = url
+        self.key = key
+        self.status = QUEUED
+        # Fraction done between 0 and 1, None while unknown
+        self.progress: Optional[float] = None
+        self.message: Optional[str] = None
+        self.error: Optional[str] = None
+        self.cancel_requested = False
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.updated = self.created
+        self.store: Optional["JobStore"] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.time()) - (self.started or self.created)
+
+    def report(self, progress: Optional[float] = None, message: Optional[str] = None) -> None:
+        """
+        Record how far the job has got, for the status page
+
+        Args:
+            progress: Fraction done between 0 and 1
+            message: Step being run, e.g. "Dropping schema"
+        """
+        if progress is not None:
+            self.progress = max(0.0, min(progress, 1.0))
+        if message is not None:
+            self.message = message
+        if self.store is not None:
+            self.store.save(self)
+
+    def to_row(self) -> tuple:
+        return tuple(getattr(self, column) for column in _COLUMNS)
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        job = cls.__new__(cls)
+        for column in _COLUMNS:
+            setattr(job, column, row[column])
+        job.cancel_requested = bool(job.cancel_requested)
+        job.key = None
+        job.store = None
+        return job
+
+
+class JobStore:
+    """
+    Job status kept in SQLite
+
+    Every worker process writes the jobs it runs to the same database, so a
+    status page served by another process, or after a restart, still finds
+    the job. Writes are single-row and the database is in WAL mode, so they
+    are cheap enough to make from the event loop.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Database file, relative to the project root; ":memory:" for tests
+        """
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            path = self.path
+            if path != ":memory:":
+                full_path = BASE_DIR / path
+                full_path.parent.mkdir(parents=True, exist_ok=True)
+                path = str(full_path)
+            self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("PRAGMA busy_timeout=5000")
+            self._db.executescript(_SCHEMA)
+        return self._db
+
+    def save(self, job: Job) -> None:
+        """
+        Insert or update a job
+        """
+        job.updated = time.time()
+        self.db.execute(
+            f"INSERT OR REPLACE INTO jobs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' for _ in _COLUMNS)})",
+            job.to_row(),
+        )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        Get a job by ID
+
+        Returns:
+            The job as last saved, or None if it doesn't exist
+        """
+        row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def request_cancel(self, job_id: str) -> None:
+        """
+        Flag a job for cancellation by the process running it
+        """
+        self.db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+
+    def cancel_requests(self, job_ids: List[str]) -> List[str]:
+        """
+        Get which of the given jobs were flagged for cancellation
+        """
+        if not job_ids:
+            return []
+        rows = self.db.execute(
+            f"SELECT id FROM jobs WHERE cancel_requested = 1 AND id IN ({', '.join('?' for _ in job_ids)})",
+            job_ids,
+        )
+        return [row["id"] for row in rows]
+
+    def touch(self, job_ids: List[str]) -> None:
+        """
+        Mark jobs as still queued or running in a live process
+        """
+        if job_ids:
+            self.db.execute(
+                f"UPDATE jobs SET updated = ? WHERE id IN ({', '.join('?' for _ in job_ids)})",
+                [time.time(), *job_ids],
+            )
+
+    def cleanup(self, retention: float) -> None:
+        """
+        Fail jobs left behind by a process that stopped, forget old ones
+
+        Args:
+            retention: Seconds finished jobs are kept
+        """
+        now = time.time()
+        self.db.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished = ?, updated = ? "
+            "WHERE status IN (?, ?) AND updated < ?",
+            (FAILED, "Interrupted by a server restart", now, now, QUEUED, RUNNING, now - _STALE_AFTER),
+        )
+        self.db.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?, ?) AND finished < ?", (*FINISHED, now - retention)
+        )
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class JobRunner:
+    """
+    Runs long operations on a fixed pool of workers, outside any request
+
+    The request that starts a job returns straight away with a link to its
+    status page. At most JOB_WORKERS jobs run at once per process, the rest
+    wait in a queue of JOB_QUEUE_SIZE. Status and progress are saved to the
+    job store as they change, and cancellation requests are picked up from
+    it, so any process can serve a job's page or cancel it.
+
+    Cancelling a running job stops waiting for the backend; a backend call
+    already sent may still complete on the server.
+    """
+
+    def __init__(self, store: JobStore, workers: int, queue_size: int, retention: float):
+        """
+        Initialize a stopped runner
+
+        Args:
+            store: Where job status is kept
+            workers: Jobs run at once
+            queue_size: Jobs waiting for a worker before new ones are refused
+            retention: Seconds finished jobs are kept
+        """
+        self.store = store
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retention = retention
+        self.queue: Optional["asyncio.Queue[Job]"] = None
+        # Jobs of this process not finished yet, with their work and running task
+        self.active: Dict[str, Job] = {}
+        self._work: Dict[str, Callable[[Job], Awaitable[Optional[str]]]] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        """
+        Start the workers and the cancellation watcher, called on application startup
+        """
+        self.store.cleanup(self.retention)
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._watch()))
+
+    async def stop(self) -> None:
+        """
+        Stop the workers, called on application shutdown
+
+        Jobs still queued or running are marked as interrupted.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job in list(self.active.values()):
+            self._finish(job, FAILED, error="Interrupted by a server shutdown")
+        self.store.close()
+
+    def submit(self, request: Request, kind: str, title: str, work: Callable[[Job], Awaitable[Optional[str]]],
+               url: Optional[str] = None, key: Optional[str] = None) -> Job:
+        """
+        Queue a job for the current user
+
+        Args:
+            request: The request starting the job
+            kind: Operation name, e.g. "company_drop_schema"
+            title: Description shown on the status page
+            work: Coroutine function doing the work; it gets the job to report
+                progress on and returns the message shown when it succeeds
+            url: Page to go back to once the job has finished
+            key: Identifies what the job works on; while a job with the same
+                key is queued or running it is returned instead of a new one
+
+        Returns:
+            The queued job, or the current user's unfinished one with the same key
+
+        Raises:
+            JobQueueFull: If too many jobs are waiting
+            JobAlreadyRunning: If another user's job with the same key hasn't finished
+        """
+        if key is not None:
+            for job in self.active.values():
+                if job.kind == kind and job.key == key and not job.cancel_requested:
+                    if job.owner != request.user.identity:
+                        # Its status page is only open to the user who started it
+                        raise JobAlreadyRunning(f"{job.title} is already running, started by another user")
+                    return job
+
+        if self.queue is None:
+            raise RuntimeError("The job runner hasn't been started")
+
+        job = Job(kind, request.user.identity, title, url, key)
+        job.store = self.store
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFull("Too many operations are waiting, try again in a few minutes")
+
+        self.active[job.id] = job
+        self._work[job.id] = work
+        self.store.save(job)
+        return job
+
+    def get(self, request: Request, job_id: str) -> Optional[Job]:
+        """
+        Get one of the current user's jobs
+
+        Args:
+            request: The current request
+            job_id: Job ID
+
+        Returns:
+            The job, or None if it doesn't exist or belongs to someone else
+        """
+        job = self.active.get(job_id) or self.store.get(job_id)
+        if job is None or job.owner != request.user.identity:
+            return None
+        return job
+
+    def cancel(self, job: Job) -> None:
+        """
+        Cancel a job that hasn't finished
+
+        Jobs of this process are cancelled straight away, those of another
+        process when its watcher next checks the store.
+
+        Args:
+            job: Job to cancel
+        """
+        if job.done:
+            return
+        job.cancel_requested = True
+        local = self.active.get(job.id)
+        if local is None:
+            self.store.request_cancel(job.id)
+            return
+
+        local.cancel_requested = True
+        task = self._running.get(job.id)
+        if task is not None:
+            task.cancel()
+        else:
+            # Still queued, the worker skips it
+            self._finish(local, CANCELLED, message="Cancelled before it started")
+
+    async def _worker(self) -> None:
+        """
+        Run queued jobs one at a time
+        """
+        while True:
+            job = await self.queue.get()
+            if job.done:
+                continue
+
+            job.status = RUNNING
+            job.started = time.time()
+            job.report(progress=0.0)
+
+            task = asyncio.create_task(self._work[job.id](job))
+            self._running[job.id] = task
+            try:
+                message = await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    # The worker itself is being stopped
+                    task.cancel()
+                    raise
+                self._finish(job, CANCELLED, message="Cancelled")
+            except Exception as e:
+                print(f"Job {job.kind} {job.id} failed: {e}")
+                self._finish(job, FAILED, error=error_detail(e))
+            else:
+                self._finish(job, SUCCEEDED, message=message or "Done", progress=1.0)
+            finally:
+                self._running.pop(job.id, None)
+
+    async def _watch(self) -> None:
+        """
+        Keep this process's jobs marked as alive and pick up cancellations made by other processes
+        """
+        while True:
+            await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+            job_ids = list(self.active)
+            try:
+                self.store.touch(job_ids)
+                for job_id in self.store.cancel_requests(job_ids):
+                    job = self.active.get(job_id)
+                    if job is not None:
+                        self.cancel(job)
+            except sqlite3.Error as e:
+                print(f"Error checking jobs: {e}")
+
+    def _finish(self, job: Job, status: str, message: Optional[str] = None, error: Optional[str] = None,
+                progress: Optional[float] = None) -> None:
+        """
+        Record the outcome of a job and tell its owner
+        """
+        job.status = status
+        job.finished = time.time()
+        job.error = error
+        if message is not None:
+            job.message = message
+        if progress is not None:
+            job.progress = progress
+        self.store.save(job)
+        self.active.pop(job.id, None)
+        self._work.pop(job.id, None)
+
+        event_hub.publish(f"user:{job.owner}", "notification", {
+            "title": job.title,
+            "icon": "gear",
+            "level": {SUCCEEDED: "success", FAILED: "danger"}.get(status, "warning"),
+            "text": error or job.message,
+            "url": f"/jobs/{job.id}",
+        })
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Get the number of jobs waiting and running in this process
+        """
+        return {
+            "workers": self.workers,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "running": len(self._running),
+        }
+
+
+# Process-wide background job runner
+job_runner = JobRunner(
+    JobStore(settings.JOB_DB_PATH),
+    settings.JOB_WORKERS,
+    settings.JOB_QUEUE_SIZE,
+    settings.JOB_RETENTION,
+)
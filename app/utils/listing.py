@@ -0,0 +1,345 @@
+import math
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+from urllib.parse import urlencode
+
+from starlette.requests import Request
+
+# Page sizes offered on list pages
+PAGE_SIZES = (10, 25, 50, 100)
+
+# Page size used when the request doesn't ask for one
+DEFAULT_PAGE_SIZE = 25
+
+
+class ListQuery:
+    """
+    Page, page size, sort order and filters requested for a list page
+    """
+
+    # Page sizes the list can be shown with
+    page_sizes = PAGE_SIZES
+
+    def __init__(self, page: int = 1, limit: int = DEFAULT_PAGE_SIZE, sort: Optional[str] = None,
+                 order: str = "asc", search: str = "", filters: Optional[Dict[str, str]] = None,
+                 cursor: Optional[str] = None):
+        """
+        Initialize the query
+
+        Args:
+            page: 1-based page number
+            limit: Rows per page
+            sort: Field to sort by
+            order: "asc" or "desc"
+            search: Free text search
+            filters: Page specific filters, sent to the backend as they are
+            cursor: Opaque backend position of the page, used instead of the offset
+        """
+        self.page = page
+        self.limit = limit
+        self.sort = sort
+        self.order = order
+        self.search = search
+        self.filters = filters or {}
+        self.cursor = cursor
+
+    @classmethod
+    def from_request(cls, request: Request, sort_keys: Sequence[str], filters: Sequence[str] = (),
+                     default_sort: Optional[str] = None) -> "ListQuery":
+        """
+        Read the list query from the request's query string
+
+        Unknown sort keys, filters and out of range values are ignored, so
+        the query string can't be used to make arbitrary backend requests.
+
+        Args:
+            request: The current request
+            sort_keys: Fields the page can be sorted by
+            filters: Names of the page's filter parameters
+            default_sort: Sort field used when none is requested
+
+        Returns:
+            Parsed query
+        """
+        params = request.query_params
+
+        try:
+            page = max(int(params.get("page", 1)), 1)
+        except ValueError:
+            page = 1
+
+        try:
+            limit = int(params.get("limit", DEFAULT_PAGE_SIZE))
+        except ValueError:
+            limit = DEFAULT_PAGE_SIZE
+        if limit not in PAGE_SIZES:
+            limit = DEFAULT_PAGE_SIZE
+
+        sort = params.get("sort")
+        if sort not in sort_keys:
+            sort = default_sort
+        order = "desc" if params.get("order") == "desc" else "asc"
+
+        return cls(
+            page=page,
+            limit=limit,
+            sort=sort,
+            order=order,
+            search=params.get("q", "").strip(),
+            filters={name: params[name] for name in filters if params.get(name)},
+            cursor=params.get("cursor") or None,
+        )
+
+    @property
+    def skip(self) -> int:
+        """
+        Number of rows before the current page
+        """
+        return (self.page - 1) * self.limit
+
+    def api_params(self) -> Dict[str, Any]:
+        """
+        Get the backend query parameters for the current page
+
+        Keyset pages are requested by cursor, so the backend can seek straight
+        to them however deep they are. Offsets are only sent without one.
+
+        Returns:
+            Paging, sorting, search and filter parameters
+        """
+        params: Dict[str, Any] = {"limit": self.limit, **self.filters}
+        if self.cursor:
+            params["cursor"] = self.cursor
+        else:
+            params["skip"] = self.skip
+        if self.sort:
+            params["sort"] = self.sort
+            params["order"] = self.order
+        if self.search:
+            params["q"] = self.search
+        return params
+
+    def url(self, **changes) -> str:
+        """
+        Build the query string for a link to another page or ordering of the list
+
+        The current cursor is never carried over, links to another keyset
+        page pass the cursor they lead to.
+
+        Args:
+            **changes: Values to replace, e.g. page=2, sort="name" or cursor="..."
+
+        Returns:
+            Query string starting with "?"
+        """
+        values = {
+            "q": self.search,
+            **self.filters,
+            "sort": self.sort,
+            "order": self.order,
+            "limit": self.limit,
+            "page": self.page,
+            "cursor": None,
+        }
+        values.update(changes)
+
+        # Leave out defaults to keep URLs short
+        if values["page"] == 1:
+            values.pop("page")
+        if values["limit"] == DEFAULT_PAGE_SIZE:
+            values.pop("limit")
+        return "?" + urlencode({name: value for name, value in values.items() if value not in (None, "")})
+
+    def sort_url(self, key: str) -> str:
+        """
+        Build the link for a sortable column header
+
+        Sorting by the current column flips the order, sorting by another
+        column starts ascending. Both go back to the first page.
+
+        Args:
+            key: Sort field of the column
+
+        Returns:
+            Query string starting with "?"
+        """
+        order = "desc" if self.sort == key and self.order == "asc" else "asc"
+        return self.url(sort=key, order=order, page=1)
+
+
+class Page:
+    """
+    One page of a list, with the total number of rows matching the query
+    """
+
+    def __init__(self, items: List[Any], query: ListQuery, total: Optional[int] = None,
+                 next_cursor: Optional[str] = None, previous_cursor: Optional[str] = None):
+        """
+        Initialize the page
+
+        Args:
+            items: Rows on this page
+            query: Query the page was fetched for
+            total: Rows matching the query across all pages, None if the backend didn't say
+            next_cursor: Backend position of the following page, if it pages by cursor
+            previous_cursor: Backend position of the preceding page, if it pages by cursor
+        """
+        self.items = items
+        self.query = query
+        self.total = total
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def keyset(self) -> bool:
+        """
+        Whether the backend pages this list by cursor
+
+        Keyset pages can only be reached from their neighbours, so the
+        pager offers first, previous and next instead of page numbers.
+        """
+        return bool(self.query.cursor or self.next_cursor or self.previous_cursor)
+
+    @property
+    def pages(self) -> Optional[int]:
+        """
+        Number of pages, None if the total is unknown
+        """
+        if self.total is None:
+            return None
+        return max(math.ceil(self.total / self.query.limit), 1)
+
+    @property
+    def has_previous(self) -> bool:
+        return self.query.page > 1
+
+    @property
+    def has_next(self) -> bool:
+        if self.keyset:
+            return self.next_cursor is not None
+        if self.total is None:
+            # A full page suggests there is more
+            return len(self.items) == self.query.limit
+        return self.query.skip + len(self.items) < self.total
+
+    @property
+    def first_row(self) -> int:
+        """
+        1-based position of the first row on the page, 0 for an empty page
+        """
+        return self.query.skip + 1 if self.items else 0
+
+    @property
+    def last_row(self) -> int:
+        """
+        1-based position of the last row on the page
+        """
+        return self.query.skip + len(self.items)
+
+    def page_numbers(self, window: int = 2) -> List[Optional[int]]:
+        """
+        Get the page numbers to link to, with None marking gaps
+
+        Args:
+            window: Pages shown on each side of the current one
+
+        Returns:
+            E.g. [1, None, 4, 5, 6, None, 12]
+        """
+        if self.pages is None or self.keyset:
+            return []
+
+        current = self.query.page
+        shown = {1, self.pages} | set(range(max(current - window, 1), min(current + window, self.pages) + 1))
+        numbers: List[Optional[int]] = []
+        for number in sorted(shown):
+            if numbers and number - numbers[-1] > 1:
+                numbers.append(None)
+            numbers.append(number)
+        return numbers
+
+
+def row_id(item: Any) -> Any:
+    """
+    Identity of a row, to tell whether two responses hold the same rows
+    """
+    return item.get("id") if isinstance(item, Mapping) else item
+
+
+def _sort_value(item: Mapping, key: str):
+    """
+    Sort key for a row, ordering missing values first and text case-insensitively
+    """
+    value = item.get(key)
+    if value is None:
+        return (0, "")
+    if isinstance(value, str):
+        return (1, value.lower())
+    if isinstance(value, (list, dict)):
+        return (1, len(value))
+    return (1, value)
+
+
+def paginate(data: Any, query: ListQuery, total: Optional[int] = None, search_fields: Sequence[str] = (),
+             next_cursor: Optional[str] = None, previous_cursor: Optional[str] = None) -> Page:
+    """
+    Build a page from a backend list response
+
+    The backend may answer with an {"items": [...], "total": N} envelope or a
+    plain list, with the total in the X-Total-Count header. Backends that
+    page by cursor add "next_cursor" and "previous_cursor" to the envelope
+    or send them as Link headers. Backends that don't page yet return the
+    whole collection, which is searched, sorted and sliced here so the page
+    still only renders the requested rows.
+
+    Args:
+        data: Parsed backend response
+        query: Query the rows were requested with
+        total: Total from the response headers, if any
+        search_fields: Row fields the free text search matches against
+        next_cursor: Cursor of the following page from the response headers, if any
+        previous_cursor: Cursor of the preceding page from the response headers, if any
+
+    Returns:
+        The requested page
+    """
+    items = data or []
+    if isinstance(data, dict):
+        items = data.get("items", [])
+        total = data.get("total", total)
+        next_cursor = data.get("next_cursor", next_cursor)
+        previous_cursor = data.get("previous_cursor", previous_cursor)
+
+    if total is not None or query.cursor or next_cursor or previous_cursor:
+        return Page(list(items), query, total, next_cursor, previous_cursor)
+
+    if len(items) == query.limit or (query.skip and len(items) < query.limit):
+        # Looks like a page the backend cut, without telling how many rows there are;
+        # the caller checks the backend really pages before trusting it
+        return Page(list(items), query)
+
+    # The whole result set: either the backend ignored paging, or it all fit on the first page
+    return paginate_local(items, query, search_fields)
+
+
+def paginate_local(items: Sequence[Any], query: ListQuery, search_fields: Sequence[str] = ()) -> Page:
+    """
+    Build a page from a whole collection held in memory
+
+    Args:
+        items: Every row of the collection
+        query: Query to search, sort and slice the rows with
+        search_fields: Row fields the free text search matches against
+
+    Returns:
+        The requested page with the number of matching rows
+    """
+    if query.search and search_fields:
+        needle = query.search.lower()
+        items = [
+            item for item in items
+            if any(needle in str(item.get(field) or "").lower() for field in search_fields)
+        ]
+    if query.sort:
+        items = sorted(items, key=lambda item: _sort_value(item, query.sort), reverse=query.order == "desc")
+
+    return Page(items[query.skip:query.skip + query.limit], query, len(items))
@@ -0,0 +1,230 @@
+import functools
+import hashlib
+import time
+from typing import AsyncIterator, Callable, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+from app.config import settings
+from app.utils.fragment_cache import FragmentCache
+from app.utils.server_timing import get_server_timing
+
+# Rendered pages served to visitors who aren't logged in
+anonymous_pages = FragmentCache(settings.PAGE_CACHE_SIZE)
+
+# Rendered pages cached for a few seconds for the user who requested them
+user_pages = FragmentCache(settings.PAGE_CACHE_SIZE)
+
+# Response headers kept with a cached page
+_CACHED_HEADERS = ("content-type", "vary")
+
+# Longest lifetime allowed for a per-user page (seconds)
+USER_PAGE_MAX_TTL = 10
+
+# Request headers that select a different rendering of the same URL
+_VARY_HEADERS = ("HX-Request", "HX-Boosted", "HX-Block", "HX-History-Restore-Request")
+
+
+def make_etag(body: bytes) -> str:
+    """
+    Build a strong ETag from a response body
+
+    Args:
+        body: Response body
+
+    Returns:
+        Quoted ETag value
+    """
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Check whether the client already has this version of the page
+
+    Args:
+        request: The current request
+        etag: ETag of the current version
+
+    Returns:
+        True if If-None-Match lists the ETag
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    # Weak comparison, compressed responses carry the ETag as W/"..."
+    candidates = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _is_anonymous_render(request: Request) -> bool:
+    """
+    Check whether a request gets the same page as every other visitor
+    """
+    if settings.ANONYMOUS_PAGE_TTL <= 0 or settings.TEMPLATE_RELOAD:
+        return False
+    if "user" in request.scope and request.user.is_authenticated:
+        return False
+    # Flash messages make the page personal, HTMX requests get partial responses
+    if "session" in request.scope and request.session.get("messages"):
+        return False
+    return request.headers.get("HX-Request") != "true"
+
+
+def anonymous_page_cache(endpoint: Callable) -> Callable:
+    """
+    Serve a page rendered for anonymous visitors from memory
+
+    Only message-free, non-HTMX renders for visitors who aren't logged in
+    are cached. Responses carry a strong ETag and conditional requests are
+    answered with 304 Not Modified.
+
+    Args:
+        endpoint: Route handler rendering the page
+
+    Returns:
+        Wrapped route handler
+    """
+    @functools.wraps(endpoint)
+    async def wrapper(request: Request):
+        if not _is_anonymous_render(request):
+            return await endpoint(request)
+
+        # The page links to static files by absolute URL, so the host is part of the key
+        key = (request.url.path, str(request.url))
+        start = time.perf_counter()
+        cached = anonymous_pages.get(key)
+        outcome = "hit"
+
+        if cached is None:
+            outcome = "miss"
+            response = await endpoint(request)
+            body = getattr(response, "body", None)
+            if response.status_code != 200 or not body:
+                return response
+
+            headers = {name: value for name, value in response.headers.items() if name in _CACHED_HEADERS}
+            cached = (body, make_etag(body), headers)
+            anonymous_pages.set(key, cached, settings.ANONYMOUS_PAGE_TTL)
+
+        timing = get_server_timing(request)
+        if timing:
+            timing.record("page-cache", time.perf_counter() - start, f"anonymous {outcome}")
+
+        body, etag, headers = cached
+        headers = {**headers, "ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request, etag):
+            headers.pop("content-type", None)
+            return Response(status_code=304, headers=headers)
+
+        return Response(body, headers=headers)
+
+    return wrapper
+
+
+def _user_tag(request: Request) -> Optional[str]:
+    """
+    Get the invalidation tag for pages cached for the current user
+    """
+    if "user" in request.scope and request.user.is_authenticated:
+        return f"user:{request.user.identity}"
+    return None
+
+
+def invalidate_user_pages(request: Request) -> None:
+    """
+    Drop every page cached for the current user
+
+    Called by the API clients after each write, so users always see the
+    effect of their own changes.
+
+    Args:
+        request: The current request
+    """
+    tag = _user_tag(request)
+    if tag:
+        user_pages.invalidate(tag)
+
+
+async def _store_streamed(response: StreamingResponse, body: AsyncIterator,
+                          store: Callable[[bytes], None]) -> AsyncIterator[bytes]:
+    """
+    Pass a streamed page through and store it once it has been sent in full
+    """
+    chunks = []
+    async for chunk in body:
+        chunks.append(chunk if isinstance(chunk, bytes) else chunk.encode(response.charset))
+        yield chunk
+
+    # Pages that replaced their content with an error redirect aren't kept
+    if not getattr(response, "failed", False):
+        store(b"".join(chunks))
+
+
+def user_page_cache(ttl: float = 5):
+    """
+    Cache a page for a few seconds for the user who requested it
+
+    Repeated views of the same URL (reloads, double clicks) are served from
+    memory instead of calling the backend and rendering again. Entries are
+    keyed by user, current site, URL with its query string and HTMX headers.
+    They are never shared between users. Any write the user makes through
+    the API clients drops all of their cached pages.
+
+    Args:
+        ttl: Seconds a page is reused, at most USER_PAGE_MAX_TTL
+
+    Returns:
+        Decorator for route handlers
+    """
+    if not 0 < ttl <= USER_PAGE_MAX_TTL:
+        raise ValueError(f"Per-user page TTL must be between 0 and {USER_PAGE_MAX_TTL} seconds")
+
+    def decorator(endpoint: Callable) -> Callable:
+        @functools.wraps(endpoint)
+        async def wrapper(request: Request):
+            tag = _user_tag(request)
+            if (not settings.USER_PAGE_CACHE or tag is None or request.method != "GET"
+                    or request.session.get("messages")):
+                return await endpoint(request)
+
+            key = (
+                request.url.path,
+                tag,
+                str(request.session.get("current_site_id")),
+                str(request.url),
+            ) + tuple(request.headers.get(name, "") for name in _VARY_HEADERS)
+
+            start = time.perf_counter()
+            cached = user_pages.get(key)
+            timing = get_server_timing(request)
+            if timing:
+                timing.record("page-cache", time.perf_counter() - start, f"user {'hit' if cached else 'miss'}")
+
+            if cached is not None:
+                body, headers = cached
+                return Response(body, headers=headers)
+
+            response = await endpoint(request)
+            if response.status_code != 200:
+                return response
+
+            headers = {
+                name: value for name, value in response.headers.items()
+                if name not in ("content-length", "set-cookie")
+            }
+
+            def store(body: bytes) -> None:
+                user_pages.set(key, (body, headers), ttl, tags=(tag,))
+
+            if isinstance(response, StreamingResponse):
+                response.body_iterator = _store_streamed(response, response.body_iterator, store)
+            elif getattr(response, "body", None):
+                store(response.body)
+
+            return response
+
+        return wrapper
+
+    return decorator
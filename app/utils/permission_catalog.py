@@ -0,0 +1,180 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.config import settings
+
+# Group of the permissions that have no module; shown last, never offered as a module
+UNGROUPED_MODULE = "ungrouped"
+
+
+class PermissionCatalog:
+    """
+    Process-wide copy of the permission registry, indexed by ID and by module
+
+    The catalog is the same for every user, so it is fetched once and
+    shared by the roles and permissions views. Writes made through the
+    permissions client are applied to it in place; changes made elsewhere
+    show up once it is older than PERMISSION_CATALOG_TTL and is fetched again.
+    """
+
+    def __init__(self, ttl: float):
+        """
+        Initialize an empty catalog
+
+        Args:
+            ttl: Seconds before the catalog is fetched again
+        """
+        self.ttl = ttl
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.by_module: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.modules: List[str] = []
+        self.loaded: Optional[float] = None
+        self.lock = asyncio.Lock()
+
+    def is_fresh(self) -> bool:
+        """
+        Check whether the catalog was loaded less than ttl seconds ago
+        """
+        return self.loaded is not None and time.monotonic() - self.loaded < self.ttl
+
+    async def ensure_loaded(self, fetch_permissions: Callable[[], Awaitable[List[Dict[str, Any]]]],
+                            fetch_modules: Callable[[], Awaitable[List[str]]]) -> "PermissionCatalog":
+        """
+        Fetch the catalog if it is missing or stale
+
+        Concurrent callers wait for the same fetch. Errors are raised to the
+        caller and the catalog is tried again on the next call.
+
+        Args:
+            fetch_permissions: Function fetching every permission
+            fetch_modules: Function fetching the module names
+
+        Returns:
+            The catalog
+        """
+        if self.is_fresh():
+            return self
+
+        async with self.lock:
+            if not self.is_fresh():
+                permissions, modules = await asyncio.gather(fetch_permissions(), fetch_modules())
+                self.load(permissions or [], modules or [])
+
+        return self
+
+    def load(self, permissions: List[Dict[str, Any]], modules: List[str]) -> None:
+        """
+        Replace the catalog, grouping permissions by module in one pass
+
+        Args:
+            permissions: Every permission, as returned by the API
+            modules: Module names, in display order
+        """
+        modules = [module for module in modules if module]
+        self.by_id = {}
+        self.by_module = {module: {} for module in modules}
+        self.modules = list(modules)
+        for permission in permissions:
+            self._add(permission)
+        self.loaded = time.monotonic()
+
+    @staticmethod
+    def _module(permission: Dict[str, Any]) -> str:
+        return permission.get("module") or UNGROUPED_MODULE
+
+    def _add(self, permission: Dict[str, Any]) -> None:
+        permission_id = str(permission["id"])
+        module = self._module(permission)
+        self.by_id[permission_id] = permission
+
+        group = self.by_module.get(module)
+        if group is None:
+            group = self.by_module[module] = {}
+            if module != UNGROUPED_MODULE:
+                self.modules.append(module)
+        group[permission_id] = permission
+
+    def upsert(self, permission: Any) -> None:
+        """
+        Apply a created or updated permission
+
+        Args:
+            permission: Permission as returned by the API
+        """
+        if self.loaded is None:
+            return
+        if not isinstance(permission, dict) or permission.get("id") is None:
+            # The API didn't return the permission, fetch everything again next time
+            self.expire()
+            return
+
+        # Moving to another module takes it out of the old group
+        self.remove(permission["id"])
+        self._add(permission)
+
+    def remove(self, permission_id: str) -> None:
+        """
+        Drop a deleted permission
+
+        Args:
+            permission_id: Permission ID
+        """
+        permission = self.by_id.pop(str(permission_id), None)
+        if permission is not None:
+            self.by_module.get(self._module(permission), {}).pop(str(permission_id), None)
+
+    def expire(self) -> None:
+        """
+        Fetch the whole catalog again on next use
+        """
+        self.loaded = None
+
+    @property
+    def permissions(self) -> List[Dict[str, Any]]:
+        """
+        Every permission, in the order the API returned them
+        """
+        return list(self.by_id.values())
+
+    def get(self, permission_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a permission by ID
+
+        Args:
+            permission_id: Permission ID
+
+        Returns:
+            The permission, or None if it isn't in the catalog
+        """
+        return self.by_id.get(str(permission_id))
+
+    def grouped(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Group permissions by module
+
+        Returns:
+            Permissions per module name, modules in display order and
+            permissions without a module last
+        """
+        grouped = {module: list(self.by_module[module].values()) for module in self.modules}
+        if self.by_module.get(UNGROUPED_MODULE):
+            grouped[UNGROUPED_MODULE] = list(self.by_module[UNGROUPED_MODULE].values())
+        return grouped
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Get the size and age of the catalog
+
+        Returns:
+            Number of permissions and modules, seconds since loaded
+        """
+        return {
+            "permissions": len(self.by_id),
+            "modules": len(self.modules),
+            "age": round(time.monotonic() - self.loaded, 1) if self.loaded is not None else None,
+        }
+
+
+# Process-wide permission catalog
+permission_catalog = PermissionCatalog(settings.PERMISSION_CATALOG_TTL)
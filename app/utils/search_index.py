@@ -0,0 +1,371 @@
+import asyncio
+import heapq
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from starlette.requests import Request
+
+from app.config import settings
+
+# Words are runs of letters and digits
+_WORD = re.compile(r"\w+")
+
+# Each word is padded at the start so its first trigrams double as a prefix index
+_PADDING = "  "
+
+# Entity kinds in the index: title and subtitle fields, detail page URL and
+# the permission needed to see them
+SEARCH_KINDS = {
+    "users": {
+        "title": ("username",),
+        "subtitle": ("first_name", "last_name", "email"),
+        "url": "/users/{id}",
+        "permission": "view_users",
+    },
+    "companies": {
+        "title": ("name",),
+        "subtitle": ("display_name", "slug", "email"),
+        "url": "/companies/{id}",
+        "permission": "view_companies",
+    },
+    "roles": {
+        "title": ("name",),
+        "subtitle": ("description",),
+        "url": "/roles/{id}",
+        "permission": "view_roles",
+    },
+    "permissions": {
+        "title": ("name",),
+        "subtitle": ("code", "module"),
+        "url": "/permissions/{id}",
+        "permission": "view_permissions",
+    },
+}
+
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+def _trigrams(word: str) -> Set[str]:
+    padded = _PADDING + word
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchDocument:
+    """
+    An entity as shown in the typeahead results
+    """
+
+    __slots__ = ("kind", "id", "title", "subtitle", "url", "words", "text", "sort_title")
+
+    def __init__(self, kind: str, item: Dict[str, Any]):
+        """
+        Build the document from an entity returned by the API
+
+        Args:
+            kind: Entity kind, a key of SEARCH_KINDS
+            item: Entity data
+        """
+        spec = SEARCH_KINDS[kind]
+        self.kind = kind
+        self.id = str(item["id"])
+        self.title = " ".join(str(item[field]) for field in spec["title"] if item.get(field))
+        self.subtitle = " ".join(str(item[field]) for field in spec["subtitle"] if item.get(field))
+        self.url = spec["url"].format(id=self.id)
+        self.words = _words(f"{self.title} {self.subtitle}")
+
+        # Normalized forms for checking and ranking candidates, every word preceded by a space
+        self.text = " " + " ".join(self.words)
+        self.sort_title = self.title.lower()
+
+
+class SearchIndex:
+    """
+    Trigram index over the entities one user can see
+
+    Every word is indexed by its trigrams, padded so that the leading ones
+    also serve prefix queries of one and two characters. A query is answered
+    by intersecting the postings of its trigrams, smallest first, and
+    checking the few remaining candidates.
+    """
+
+    def __init__(self):
+        self.documents: Dict[Tuple[str, str], SearchDocument] = {}
+        self.postings: Dict[str, Set[Tuple[str, str]]] = {}
+        self.loaded: Dict[str, float] = {}
+        self.lock = asyncio.Lock()
+
+    def add(self, kind: str, item: Dict[str, Any]) -> None:
+        """
+        Add an entity, replacing an earlier version of it
+
+        Args:
+            kind: Entity kind
+            item: Entity data as returned by the API
+        """
+        if not isinstance(item, dict) or item.get("id") is None:
+            return
+
+        document = SearchDocument(kind, item)
+        key = (kind, document.id)
+        self.remove(kind, document.id)
+        self.documents[key] = document
+        for word in set(document.words):
+            for trigram in _trigrams(word):
+                self.postings.setdefault(trigram, set()).add(key)
+
+    def remove(self, kind: str, entity_id: str) -> None:
+        """
+        Drop an entity
+
+        Args:
+            kind: Entity kind
+            entity_id: Entity ID
+        """
+        key = (kind, str(entity_id))
+        document = self.documents.pop(key, None)
+        if document is None:
+            return
+
+        for word in set(document.words):
+            for trigram in _trigrams(word):
+                keys = self.postings.get(trigram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.postings[trigram]
+
+    def load(self, kind: str, items: Iterable[Dict[str, Any]]) -> None:
+        """
+        Replace every entity of a kind
+
+        Args:
+            kind: Entity kind
+            items: The full collection from the API
+        """
+        for key in [key for key in self.documents if key[0] == kind]:
+            self.remove(*key)
+        for item in items:
+            self.add(kind, item)
+        self.loaded[kind] = time.monotonic()
+
+    def is_fresh(self, kind: str) -> bool:
+        """
+        Check whether a kind was loaded less than SEARCH_INDEX_TTL seconds ago
+        """
+        loaded = self.loaded.get(kind)
+        return loaded is not None and time.monotonic() - loaded < settings.SEARCH_INDEX_TTL
+
+    def search(self, query: str, kinds: Iterable[str], limit: int = 10) -> List[SearchDocument]:
+        """
+        Find entities matching every word of a query
+
+        Query words match the start of a word in the entity, or any part of
+        it once they are three characters or longer.
+
+        Args:
+            query: Text typed by the user
+            kinds: Entity kinds to include
+            limit: Maximum number of results
+
+        Returns:
+            Best matches first: title prefix, then word prefix, then the rest
+        """
+        words = _words(query)
+        if not words:
+            return []
+
+        kinds = set(kinds)
+        candidates: Optional[Set[Tuple[str, str]]] = None
+        for word in words:
+            # Leading trigrams only match word starts, the rest match anywhere in a word
+            trigrams = _trigrams(word) if len(word) < 3 else {word[i:i + 3] for i in range(len(word) - 2)}
+            for trigram in sorted(trigrams, key=lambda t: len(self.postings.get(t, ()))):
+                keys = self.postings.get(trigram)
+                if not keys:
+                    return []
+                candidates = set(keys) if candidates is None else candidates & keys
+                if not candidates:
+                    return []
+
+        # Trigrams can come from different words, check the candidates against the query
+        prefixes = [" " + word for word in words]
+        required = [prefix if len(word) < 3 else word for prefix, word in zip(prefixes, words)]
+        title_prefix = " ".join(words)
+
+        results = []
+        for key in candidates:
+            if key[0] not in kinds:
+                continue
+            document = self.documents[key]
+            text = document.text
+            if not all(part in text for part in required):
+                continue
+
+            if document.sort_title.startswith(title_prefix):
+                rank = 0
+            elif all(prefix in text for prefix in prefixes):
+                rank = 1
+            else:
+                rank = 2
+            results.append((rank, len(document.sort_title), document.sort_title, key))
+
+        return [self.documents[result[3]] for result in heapq.nsmallest(limit, results)]
+
+
+class SearchIndexes:
+    """
+    Search indexes per user, least recently used dropped first
+
+    Users can see different entities, so each gets their own index, built
+    from their own API calls. Writes made through the API clients update
+    every index straight away. Changes made elsewhere show up once a kind
+    is older than SEARCH_INDEX_TTL and is loaded again.
+    """
+
+    def __init__(self, max_users: int):
+        """
+        Initialize an empty set of indexes
+
+        Args:
+            max_users: Maximum number of users with an index in memory
+        """
+        self.max_users = max_users
+        self.indexes: "OrderedDict[str, SearchIndex]" = OrderedDict()
+
+    def get(self, request: Request) -> Optional[SearchIndex]:
+        """
+        Get the current user's index, creating an empty one if needed
+
+        Args:
+            request: The current request
+
+        Returns:
+            The index, or None for anonymous requests
+        """
+        if "user" not in request.scope or not request.user.is_authenticated:
+            return None
+
+        identity = request.user.identity
+        index = self.indexes.get(identity)
+        if index is None:
+            index = self.indexes[identity] = SearchIndex()
+            while len(self.indexes) > self.max_users:
+                self.indexes.popitem(last=False)
+        self.indexes.move_to_end(identity)
+        return index
+
+    async def ensure_loaded(self, request: Request, loaders: Dict[str, Callable[[], Awaitable[List]]]) -> Optional[SearchIndex]:
+        """
+        Load the kinds that are missing or stale in the current user's index
+
+        Kinds are fetched concurrently. A kind that fails to load (e.g. the
+        backend refuses it) is left out until the next attempt.
+
+        Args:
+            request: The current request
+            loaders: Functions fetching the full collection, by kind
+
+        Returns:
+            The index, or None for anonymous requests
+        """
+        index = self.get(request)
+        if index is None:
+            return None
+
+        async with index.lock:
+            stale = [kind for kind in loaders if not index.is_fresh(kind)]
+            if stale:
+                results = await asyncio.gather(*(loaders[kind]() for kind in stale), return_exceptions=True)
+                for kind, items in zip(stale, results):
+                    if isinstance(items, Exception):
+                        print(f"Error loading {kind} into the search index: {items}")
+                    else:
+                        index.load(kind, items or [])
+
+        return index
+
+    def upsert(self, kind: str, item: Any, request: Optional[Request] = None) -> None:
+        """
+        Apply a created or updated entity to the indexes
+
+        The entity is updated in every index that has it, and added to the
+        index of the user who made the change.
+
+        Args:
+            kind: Entity kind
+            item: Entity as returned by the API
+            request: Request that made the change
+        """
+        if not isinstance(item, dict) or item.get("id") is None:
+            # The API didn't return the entity, fetch the kind again next time
+            self.expire(kind)
+            return
+
+        key = (kind, str(item["id"]))
+        own = self.indexes.get(request.user.identity) if request is not None and "user" in request.scope else None
+        for index in self.indexes.values():
+            if key in index.documents or (index is own and kind in index.loaded):
+                index.add(kind, item)
+
+    def remove(self, kind: str, entity_id: str) -> None:
+        """
+        Drop a deleted entity from every index
+
+        Args:
+            kind: Entity kind
+            entity_id: Entity ID
+        """
+        for index in self.indexes.values():
+            index.remove(kind, entity_id)
+
+    def expire(self, kind: str) -> None:
+        """
+        Make every index fetch a kind again on its next search
+
+        Args:
+            kind: Entity kind
+        """
+        for index in self.indexes.values():
+            index.loaded.pop(kind, None)
+
+    def expire_path(self, path: str) -> None:
+        """
+        Expire the kind an API path belongs to, for writes made without a typed client
+
+        Args:
+            path: API endpoint path, e.g. "/users/42"
+        """
+        kind = path.strip("/").split("/")[0]
+        if kind in SEARCH_KINDS:
+            self.expire(kind)
+
+    def forget(self, identity: str) -> None:
+        """
+        Drop a user's index, e.g. when they log out
+
+        Args:
+            identity: User identity
+        """
+        self.indexes.pop(identity, None)
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Get the size of the indexes
+
+        Returns:
+            Number of users with an index, documents and trigrams across them
+        """
+        return {
+            "users": len(self.indexes),
+            "max_users": self.max_users,
+            "documents": sum(len(index.documents) for index in self.indexes.values()),
+            "trigrams": sum(len(index.postings) for index in self.indexes.values()),
+        }
+
+
+# Process-wide search indexes
+search_indexes = SearchIndexes(settings.SEARCH_INDEX_USERS)
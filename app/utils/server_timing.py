@@ -0,0 +1,122 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.templating import Jinja2Templates
+
+from app.config import settings
+
+# Scope key used to share the collector between middleware, API clients and templates
+SCOPE_KEY = "server_timing"
+
+# Session key holding the per-user Server-Timing toggle
+SESSION_KEY = "server_timing"
+
+
+class ServerTiming:
+    """
+    Per-request collector of timings reported in the Server-Timing header
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty collector and start the request clock
+        """
+        self.started = time.perf_counter()
+        self.last_mark = self.started
+        self.stages: List[Tuple[str, float]] = []
+        self.metrics: Dict[str, Dict[str, float]] = {}
+
+    def mark(self, stage: str) -> None:
+        """
+        Record the time spent since the previous mark under a middleware stage name
+
+        Args:
+            stage: Middleware stage name
+        """
+        now = time.perf_counter()
+        self.stages.append((stage, (now - self.last_mark) * 1000))
+        self.last_mark = now
+
+    def record(self, name: str, duration: float, description: Optional[str] = None) -> None:
+        """
+        Add a duration to an aggregated metric
+
+        Args:
+            name: Metric name (must be a valid header token)
+            duration: Duration in seconds
+            description: Optional human readable description
+        """
+        metric = self.metrics.setdefault(name, {"count": 0, "total": 0.0, "desc": description})
+        metric["count"] += 1
+        metric["total"] += duration * 1000
+
+    def header_value(self) -> str:
+        """
+        Build the Server-Timing header value
+
+        Returns:
+            Comma separated list of metrics
+        """
+        entries = [f"mw-{stage};dur={duration:.2f}" for stage, duration in self.stages]
+
+        for name, metric in self.metrics.items():
+            desc = metric["desc"] or name
+            if metric["count"] > 1:
+                desc = f"{desc} x{metric['count']}"
+            entries.append(f'{name};desc="{desc}";dur={metric["total"]:.2f}')
+
+        total = (time.perf_counter() - self.started) * 1000
+        entries.append(f"total;dur={total:.2f}")
+
+        return ", ".join(entries)
+
+
+def get_server_timing(scope) -> Optional[ServerTiming]:
+    """
+    Get the timing collector for the current request, if any
+
+    Args:
+        scope: ASGI scope or request object
+
+    Returns:
+        ServerTiming instance or None when timing isn't active
+    """
+    if isinstance(scope, Request):
+        scope = scope.scope
+    return scope.get(SCOPE_KEY)
+
+
+def server_timing_enabled(request: Request) -> bool:
+    """
+    Check whether the Server-Timing header should be sent for this request
+
+    The header is on by default in DEBUG, and users can switch it on or off
+    for their own session in any environment.
+
+    Args:
+        request: The current request
+
+    Returns:
+        True if the header should be sent
+    """
+    if "session" in request.scope and SESSION_KEY in request.session:
+        return bool(request.session[SESSION_KEY])
+    return settings.SERVER_TIMING
+
+
+class TimedJinja2Templates(Jinja2Templates):
+    """
+    Jinja2Templates that reports template render time to Server-Timing
+    """
+
+    def TemplateResponse(self, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().TemplateResponse(*args, **kwargs)
+
+        request = response.context.get("request")
+        timing = get_server_timing(request) if request is not None else None
+        if timing:
+            timing.record("jinja", time.perf_counter() - start, response.template.name)
+
+        return response
@@ -0,0 +1,138 @@
+"""
+Template engine cold-start and first-render benchmark
+
+Compares the legacy setup (one Jinja2Templates per route module, no bytecode
+cache, templates compiled lazily on first render) with the shared engine in
+app.templating (one environment, bytecode cache on disk, precompiled at startup).
+
+Every measurement runs in a fresh interpreter so compile caches don't leak
+between runs.
+
+Usage:
+    python benchmarks/bench_templates.py [--runs 5]
+"""
+import argparse
+import json
+import statistics
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+
+# Pages rendered on the first requests after a deploy, grouped by the route
+# module that used to own a separate Jinja2Templates instance
+PAGES = {
+    "auth": ["auth/login.html", "auth/forgot_password.html"],
+    "dashboard": ["dashboard/index.html"],
+    "companies": ["companies/list.html", "companies/create.html"],
+    "roles": ["roles/list.html", "roles/create.html"],
+    "permissions": ["permissions/list.html", "permissions/create.html"],
+}
+
+WORKER = r"""
+import json, sys, time
+sys.path.insert(0, {base!r})
+mode = {mode!r}
+pages = {pages!r}
+
+from starlette.routing import Mount, Router
+from starlette.requests import Request
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
+import app.config
+
+t0 = time.perf_counter()
+if mode == "legacy":
+    engines = {{m: Jinja2Templates(directory={base!r} + "/templates") for m in pages}}
+    for e in engines.values():
+        e.env.globals.update({{"app_name": "Bench", "app_version": "0"}})
+else:
+    from app.templating import templates, precompile_templates
+    precompile_templates()
+    engines = {{m: templates for m in pages}}
+startup = time.perf_counter() - t0
+
+router = Router([Mount("/static", app=StaticFiles(directory={base!r} + "/static", check_dir=False), name="static")])
+scope = {{"type": "http", "method": "GET", "path": "/", "query_string": b"", "headers": [],
+          "router": router, "session": {{}}, "server": ("bench", 80), "scheme": "http", "root_path": ""}}
+request = Request(scope)
+context = {{"request": request, "messages": [], "companies": [], "roles": [], "permissions": [],
+           "modules": [], "permissions_by_module": {{}}, "sites": [],
+           "sales_summary": {{"today": {{"total": 0, "change": 0}}, "active_orders": 0, "reservations": 0}}}}
+
+t1 = time.perf_counter()
+for module, names in pages.items():
+    for name in names:
+        engines[module].get_template(name).render(context)
+first_render = time.perf_counter() - t1
+
+t2 = time.perf_counter()
+for module, names in pages.items():
+    for name in names:
+        engines[module].get_template(name).render(context)
+warm_render = time.perf_counter() - t2
+
+print(json.dumps({{"startup": startup, "first_render": first_render, "warm_render": warm_render}}))
+"""
+
+
+def run(mode: str, cache_dir: str = None) -> dict:
+    """
+    Run one measurement in a fresh interpreter
+
+    Args:
+        mode: "legacy" or "shared"
+        cache_dir: Bytecode cache directory for the shared engine
+
+    Returns:
+        Timings in seconds
+    """
+    env = dict(os.environ)
+    if cache_dir:
+        env["TEMPLATE_CACHE_DIR"] = cache_dir
+
+    code = WORKER.format(base=str(BASE_DIR), mode=mode, pages=PAGES)
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=BASE_DIR, env=env)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def run_cold() -> dict:
+    """
+    Run the shared engine against an empty bytecode cache
+
+    Returns:
+        Timings in seconds
+    """
+    with tempfile.TemporaryDirectory() as cache_dir:
+        return run("shared", cache_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as warm_cache:
+        # Populate the bytecode cache once, like the first boot after a deploy
+        run("shared", warm_cache)
+
+        scenarios = {
+            "legacy": lambda: run("legacy"),
+            # First boot: empty bytecode cache, every template compiled at startup
+            "shared-cold": run_cold,
+            # Later boots: templates loaded from the bytecode cache
+            "shared-warm": lambda: run("shared", warm_cache),
+        }
+
+        print(f"{'scenario':<12} {'startup ms':>12} {'first render ms':>16} {'warm render ms':>15}")
+        for name, scenario in scenarios.items():
+            results = [scenario() for _ in range(args.runs)]
+            row = {key: statistics.median(r[key] for r in results) * 1000 for key in results[0]}
+            print(f"{name:<12} {row['startup']:>12.1f} {row['first_render']:>16.1f} {row['warm_render']:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
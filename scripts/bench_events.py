@@ -0,0 +1,261 @@
+"""
+Live events benchmark
+
+Starts one uvicorn worker serving the event hub's SSE stream, opens
+thousands of idle connections to it, then publishes events and measures
+how long the fan-out takes to reach every client. Reports the worker's
+memory per connection and its CPU use while the connections sit idle
+(heartbeats only).
+
+The worker serves a bare stream on a single channel, without the
+session, authentication and backend checks of /events/, so the numbers
+are for the hub and the SSE encoding alone.
+
+Usage:
+    python scripts/bench_events.py [--connections 5000] [--events 20] [--idle 10]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# Channel every benchmark client follows
+CHANNEL = "site:bench"
+
+
+def bench_app():
+    """
+    Build the worker app: the SSE stream plus an endpoint to publish events
+
+    Returns:
+        Starlette application
+    """
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Route
+
+    from app.utils.event_hub import event_hub
+
+    async def stream(request: Request):
+        async def body():
+            subscription = event_hub.subscribe([CHANNEL], request.headers.get("last-event-id"))
+            try:
+                async for chunk in event_hub.stream(subscription):
+                    yield chunk
+            finally:
+                event_hub.unsubscribe(subscription)
+
+        return StreamingResponse(body(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    async def publish(request: Request):
+        event = event_hub.publish(CHANNEL, "bench", {"sent": time.time()})
+        return JSONResponse({"id": event.id})
+
+    async def report(request: Request):
+        return JSONResponse(event_hub.report())
+
+    return Starlette(routes=[
+        Route("/events", stream),
+        Route("/publish", publish, methods=["POST"]),
+        Route("/report", report),
+    ])
+
+
+def raise_file_limit() -> int:
+    """
+    Allow as many open sockets as the hard limit permits
+
+    Returns:
+        The new soft limit
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def process_stats(pid: int):
+    """
+    Get resident memory (bytes) and CPU time (seconds) of a process
+
+    Args:
+        pid: Process ID
+
+    Returns:
+        Tuple of RSS and user + system CPU time
+    """
+    with open(f"/proc/{pid}/statm") as f:
+        rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return rss, cpu
+
+
+async def request(port: int, method: str, path: str) -> bytes:
+    """
+    Make a one-off HTTP request to the worker
+
+    Args:
+        port: Worker port
+        method: HTTP method
+        path: Request path
+
+    Returns:
+        Response body
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response.split(b"\r\n\r\n", 1)[1]
+
+
+class Client:
+    """
+    An idle SSE connection that notes when each benchmark event arrives
+    """
+
+    def __init__(self):
+        self.received = {}
+        self.writer = None
+
+    async def connect(self, port: int) -> None:
+        reader, self.writer = await asyncio.open_connection("127.0.0.1", port)
+        self.writer.write(b"GET /events HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n")
+        await self.writer.drain()
+        # Headers, then the retry line sent as soon as the stream starts
+        await reader.readuntil(b"\r\n\r\n")
+        self.reader = reader
+
+    async def listen(self) -> None:
+        event_id = None
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                return
+            # Chunked encoding size lines and heartbeats are skipped
+            if line.startswith(b"id: "):
+                event_id = line[4:].strip().decode()
+            elif line.startswith(b"data: ") and event_id:
+                self.received[event_id] = time.perf_counter()
+                event_id = None
+
+
+async def run(args) -> None:
+    limit = raise_file_limit()
+    if args.connections + 100 > limit:
+        print(f"Warning: open file limit is {limit}, connections may fail")
+
+    env = {**os.environ, "EVENTS_HEARTBEAT": str(args.heartbeat), "EVENTS_CLIENT_BUFFER": "1000"}
+    worker = subprocess.Popen(
+        [sys.executable, __file__, "--serve", "--port", str(args.port)],
+        env=env,
+    )
+    try:
+        # Wait for the worker to listen
+        for _ in range(100):
+            try:
+                await request(args.port, "GET", "/report")
+                break
+            except OSError:
+                await asyncio.sleep(0.1)
+        base_rss, _ = process_stats(worker.pid)
+
+        start = time.perf_counter()
+        clients = [Client() for _ in range(args.connections)]
+        for offset in range(0, len(clients), 500):
+            await asyncio.gather(*(client.connect(args.port) for client in clients[offset:offset + 500]))
+        connect_time = time.perf_counter() - start
+        listeners = [asyncio.create_task(client.listen()) for client in clients]
+
+        # Let the connections sit idle through a few heartbeats
+        rss, cpu_before = process_stats(worker.pid)
+        await asyncio.sleep(args.idle)
+        _, cpu_after = process_stats(worker.pid)
+
+        latencies = []
+        for _ in range(args.events):
+            sent = time.perf_counter()
+            event_id = json.loads(await request(args.port, "POST", "/publish"))["id"]
+            await wait_for_event(clients, event_id)
+            arrivals = [client.received[event_id] - sent for client in clients if event_id in client.received]
+            latencies.append((max(arrivals), len(arrivals)))
+            await asyncio.sleep(args.pause)
+
+        report = (await request(args.port, "GET", "/report")).decode()
+
+        print(f"connections:         {args.connections} (opened in {connect_time:.2f}s)")
+        print(f"worker memory:       {base_rss / 2**20:.1f} MiB idle, {rss / 2**20:.1f} MiB connected, "
+              f"{(rss - base_rss) / args.connections / 1024:.1f} KiB per connection")
+        print(f"idle CPU:            {(cpu_after - cpu_before) / args.idle * 100:.1f}% "
+              f"over {args.idle:.0f}s with a {args.heartbeat}s heartbeat")
+        full = [latency for latency, count in latencies if count == args.connections]
+        print(f"events:              {args.events}, {len(full)} reached every client")
+        if full:
+            print(f"fan-out to all (ms): median {statistics.median(full) * 1000:.1f}, "
+                  f"max {max(full) * 1000:.1f}")
+        print(f"hub:                 {report}")
+
+        for listener in listeners:
+            listener.cancel()
+        for client in clients:
+            client.writer.close()
+    finally:
+        worker.terminate()
+        try:
+            worker.wait(5)
+        except subprocess.TimeoutExpired:
+            worker.kill()
+
+
+async def wait_for_event(clients, event_id: str, timeout: float = 10.0) -> None:
+    """
+    Wait until every client has received an event, or the timeout passes
+
+    Args:
+        clients: Benchmark clients
+        event_id: ID of the published event
+        timeout: Seconds to wait
+    """
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if all(event_id in client.received for client in clients):
+            return
+        await asyncio.sleep(0.005)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark idle SSE connections and event fan-out")
+    parser.add_argument("--connections", type=int, default=5000, help="idle clients to open")
+    parser.add_argument("--events", type=int, default=20, help="events to publish")
+    parser.add_argument("--idle", type=float, default=10, help="seconds to hold the connections idle")
+    parser.add_argument("--heartbeat", type=int, default=5, help="seconds between heartbeats")
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds between events")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        import uvicorn
+
+        raise_file_limit()
+        uvicorn.run(bench_app(), host="127.0.0.1", port=args.port, log_level="warning", backlog=4096,
+                    timeout_graceful_shutdown=1)
+        return
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Static asset build
+
+Fetches the vendored third-party assets (Bootstrap, Bootstrap Icons, HTMX)
+into static/vendor, minifies our own CSS and JavaScript, and writes every
+asset to static/dist under a content-hashed name, with .br and .gz
+variants of text files for the static server. static/dist/manifest.json
+maps source paths to the fingerprinted ones; url_for('static', ...) in
+templates resolves through it.
+
+Usage:
+    python scripts/build_assets.py [--refresh-vendor] [--allow-unpinned]
+"""
+import argparse
+import base64
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import sys
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import settings  # noqa: E402
+from app.utils.assets import DIST_DIR, MANIFEST_PATH, STATIC_DIR, VARIANT_SUFFIXES, VENDOR_ASSETS  # noqa: E402
+from app.utils.compression import COMPRESSIBLE_TYPES, compress, supported_encodings  # noqa: E402
+
+# Length of the content hash added to file names
+HASH_LENGTH = 10
+
+# url(...) references inside stylesheets
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def integrity_hash(content: bytes) -> str:
+    """
+    Subresource integrity value of a file, as pinned in VENDOR_ASSETS
+    """
+    return "sha384-" + base64.b64encode(hashlib.sha384(content).digest()).decode()
+
+
+def fetch_vendor(refresh: bool = False, allow_unpinned: bool = False) -> None:
+    """
+    Download vendored assets that aren't in static/vendor yet
+
+    Downloads are checked against their pinned integrity hash and nothing
+    is written if one doesn't match.
+
+    Args:
+        refresh: Download every asset again
+        allow_unpinned: Also download assets without a pinned hash, printing the hash to pin
+    """
+    with httpx.Client(timeout=30.0, follow_redirects=True) as client:
+        for path, (url, integrity) in VENDOR_ASSETS.items():
+            target = STATIC_DIR / path
+            if target.exists() and not refresh:
+                continue
+            if integrity is None and not allow_unpinned:
+                raise SystemExit(f"No integrity hash pinned for {path}, pin one in VENDOR_ASSETS "
+                                 f"or run with --allow-unpinned")
+
+            print(f"Fetching {url}")
+            response = client.get(url)
+            response.raise_for_status()
+            actual = integrity_hash(response.content)
+            if integrity is None:
+                print(f"  not pinned, its integrity hash is {actual}")
+            elif actual != integrity:
+                raise SystemExit(f"Integrity check failed for {url}: expected {integrity}, got {actual}")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(response.content)
+
+
+def minify_css(source: str) -> str:
+    """
+    Strip comments and redundant whitespace from a stylesheet
+    """
+    source = re.sub(r"/\*.*?\*/", "", source, flags=re.S)
+    source = re.sub(r"\s+", " ", source)
+    source = re.sub(r"\s*([{};,>])\s*", r"\1", source)
+    return source.replace(";}", "}").strip()
+
+
+def minify_js(source: str) -> str:
+    """
+    Strip comment lines, indentation and blank lines from a script
+
+    Deliberately conservative: statements and string contents are left alone.
+    """
+    lines = []
+    for line in source.splitlines():
+        line = line.strip()
+        if line and not line.startswith("//"):
+            lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def fingerprint(path: str, content: bytes) -> str:
+    """
+    Build the content-hashed output path for an asset
+
+    Args:
+        path: Source path relative to static/
+        content: Final file content
+
+    Returns:
+        Output path relative to static/, e.g. "dist/css/main.3f2a1b9c0d.css"
+    """
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    directory, name = posixpath.split(path)
+    stem, dot, ext = name.partition(".")
+    return posixpath.join("dist", directory, f"{stem}.{digest}{dot}{ext}")
+
+
+def rewrite_css_urls(path: str, source: str, manifest: dict) -> str:
+    """
+    Point url(...) references in a stylesheet at the fingerprinted files
+
+    Args:
+        path: Source path of the stylesheet relative to static/
+        source: Stylesheet content
+        manifest: Fingerprinted paths of the assets processed so far
+    """
+    base = posixpath.dirname(path)
+
+    def replace(match):
+        url = match.group(2)
+        if url.startswith(("data:", "http:", "https:", "//", "#")):
+            return match.group(0)
+
+        # Fingerprinted names replace the cache-busting query strings
+        target = posixpath.normpath(posixpath.join(base, url.split("?")[0].split("#")[0]))
+        if target not in manifest:
+            return match.group(0)
+
+        output_dir = posixpath.dirname(posixpath.join("dist", path))
+        return f'url("{posixpath.relpath(manifest[target], output_dir)}")'
+
+    return CSS_URL.sub(replace, source)
+
+
+def write_variants(target: Path, content: bytes) -> None:
+    """
+    Write brotli and gzip variants next to a text asset for the static server
+
+    Args:
+        target: Output file
+        content: Its content
+    """
+    content_type, _ = mimetypes.guess_type(target.name)
+    if not (content_type or "").startswith(COMPRESSIBLE_TYPES) or len(content) < settings.COMPRESSION_MIN_SIZE:
+        return
+
+    for encoding in supported_encodings():
+        variant = compress(content, encoding, static=True)
+        if len(variant) < len(content):
+            target.with_name(target.name + VARIANT_SUFFIXES[encoding]).write_bytes(variant)
+
+
+def build() -> dict:
+    """
+    Write fingerprinted copies of every static asset and the manifest
+
+    Returns:
+        The manifest
+    """
+    if DIST_DIR.exists():
+        shutil.rmtree(DIST_DIR)
+
+    sources = sorted(
+        path.relative_to(STATIC_DIR).as_posix()
+        for path in STATIC_DIR.rglob("*")
+        if path.is_file() and not path.is_relative_to(DIST_DIR)
+    )
+
+    # Stylesheets go last so they can reference the fingerprinted fonts and images
+    sources.sort(key=lambda path: path.endswith(".css"))
+
+    manifest = {}
+    for path in sources:
+        content = (STATIC_DIR / path).read_bytes()
+        minified = ".min." in path
+
+        if path.endswith(".css"):
+            text = content.decode()
+            text = text if minified else minify_css(text)
+            content = rewrite_css_urls(path, text, manifest).encode()
+        elif path.endswith(".js") and not minified:
+            content = minify_js(content.decode()).encode()
+
+        output = fingerprint(path, content)
+        target = STATIC_DIR / output
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(content)
+        write_variants(target, content)
+        manifest[path] = output
+
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--refresh-vendor", action="store_true", help="download vendored assets again")
+    parser.add_argument("--allow-unpinned", action="store_true",
+                        help="download vendored assets without a pinned integrity hash")
+    args = parser.parse_args()
+
+    fetch_vendor(refresh=args.refresh_vendor, allow_unpinned=args.allow_unpinned)
+    manifest = build()
+
+    for path, output in manifest.items():
+        size = os.path.getsize(STATIC_DIR / output)
+        print(f"{path:<55} -> {output} ({size} bytes)")
+
+
+if __name__ == "__main__":
+    main()
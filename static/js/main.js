@@ -1,22 +1,19 @@
 /* Main JavaScript for the Restaurant Manager web app */
 
-// Initialize Bootstrap tooltips and popovers
-document.addEventListener('DOMContentLoaded', function() {
+// Initialize Bootstrap components and form validation within a container
+function initComponents(root) {
     // Initialize tooltips
-    const tooltipTriggerList = document.querySelectorAll('[data-bs-toggle="tooltip"]');
-    const tooltipList = [...tooltipTriggerList].map(tooltipTriggerEl =>
+    root.querySelectorAll('[data-bs-toggle="tooltip"]').forEach(tooltipTriggerEl =>
         new bootstrap.Tooltip(tooltipTriggerEl)
     );
 
     // Initialize popovers
-    const popoverTriggerList = document.querySelectorAll('[data-bs-toggle="popover"]');
-    const popoverList = [...popoverTriggerList].map(popoverTriggerEl =>
+    root.querySelectorAll('[data-bs-toggle="popover"]').forEach(popoverTriggerEl =>
         new bootstrap.Popover(popoverTriggerEl)
     );
 
     // Auto-dismiss alerts after 5 seconds
-    const autoAlerts = document.querySelectorAll('.alert.auto-dismiss');
-    autoAlerts.forEach(alert => {
+    root.querySelectorAll('.alert.auto-dismiss').forEach(alert => {
         setTimeout(() => {
             const bsAlert = new bootstrap.Alert(alert);
             bsAlert.close();
@@ -24,8 +21,7 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 
     // Form validation
-    const forms = document.querySelectorAll('.needs-validation');
-    Array.from(forms).forEach(form => {
+    root.querySelectorAll('.needs-validation').forEach(form => {
         form.addEventListener('submit', event => {
             if (!form.checkValidity()) {
                 event.preventDefault();
@@ -34,8 +30,75 @@ document.addEventListener('DOMContentLoaded', function() {
             form.classList.add('was-validated');
         }, false);
     });
+}
+
+// Highlight the sidebar link for the current page (boosted navigation doesn't re-render the sidebar)
+function updateActiveNavLink() {
+    const path = window.location.pathname;
+    document.querySelectorAll('#sidebar .nav-link[href]').forEach(link => {
+        const href = link.getAttribute('href');
+        const active = href === '/dashboard' ? path === '/dashboard' : path.includes(href);
+        link.classList.toggle('active', active);
+    });
+}
+
+// Drop signed flash messages (already shown) from the address bar
+function stripFlashParam() {
+    const url = new URL(window.location.href);
+    if (url.searchParams.has('_flash')) {
+        url.searchParams.delete('_flash');
+        window.history.replaceState(window.history.state, '', url);
+    }
+}
+
+// Initialize Bootstrap tooltips and popovers
+document.addEventListener('DOMContentLoaded', function() {
+    stripFlashParam();
+    initComponents(document);
+});
+
+// Re-initialize content swapped in by htmx (boosted navigation and partial renders)
+document.addEventListener('htmx:afterSwap', function(event) {
+    initComponents(event.detail.target);
+    updateActiveNavLink();
+});
+document.addEventListener('htmx:historyRestore', updateActiveNavLink);
+
+// Bulk actions on list pages (see bulk_form in templates/components/list_controls.html)
+// Row checkboxes belong to the bulk form through their form attribute
+function updateBulkForm(formId) {
+    const form = document.getElementById(formId);
+    if (!form) {
+        return;
+    }
+    const boxes = Array.from(document.querySelectorAll(`input[name="ids"][form="${formId}"]`));
+    const checked = boxes.filter(cb => cb.checked).length;
+    form.querySelector('[data-bulk-submit]').disabled = checked === 0;
+    form.querySelector('[data-bulk-count]').textContent = checked ? `${checked} selected` : '';
+    document.querySelectorAll(`[data-bulk-all="${formId}"]`).forEach(all => {
+        all.checked = boxes.length > 0 && checked === boxes.length;
+        all.indeterminate = checked > 0 && checked < boxes.length;
+    });
+}
+
+document.addEventListener('change', event => {
+    const checkbox = event.target;
+    if (checkbox.dataset.bulkAll) {
+        document.querySelectorAll(`input[name="ids"][form="${checkbox.dataset.bulkAll}"]`)
+            .forEach(cb => { cb.checked = checkbox.checked; });
+        updateBulkForm(checkbox.dataset.bulkAll);
+    } else if (checkbox.name === 'ids' && checkbox.getAttribute('form')) {
+        updateBulkForm(checkbox.getAttribute('form'));
+    }
 });
 
+// Rows a bulk action failed for come back selected
+function initBulkForms() {
+    document.querySelectorAll('[data-bulk-all]').forEach(all => updateBulkForm(all.dataset.bulkAll));
+}
+document.addEventListener('DOMContentLoaded', initBulkForms);
+document.addEventListener('htmx:afterSettle', initBulkForms);
+
 // Toggle sidebar function
 function toggleSidebar() {
     const sidebar = document.getElementById('sidebar');
@@ -70,4 +133,94 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
     });
-});
\ No newline at end of file
+});
+// Live events (Server-Sent Events), one connection per tab
+// The last element with data-events-url decides which company and site to follow
+let liveEvents = null;
+
+function connectLiveEvents() {
+    const sources = document.querySelectorAll('[data-events-url]');
+    const url = sources.length ? sources[sources.length - 1].dataset.eventsUrl : null;
+    if (liveEvents && url && liveEvents.url === new URL(url, window.location.href).href) {
+        return;
+    }
+    if (liveEvents) {
+        liveEvents.close();
+        liveEvents = null;
+    }
+    if (!url || !window.EventSource) {
+        return;
+    }
+
+    // The browser reconnects on its own and sends Last-Event-ID to catch up
+    liveEvents = new EventSource(url);
+    liveEvents.addEventListener('notification', event => showNotification(event, true));
+    liveEvents.addEventListener('recent-notification', event => showNotification(event, false));
+    liveEvents.addEventListener('widget', event => refreshWidget(JSON.parse(event.data).name));
+    liveEvents.addEventListener('reset', () => {
+        // Too many events were missed to replay, reload what they would have updated
+        document.querySelectorAll('[data-widget]').forEach(widget => refreshWidget(widget.dataset.widget));
+    });
+}
+
+// Reload a dashboard widget (see hx-trigger in templates/dashboard/index.html)
+function refreshWidget(name) {
+    if (name) {
+        document.body.dispatchEvent(new CustomEvent('live:' + name));
+    }
+}
+
+// Event IDs of the notifications in the menu; reconnecting sends the recent ones again
+const shownNotifications = new Set();
+
+function showNotification(event, unread) {
+    if (event.lastEventId) {
+        if (shownNotifications.has(event.lastEventId)) {
+            return;
+        }
+        shownNotifications.add(event.lastEventId);
+    }
+    addNotification(JSON.parse(event.data), unread);
+}
+
+// Prepend a notification to the navbar menu, bumping the unread count for new ones
+function addNotification(notification, unread = true) {
+    const list = document.getElementById('notifications-list');
+    const count = document.getElementById('notifications-count');
+    if (!list || !count) {
+        return;
+    }
+
+    const item = document.createElement('a');
+    item.className = 'dropdown-item p-3 border-bottom';
+    item.href = notification.url || '#';
+    item.innerHTML = `
+        <div class="d-flex align-items-center">
+            <div class="flex-shrink-0">
+                <div class="bg-opacity-10 rounded p-2"><i class="bi"></i></div>
+            </div>
+            <div class="flex-grow-1 ms-3">
+                <h6 class="mb-0 fs-6"></h6>
+                <p class="text-muted small mb-0"></p>
+            </div>
+        </div>`;
+    const level = notification.level || 'primary';
+    item.querySelector('.rounded').classList.add('bg-' + level, 'text-' + level);
+    item.querySelector('.bi').classList.add('bi-' + (notification.icon || 'bell'));
+    item.querySelector('h6').textContent = notification.title || '';
+    item.querySelector('p').textContent = notification.text || '';
+
+    list.querySelector('.notifications-empty')?.remove();
+    list.prepend(item);
+    if (!unread) {
+        return;
+    }
+
+    const total = parseInt(count.dataset.unread || '0', 10) + 1;
+    count.dataset.unread = total;
+    count.firstChild.textContent = total + ' ';
+    count.classList.remove('d-none');
+}
+
+document.addEventListener('DOMContentLoaded', connectLiveEvents);
+document.addEventListener('htmx:afterSettle', connectLiveEvents);